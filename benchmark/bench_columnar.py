@@ -0,0 +1,74 @@
+'''对比逐行解析 json 与列式存储(mmap)读取全部记录、只读取标题的耗时
+
+用法: python benchmark/bench_columnar.py [--data_dir datasets] [--repeat 3]
+'''
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+from columnar_store import ColumnarStore, load_json, migrate
+
+
+def json_files(data_dir):
+    for root, _, names in os.walk(data_dir):
+        for name in sorted(names):
+            if name.startswith('paper_') and name.endswith('.json'):
+                yield os.path.join(root, name)
+
+
+def read_json(files, columns=None):
+    count = 0
+    for path in files:
+        for item in load_json(path):
+            if columns is not None:
+                item = {key: item[key] for key in columns}
+            count += 1
+    return count
+
+
+def read_store(store, columns=None):
+    count = 0
+    for item in store.scan(columns or ('datadate', 'arxiv_id', 'url', 'title', 'submitdate', 'authors', 'abstract')):
+        count += 1
+    return count
+
+
+def best_of(repeat, fn, *args):
+    costs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        costs.append(time.perf_counter() - start)
+    return min(costs), result
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--data_dir', default=os.path.join(BASE_DIR, 'datasets'))
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    files = list(json_files(args.data_dir))
+    store_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        store = ColumnarStore(store_dir)
+        migrate(store, args.data_dir)
+        print(f"migrate {len(files)} days: {time.perf_counter()-start:.2f}s")
+
+        for columns in (None, ('arxiv_id', 'title')):
+            name = 'all columns' if columns is None else ','.join(columns)
+            json_cost, json_count = best_of(args.repeat, read_json, files, columns)
+            store_cost, store_count = best_of(args.repeat, read_store, store, columns)
+            assert json_count == store_count, (json_count, store_count)
+            print(f"{name:16s} records: {json_count}  json: {json_cost:.3f}s  columnar: {store_cost:.3f}s  "
+                  f"speedup: {json_cost/store_cost:.1f}x")
+        store.close()
+    finally:
+        shutil.rmtree(store_dir)
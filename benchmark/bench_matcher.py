@@ -0,0 +1,103 @@
+'''对比 KeywordMatcher 与原有 filter_words/类别关键词子串循环(loop_match)的耗时
+
+用法: python benchmark/bench_matcher.py [--data_dir datasets] [--repeat 3] [--extra_words 0]
+--extra_words 会为每个类别追加随机关键词，用于模拟几百个关键词的分类体系
+'''
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+from keyword_matcher import KeywordMatcher
+
+FILTER_WORDS = ['LLM', 'large language model']
+CATEGORY_WORDS = {
+    'Survey': ['survey'],
+    'Benchmark': ['benchmark'],
+    'Accelerate': ['Accelerate', 'Decoding', 'Efficient', 'Accelerating', 'KV cache'],
+    'In-Context Learning': ['In-Context Learning', 'Memory Learning'],
+    'Reasoning': ['Reasoning'],
+    'ToolUse': ['tool', 'api'],
+    'Retrieval-Augmented': ['Retrieval', 'Retriever', 'RAG'],
+    'Agent': ['Agent']
+}
+
+
+def loop_match(records, filter_words, category_words):
+    results = []
+    for item in records:
+        title_abstract = item['title'].lower() + '\n' + item['abstract'].lower()
+        if not any([kw.lower() in title_abstract for kw in filter_words]):
+            results.append((False, set()))
+            continue
+        categories = set()
+        for key, words in category_words.items():
+            if any([w.lower() in item['title'].lower() for w in words]):
+                categories.add(key)
+        results.append((True, categories))
+    return results
+
+
+def matcher_match(records, filter_words, category_words):
+    matcher = KeywordMatcher(filter_words, category_words)
+    results = []
+    for item in records:
+        passed, categories = matcher.match(item['title'], item['abstract'])
+        results.append((passed, set(categories)))
+    return results
+
+
+def load_records(path):
+    records = []
+    for root, _, names in os.walk(path):
+        for name in sorted(names):
+            if not name.endswith('.json'):
+                continue
+            for line in open(os.path.join(root, name), encoding='utf-8'):
+                if line.strip():
+                    records.append(json.loads(line))
+    return records
+
+
+def timeit(func, repeat, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        cost = time.perf_counter() - start
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_dir', default=os.path.join(BASE_DIR, 'datasets'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--extra_words', type=int, default=0)
+    args = parser.parse_args()
+
+    records = load_records(args.data_dir)
+    assert records, f"No json file found in {args.data_dir}"
+
+    category_words = {key: list(words) for key, words in CATEGORY_WORDS.items()}
+    rand = random.Random(0)
+    for words in category_words.values():
+        words.extend(''.join(rand.choices(string.ascii_lowercase, k=8)) for _ in range(args.extra_words))
+
+    expected = loop_match(records, FILTER_WORDS, category_words)
+    actual = matcher_match(records, FILTER_WORDS, category_words)
+    mismatch = sum(1 for a, b in zip(expected, actual) if a != b)
+
+    keywords = len(FILTER_WORDS) + sum(len(words) for words in category_words.values())
+    loop_cost = timeit(loop_match, args.repeat, records, FILTER_WORDS, category_words)
+    matcher_cost = timeit(matcher_match, args.repeat, records, FILTER_WORDS, category_words)
+    print(f"records: {len(records)}, keywords: {keywords}, mismatch records: {mismatch}")
+    print(f"loop:    {loop_cost:.3f}s")
+    print(f"matcher: {matcher_cost:.3f}s")
+    print(f"speedup: {loop_cost/matcher_cost:.2f}x")
@@ -0,0 +1,93 @@
+'''对比 dict 记录与带 __slots__ 的 Paper 记录每 1 万条占用的内存，以及整个单天处理(解析 → 写 json → 过滤 → 翻译 → 渲染)的内存峰值
+
+用法:
+    python benchmark/bench_records.py [--size 10000]
+    python benchmark/bench_records.py --src /tmp/old/src      # 用另一份源码测量单天处理的峰值，对比改动前后
+'''
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FILTER_WORDS = ['LLM', 'large language model']
+CATEGORY_WORDS = {
+    'Survey': ['survey'],
+    'Benchmark': ['benchmark'],
+    'Reasoning': ['Reasoning'],
+    'Agent': ['Agent']
+}
+DATE = '240701'
+
+
+def traced(fn, *args):
+    '''返回 (结果, 调用结束时仍占用的内存, 调用期间的内存峰值)'''
+    tracemalloc.start()
+    try:
+        result = fn(*args)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def build_parser(work_dir: str):
+    from abs_fetcher import AbsFetcher
+    from translate import YoudaoTranslator
+    from paper_parser import PaperParser
+
+    class StubTranslator(YoudaoTranslator):
+        def _request(self, url: str, playload: dict):
+            queries = playload['q'] if isinstance(playload['q'], list) else [playload['q']]
+            return dict(translation=[f'译文 {q}' for q in queries],
+                        translateResults=[dict(query=q, translation=f'译文 {q}') for q in queries])
+
+    class StubFetcher(AbsFetcher):
+        def fetch(self, arxiv_id: str, url: str, version: str, parse_fn):
+            return dict(abstract=f'Abstract of {arxiv_id} for large language model.', history=f'[v1] {version}')
+
+    translator = StubTranslator(api_key='stub', api_secret='stub', delta_t=0, cache_dir=os.path.join(work_dir, 'cache'))
+    return PaperParser(translator=translator, filter_words=FILTER_WORDS, category_words=CATEGORY_WORDS,
+                       fetcher=StubFetcher(cache_dir=None))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--size', type=int, default=10000)
+    arg_parser.add_argument('--src', default=os.path.join(BASE_DIR, 'src'))
+    args = arg_parser.parse_args()
+    sys.path.insert(0, os.path.join(BASE_DIR, 'benchmark'))
+    sys.path.insert(0, os.path.abspath(args.src))
+
+    from digest_generator import generate_digest
+    from metrics import METRICS
+    METRICS.quiet = True
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        txt_file = os.path.join(work_dir, f'paper_{DATE}.txt')
+        with open(txt_file, 'w', encoding='utf-8') as f:
+            f.write(generate_digest(args.size, seed=7))
+        parser = build_parser(work_dir)
+        start = time.perf_counter()
+        _, _, peak = traced(parser.extra_paper, txt_file, os.path.join(work_dir, f'{DATE}.rst'), DATE, DATE)
+        print(f"{args.src}: extra_paper {args.size} records  peak: {peak/2**20:.1f} MB  ({time.perf_counter()-start:.2f}s traced)")
+
+        try:
+            from paper_record import as_papers
+        except ImportError:
+            as_papers = None
+        if as_papers is not None:
+            from columnar_store import iter_json, load_json
+            json_file = txt_file.replace('.txt', '.json')
+            records, dict_size, _ = traced(load_json, json_file)
+            papers, paper_size, _ = traced(lambda: list(as_papers(iter_json(json_file))))
+            scale = 10000 / len(records)
+            print(f"per 10k records  dict: {dict_size*scale/2**20:.1f} MB  Paper: {paper_size*scale/2**20:.1f} MB  "
+                  f"saved: {1-paper_size/dict_size:.0%}")
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,75 @@
+'''对比 DigestTokenizer 与 PATTERN/PATTERN_revised 正则在 datasets 下 txt 文件上的解析耗时
+
+用法: python benchmark/bench_tokenizer.py [--data_dir datasets] [--repeat 3]
+'''
+import os
+import re
+import sys
+import time
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+from paper_parser import PATTERN, PATTERN_revised
+from digest_tokenizer import DigestTokenizer
+
+
+def regex_parse(input_file):
+    text = ''.join(open(input_file, encoding='utf-8').readlines())
+    papers = []
+    for content in re.split('---------------+', text):
+        result = PATTERN.match(content)
+        result = result or PATTERN_revised.match(content)
+        if result:
+            papers.append({k: v.strip() for k, v in result.groupdict().items()})
+    return papers
+
+
+def tokenizer_parse(input_file):
+    with open(input_file, encoding='utf-8') as infile:
+        return list(DigestTokenizer().tokenize(infile))
+
+
+def list_files(path):
+    files = []
+    for root, _, names in os.walk(path):
+        files.extend(os.path.join(root, name) for name in names if name.endswith('.txt'))
+    return sorted(files)
+
+
+def timeit(func, files, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for input_file in files:
+            func(input_file)
+        cost = time.perf_counter() - start
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_dir', default=os.path.join(BASE_DIR, 'datasets'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    files = list_files(args.data_dir)
+    assert files, f"No txt file found in {args.data_dir}"
+
+    mismatch = 0
+    records = 0
+    for input_file in files:
+        expected, actual = regex_parse(input_file), tokenizer_parse(input_file)
+        records += len(actual)
+        if expected != actual:
+            mismatch += 1
+            print(f"mismatch: {input_file} regex={len(expected)} tokenizer={len(actual)}")
+
+    regex_cost = timeit(regex_parse, files, args.repeat)
+    tokenizer_cost = timeit(tokenizer_parse, files, args.repeat)
+    print(f"files: {len(files)}, records: {records}, mismatch files: {mismatch}")
+    print(f"regex:     {regex_cost:.3f}s")
+    print(f"tokenizer: {tokenizer_cost:.3f}s")
+    print(f"speedup:   {regex_cost/tokenizer_cost:.2f}x")
@@ -0,0 +1,99 @@
+'''生成与 arxiv 邮件摘要格式一致的合成 txt，包含新提交与替换版本两种记录，用于性能测试
+
+用法: python benchmark/digest_generator.py 10000 -o /tmp/paper_240701.txt [--revised_ratio 0.3] [--seed 0]
+'''
+import random
+import argparse
+import textwrap
+
+WORDS = ('model', 'models', 'language', 'learning', 'training', 'data', 'neural', 'network', 'method', 'approach',
+         'task', 'tasks', 'performance', 'results', 'show', 'propose', 'novel', 'framework', 'generation',
+         'evaluation', 'dataset', 'transformer', 'attention', 'representation', 'alignment', 'instruction',
+         'fine-tuning', 'pretraining', 'multimodal', 'vision', 'text', 'code', 'knowledge', 'graph', 'robust',
+         'scalable', 'efficient', 'analysis', 'understanding', 'question', 'answering', 'the', 'of', 'and', 'for',
+         'with', 'in', 'on', 'to', 'a', 'we', 'our', 'that', 'this', 'is', 'are', 'by', 'from')
+# 过滤词与类别词，按 keyword_ratio 混入标题与摘要
+KEYWORDS = ('LLM', 'large language model', 'Survey', 'Benchmark', 'Reasoning', 'Agent', 'Retrieval', 'RAG',
+            'tool', 'API', 'KV cache', 'Decoding', 'Efficient', 'In-Context Learning')
+FIRST_NAMES = ('Wei', 'Jing', 'Yu', 'Xiao', 'Anna', 'John', 'Maria', 'David', 'Li', 'Hao', 'Sara', 'Tom')
+LAST_NAMES = ('Wang', 'Zhang', 'Li', 'Chen', 'Liu', 'Smith', 'Garcia', 'Müller', 'Kim', 'Nguyen', 'Zhou')
+CATEGORIES = ('cs.CL', 'cs.AI', 'cs.LG', 'cs.CV', 'cs.IR')
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri')
+
+HEADER = textwrap.dedent('''
+------------------------------------------------------------------------------
+------------------------------------------------------------------------------
+Send any comments regarding submissions directly to submitter.
+------------------------------------------------------------------------------
+Archives at http://arxiv.org/
+To unsubscribe, e-mail To: cs@arXiv.org, Subject: cancel
+------------------------------------------------------------------------------
+ Submissions to:
+Computation and Language
+ received from  Tue  2 Jul 24 18:00:00 GMT  to  Wed  3 Jul 24 18:00:00 GMT
+------------------------------------------------------------------------------
+------------------------------------------------------------------------------
+''').lstrip()
+SEPARATOR = '-' * 78
+
+
+def _sentence(rng: random.Random, length: int, keyword_ratio: float):
+    words = [rng.choice(WORDS) for _ in range(length)]
+    if rng.random() < keyword_ratio:
+        words[rng.randrange(length)] = rng.choice(KEYWORDS)
+    return ' '.join(words)
+
+
+def _field(name: str, value: str):
+    # 与邮件一致: 首行 "Name: "，续行缩进两个空格，每行不超过 78 个字符
+    return textwrap.fill(value, width=78, initial_indent=f'{name}: ', subsequent_indent='  ', break_on_hyphens=False)
+
+
+def _date(rng: random.Random):
+    return f'{rng.choice(WEEKDAYS)}, {rng.randint(1, 28)} Jul 2024 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d} GMT'
+
+
+def make_record(rng: random.Random, arxiv_id: str, revised: bool, keyword_ratio: float=0.3):
+    size = f'{rng.randint(50, 9000)}kb'
+    title = _sentence(rng, rng.randint(6, 16), keyword_ratio).capitalize()
+    authors = ', '.join(f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}' for _ in range(rng.randint(1, 12)))
+    lines = ['\\\\', f'arXiv:{arxiv_id}']
+    if revised:
+        lines.append(f'replaced with revised version {_date(rng)}   ({size})')
+    else:
+        lines.append(f'Date: {_date(rng)}   ({size})')
+    lines += ['', _field('Title', title), _field('Authors', authors),
+              f'Categories: {" ".join(rng.sample(CATEGORIES, rng.randint(1, 3)))}',
+              f'Comments: {rng.randint(4, 40)} pages']
+    if not revised:
+        abstract = '. '.join(_sentence(rng, rng.randint(12, 30), keyword_ratio).capitalize()
+                             for _ in range(rng.randint(4, 9))) + '.'
+        lines += ['\\\\', textwrap.fill(abstract, width=78, initial_indent='  ', break_on_hyphens=False)]
+    lines.append(f'\\\\ ( https://arxiv.org/abs/{arxiv_id} ,  {size})')
+    lines.append(SEPARATOR)
+    return '\n'.join(lines) + '\n'
+
+
+def generate_digest(n: int, revised_ratio: float=0.3, keyword_ratio: float=0.3, seed: int=0):
+    '''生成包含 n 条记录的摘要文本，其中约 revised_ratio 为替换版本'''
+    rng = random.Random(seed)
+    parts = [HEADER]
+    for i in range(n):
+        revised = rng.random() < revised_ratio
+        arxiv_id = f'2401.{i:05d}' if revised else f'2407.{i:05d}'
+        parts.append(make_record(rng, arxiv_id, revised, keyword_ratio))
+    parts.append('%%--%%--%%--%%--%%\n')
+    return ''.join(parts)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('n', type=int)
+    arg_parser.add_argument('-o', '--output', required=True)
+    arg_parser.add_argument('--revised_ratio', type=float, default=0.3)
+    arg_parser.add_argument('--keyword_ratio', type=float, default=0.3)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(generate_digest(args.n, args.revised_ratio, args.keyword_ratio, args.seed))
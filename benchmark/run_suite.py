@@ -0,0 +1,413 @@
+'''解析 → 过滤 → 翻译 → 渲染 流水线的微基准测试，输出 json 结果，可与之前的结果比较并按阈值判断性能回退
+
+用法:
+    python benchmark/run_suite.py --sizes 1000,10000 -o bench_new.json
+    python benchmark/run_suite.py --sizes 1000,10000 --baseline bench_old.json --threshold 0.2
+    python benchmark/run_suite.py --only tokenize,render --sizes 100000
+
+与 baseline 中同名的项目耗时增加超过 threshold(比例)时视为回退，进程以状态码 1 退出
+'''
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+from digest_generator import generate_digest
+from paper_parser import PaperParser, PATTERN, PATTERN_revised, parse_abs_page
+from digest_tokenizer import DigestTokenizer
+from keyword_matcher import KeywordMatcher
+from translate import YoudaoTranslator
+from paper_index import PaperIndex
+from search_index import SearchIndex
+from abs_fetcher import AbsFetcher, get_version_tag
+from arxiv_api import ArxivApiFetcher, RecordedFeedServer
+from metrics import METRICS
+from abstract_translator import AbstractScheduler
+import category_classifier
+from category_classifier import CategoryClassifier, train
+import duplicate_index
+from duplicate_index import DuplicateIndex
+
+# 与 src/main.py 的配置一致，带引号的词按整词匹配
+FILTER_WORDS = ['LLM', 'large language model']
+CATEGORY_WORDS = {
+    'Survey': ['survey'],
+    'Benchmark': ['benchmark'],
+    'Accelerate': ['Accelerate', 'Decoding', 'Efficient', 'Accelerating', 'KV cache'],
+    'In-Context Learning': ['In-Context Learning', 'Memory Learning'],
+    'Reasoning': ['Reasoning'],
+    'ToolUse': ['"tool"', '"tools"', '"api"', '"apis"'],
+    'Retrieval-Augmented': ['Retrieval', 'Retriever', 'RAG'],
+    'Agent': ['Agent']
+}
+DATE = '240701'
+
+
+class StubTranslator(YoudaoTranslator):
+    '''不发送网络请求的翻译器，只保留去重、分批与缓存的开销'''
+    def __init__(self, cache_dir: str) -> None:
+        super().__init__(api_key='stub', api_secret='stub', delta_t=0, cache_dir=cache_dir)
+
+    def _request(self, url: str, playload: dict):
+        queries = playload['q'] if isinstance(playload['q'], list) else [playload['q']]
+        return dict(translation=[f'译文 {q}' for q in queries],
+                    translateResults=[dict(query=q, translation=f'译文 {q}') for q in queries])
+
+
+class StubFetcher(AbsFetcher):
+    '''每次抓取固定等待 latency 秒，模拟 abs 页面的网络延迟'''
+    def __init__(self, latency: float=0.005) -> None:
+        super().__init__(cache_dir=None)
+        self.latency = latency
+
+    def fetch(self, arxiv_id: str, url: str, version: str, parse_fn):
+        time.sleep(self.latency)
+        return dict(abstract=f'Abstract of {arxiv_id} for large language model.', history=f'[v1] {version}')
+
+
+def to_records(papers: list):
+    '''与 PaperParser.extra_paper 写 json 时的清洗一致，替换版本使用合成摘要代替抓取结果'''
+    records = []
+    for i, paper in enumerate(papers):
+        arxiv_id = re.findall(r'https://arxiv.org/abs/(\d+\.\d+)', paper['url'])[0]
+        abstract = paper['abstract']
+        if 'replaced with revised version' in paper['date']:
+            abstract = papers[i-1]['abstract'] if i > 0 else paper['title']
+        records.append(dict(
+            datadate=DATE,
+            arxiv_id=arxiv_id,
+            url=paper['url'],
+            title=paper['title'].replace('\n', '').replace('  ', ' '),
+            submitdate=paper['date'],
+            authors=' '.join([a.strip() for a in paper['authors'].split('\n')]),
+            abstract=''.join([a.strip()+'\n' if a.strip().endswith('.') else a.strip()+' ' for a in abstract.strip().split('\n')]).strip(),
+            version=get_version_tag(paper['date'])
+        ))
+    return records
+
+
+class Fixture:
+    '''每个规模只生成一次的输入数据'''
+    def __init__(self, size: int, work_dir: str) -> None:
+        self.size = size
+        self.work_dir = work_dir
+        self.txt_file = os.path.join(work_dir, f'paper_{DATE}.txt')
+        with open(self.txt_file, 'w', encoding='utf-8') as f:
+            f.write(generate_digest(size, seed=size))
+        with open(self.txt_file, encoding='utf-8') as f:
+            self.papers = list(DigestTokenizer().tokenize(f))
+        self.records = to_records(self.papers)
+        self.json_file = os.path.join(work_dir, f'paper_{DATE}.json')
+        with open(self.json_file, 'w', encoding='utf-8') as f:
+            for record in self.records:
+                f.write(json.dumps({k: v for k, v in record.items() if k != 'version'})+'\n')
+
+    def path(self, name: str):
+        return os.path.join(self.work_dir, name)
+
+
+def bench_tokenize(fixture: Fixture):
+    with open(fixture.txt_file, encoding='utf-8') as f:
+        return len(list(DigestTokenizer().tokenize(f)))
+
+
+def bench_tokenize_regex(fixture: Fixture):
+    text = ''.join(open(fixture.txt_file, encoding='utf-8').readlines())
+    count = 0
+    for content in re.split('---------------+', text):
+        if PATTERN.match(content) or PATTERN_revised.match(content):
+            count += 1
+    return count
+
+
+def bench_filter(fixture: Fixture):
+    matcher = KeywordMatcher(FILTER_WORDS, CATEGORY_WORDS)
+    return sum(matcher.match(item['title'], item['abstract'])[0] for item in fixture.records)
+
+
+def bench_render(fixture: Fixture):
+    # 译文全部命中缓存，只测量过滤、模板格式化与写文件
+    translator = StubTranslator(fixture.path('render_cache'))
+    parser = PaperParser(translator=translator, filter_words=FILTER_WORDS, category_words=CATEGORY_WORDS)
+    parser.render_papers(fixture.records, fixture.path('render.rst'), DATE)
+    translator.close()
+    return len(fixture.records)
+
+
+def add_category_items(category_items: dict, content: str, item: dict):
+    '''原有 PaperParser.add_category_items 的逐类别子串判断，保留在这里作为分类耗时的基准'''
+    added = False
+    for key, items in category_items.items():
+        if any([w.strip('"').lower() in content.lower() for w in CATEGORY_WORDS[key]]):
+            items.append(item)
+            added = True
+    return added
+
+
+def bench_classify_rules(fixture: Fixture):
+    # 原有的逐篇、逐类别子串判断，文本为标题加摘要，与分类器的输入一致
+    count = 0
+    for item in fixture.records:
+        category_items = {key: [] for key in CATEGORY_WORDS}
+        count += add_category_items(category_items, item['title'] + '\n' + item['abstract'], item)
+    return count
+
+
+def setup_classify_tfidf(fixture: Fixture):
+    train(fixture.work_dir, CATEGORY_WORDS, fixture.path('classifier'))
+
+
+def bench_classify_tfidf(fixture: Fixture):
+    classifier = CategoryClassifier.load(fixture.path('classifier'))
+    return sum(len(labels) > 0 for labels in classifier.classify(fixture.records))
+
+
+def setup_dedup(fixture: Fixture):
+    # 前一天包含同样的记录，每篇都有候选，是查找的最坏情况
+    index_dir = fixture.path('duplicates')
+    shutil.rmtree(index_dir, ignore_errors=True)
+    DuplicateIndex(index_dir).add_day('240630', fixture.records)
+
+
+def bench_dedup(fixture: Fixture):
+    index = DuplicateIndex(fixture.path('duplicates'), readonly=True)
+    return sum(match is not None for match in index.find(fixture.records, DATE))
+
+
+def setup_enrich(fixture: Fixture):
+    # 本地替身服务器同时提供 abs 页面与 API feed，内容为当天替换版本的论文，两个测试共用
+    if getattr(fixture, 'server', None) is not None:
+        return None
+    entries = {item['arxiv_id']: dict(arxiv_id=item['arxiv_id'], versions=2, title=item['title'], abstract=item['abstract'],
+                                      published='2024-06-01T10:00:00Z', updated='2024-07-01T10:00:00Z')
+               for item in fixture.records if 'replaced with revised version' in item['submitdate']}
+    fixture.server = RecordedFeedServer(entries=entries).start()
+    fixture.enrich_tasks = [(arxiv_id, f'{fixture.server.url}/abs/{arxiv_id}', 'v2') for arxiv_id in entries]
+
+
+def bench_enrich_scrape(fixture: Fixture):
+    fetcher = AbsFetcher(cache_dir=None)
+    results = fetcher.fetch_all(fixture.enrich_tasks, parse_abs_page)
+    fetcher.close()
+    return len(results)
+
+
+def bench_enrich_api(fixture: Fixture):
+    fetcher = ArxivApiFetcher(api_url=f'{fixture.server.url}/api/query', interval=0, cache_dir=None)
+    results = fetcher.fetch_all(fixture.enrich_tasks, parse_abs_page)
+    fetcher.close()
+    return len(results)
+
+
+def setup_render(fixture: Fixture):
+    translator = StubTranslator(fixture.path('render_cache'))
+    translator.translate_batch([item['title'] for item in fixture.records])
+    translator.close()
+
+
+def bench_translate_cold(fixture: Fixture):
+    cache_dir = fixture.path('translate_cold')
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    translator = StubTranslator(cache_dir)
+    count = len(translator.translate_batch([item['title'] for item in fixture.records]))
+    translator.close()
+    return count
+
+
+def bench_translate_warm(fixture: Fixture):
+    translator = StubTranslator(fixture.path('render_cache'))
+    count = len(translator.translate_batch([item['title'] for item in fixture.records]))
+    translator.close()
+    return count
+
+
+def translate_abstracts(cache_dir: str, records: list):
+    # 不限预算，按记录顺序依次给出类别优先级
+    translator = StubTranslator(cache_dir)
+    scheduler = AbstractScheduler(translator, priority=list(CATEGORY_WORDS), max_chars=10**12, max_seconds=10**9)
+    results = scheduler.translate([item['abstract'] for item in records], [i % 10 for i in range(len(records))])
+    translator.close()
+    return sum(result is not None for result in results)
+
+
+def setup_abstracts(fixture: Fixture):
+    translate_abstracts(fixture.path('abstract_cache'), fixture.records)
+
+
+def bench_abstracts_cold(fixture: Fixture):
+    cache_dir = fixture.path('abstract_cold')
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return translate_abstracts(cache_dir, fixture.records)
+
+
+def bench_abstracts_warm(fixture: Fixture):
+    return translate_abstracts(fixture.path('abstract_cache'), fixture.records)
+
+
+def bench_paper_index(fixture: Fixture):
+    db_file = fixture.path('papers.sqlite')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    index = PaperIndex(db_file)
+    index.update_versions([dict(item, date=DATE) for item in fixture.records])
+    found = index.get_many([item['arxiv_id'] for item in fixture.records])
+    index.update_titles([(item['arxiv_id'], item['title'], f"译文 {item['title']}") for item in fixture.records])
+    index.close()
+    return len(found)
+
+
+def bench_search_index(fixture: Fixture):
+    index = SearchIndex(fixture.path('search.sqlite'))
+    index.add_day(fixture.json_file, DATE)
+    index.close()
+    return len(fixture.records)
+
+
+def bench_pipeline(fixture: Fixture, async_pipeline: bool=False):
+    # 从 txt 到 json 与 RST 的完整一天，abs 页面抓取带模拟延迟，译文全部命中缓存
+    work_dir = fixture.path('pipeline_async' if async_pipeline else 'pipeline_sync')
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    txt_file = shutil.copy(fixture.txt_file, work_dir)
+    translator = StubTranslator(fixture.path('render_cache'))
+    parser = PaperParser(translator=translator, fetcher=StubFetcher(), filter_words=FILTER_WORDS,
+                         category_words=CATEGORY_WORDS, async_pipeline=async_pipeline)
+    parser.extra_paper(txt_file, os.path.join(work_dir, f'{DATE}.rst'), date=DATE)
+    translator.close()
+    return len(fixture.records)
+
+
+def bench_pipeline_async(fixture: Fixture):
+    return bench_pipeline(fixture, async_pipeline=True)
+
+
+# 名称: (测试函数, 准备函数)，准备函数每个规模只运行一次且不计时
+BENCHMARKS = {
+    'tokenize': (bench_tokenize, None),
+    'tokenize_regex': (bench_tokenize_regex, None),
+    'filter': (bench_filter, None),
+    'render': (bench_render, setup_render),
+    'translate_cold': (bench_translate_cold, None),
+    'translate_warm': (bench_translate_warm, setup_render),
+    'abstracts_cold': (bench_abstracts_cold, None),
+    'abstracts_warm': (bench_abstracts_warm, setup_abstracts),
+    'paper_index': (bench_paper_index, None),
+    'search_index': (bench_search_index, None),
+    'pipeline_sync': (bench_pipeline, setup_render),
+    'pipeline_async': (bench_pipeline_async, setup_render),
+    'classify_rules': (bench_classify_rules, None),
+    'enrich_scrape': (bench_enrich_scrape, setup_enrich),
+    'enrich_api': (bench_enrich_api, setup_enrich),
+}
+# TF-IDF 分类器依赖 numpy
+if category_classifier.np is not None:
+    BENCHMARKS['classify_tfidf'] = (bench_classify_tfidf, setup_classify_tfidf)
+# 近重复检测同样依赖 numpy
+if duplicate_index.np is not None:
+    BENCHMARKS['dedup'] = (bench_dedup, setup_dedup)
+
+
+def run(names: list, sizes: list, repeat: int):
+    results = {}
+    for size in sizes:
+        work_dir = tempfile.mkdtemp(prefix=f'bench_{size}_')
+        try:
+            start = time.perf_counter()
+            fixture = Fixture(size, work_dir)
+            print(f"fixture {size}: {len(fixture.records)} records, {time.perf_counter()-start:.2f}s")
+            for name in names:
+                bench_fn, setup_fn = BENCHMARKS[name]
+                if setup_fn is not None:
+                    setup_fn(fixture)
+                costs = []
+                count = 0
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    count = bench_fn(fixture)
+                    costs.append(time.perf_counter() - start)
+                key = f'{name}/{size}'
+                results[key] = dict(best=min(costs), mean=sum(costs)/len(costs), repeat=repeat,
+                                    records=len(fixture.records), count=count,
+                                    us_per_record=min(costs)/max(len(fixture.records), 1)*1e6)
+                print(f"  {key:28s} best {min(costs):8.4f}s  {results[key]['us_per_record']:8.2f} us/record")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ''
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    '''返回回退的项目列表 [(名称, 基线耗时, 当前耗时, 比例)]'''
+    regressions = []
+    print(f"\n{'benchmark':28s} {'baseline':>10s} {'current':>10s} {'change':>8s}")
+    for key in sorted(set(results) | set(baseline)):
+        if key not in baseline:
+            print(f"{key:28s} {'-':>10s} {results[key]['best']:10.4f} {'new':>8s}")
+            continue
+        if key not in results:
+            print(f"{key:28s} {baseline[key]['best']:10.4f} {'-':>10s} {'missing':>8s}")
+            continue
+        old, new = baseline[key]['best'], results[key]['best']
+        ratio = new / old if old > 0 else 1.0
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  REGRESSION'
+            regressions.append((key, old, new, ratio))
+        print(f"{key:28s} {old:10.4f} {new:10.4f} {(ratio-1)*100:+7.1f}%{mark}")
+    return regressions
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sizes', default='1000,10000', help='逗号分隔的记录数，例如 1000,10000,100000')
+    arg_parser.add_argument('--only', default=None, help='逗号分隔的测试名称: ' + ','.join(BENCHMARKS))
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('-o', '--output', default=None, help='结果 json 文件')
+    arg_parser.add_argument('--baseline', default=None, help='之前输出的结果 json，用于比较')
+    arg_parser.add_argument('--threshold', type=float, default=0.2, help='耗时增加超过该比例视为回退')
+    args = arg_parser.parse_args()
+
+    # 不输出进度条与被丢弃的记录
+    METRICS.quiet = True
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    for name in names:
+        assert name in BENCHMARKS, f"Unknown benchmark: {name}"
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    results = run(names, sizes, args.repeat)
+    report = dict(
+        commit=git_commit(),
+        time=time.strftime('%Y-%m-%d %H:%M:%S'),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        results=results
+    )
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"baseline commit: {baseline.get('commit', '')}, current commit: {report['commit']}")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold*100:.0f}%")
+            sys.exit(1)
@@ -0,0 +1,77 @@
+// 基于 search_index.py 导出的分片静态索引，在浏览器端按需加载并用 BM25 对标题打分
+(function () {
+  const BASE = document.currentScript.dataset.index || '_static/search';
+  const K1 = 1.2, B = 0.75;
+  const cache = {};
+
+  function load(path) {
+    if (!(path in cache)) {
+      cache[path] = fetch(`${BASE}/${path}`).then(r => (r.ok ? r.json() : {}));
+    }
+    return cache[path];
+  }
+
+  function tokenize(text) {
+    return text.toLowerCase().match(/[\p{L}\p{N}]+/gu) || [];
+  }
+
+  // 与 search_index.shard_name 一致: 前两个字符的 utf-8 十六进制编码
+  function shardName(term) {
+    const bytes = new TextEncoder().encode([...term].slice(0, 2).join(''));
+    return Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+  }
+
+  async function search(text, k) {
+    const meta = await load('meta.json');
+    const terms = [...new Set(tokenize(text))];
+    const scores = {};
+    const docs = {};
+    await Promise.all(terms.map(async term => {
+      const shard = await load(`terms/${shardName(term)}.json`);
+      const postings = shard[term] || [];
+      const idf = Math.log(1 + (meta.count - postings.length + 0.5) / (postings.length + 0.5));
+      for (const [rowid, tf] of postings) {
+        const bucket = await load(`docs/${Math.floor(rowid / 1000)}.json`);
+        const doc = bucket[rowid];
+        if (!doc) continue;
+        docs[rowid] = doc;
+        const norm = tf + K1 * (1 - B + B * doc[5] / meta.avgdl);
+        scores[rowid] = (scores[rowid] || 0) + idf * tf * (K1 + 1) / norm;
+      }
+    }));
+    // 同一篇论文出现在多天时只保留得分最高的一条
+    const best = {};
+    for (const rowid of Object.keys(scores)) {
+      const id = docs[rowid][0];
+      if (!(id in best) || scores[rowid] > scores[best[id]]) best[id] = rowid;
+    }
+    return Object.values(best)
+      .sort((a, b) => scores[b] - scores[a])
+      .slice(0, k)
+      .map(rowid => ({ score: scores[rowid], doc: docs[rowid] }));
+  }
+
+  window.addEventListener('DOMContentLoaded', () => {
+    const input = document.getElementById('paper-search-input');
+    const output = document.getElementById('paper-search-results');
+    if (!input || !output) return;
+    let timer = null;
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      timer = setTimeout(async () => {
+        const results = await search(input.value, 50);
+        output.innerHTML = '';
+        for (const { doc } of results) {
+          const [id, title, date, category, url] = doc;
+          const li = document.createElement('li');
+          const a = document.createElement('a');
+          a.href = url;
+          a.textContent = `[${id}] ${title}`;
+          li.appendChild(a);
+          li.appendChild(document.createTextNode(` (${date}, ${category})`));
+          output.appendChild(li);
+        }
+      }, 200);
+    });
+  });
+})();
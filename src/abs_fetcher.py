@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import time
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS
+
+
+def get_version_tag(date: str):
+    '''将 "replaced with revised version Thu, 4 Jul 2024 10:00:00 GMT" 转换为 20240704100000 作为版本标识'''
+    result = re.findall(r'\w{3}, +(\d+ \w{3} \d{4} \d{2}:\d{2}:\d{2})', date)
+    if not result:
+        return re.sub(r'\W+', '', date)
+    return datetime.strptime(result[0], '%d %b %Y %H:%M:%S').strftime('%Y%m%d%H%M%S')
+
+
+class AbsFetcher:
+    '''并发抓取 arxiv abs 页面，共享 keep-alive Session，按主机限制并发，带重试与磁盘缓存'''
+    # 为 True 时一次 fetch_all 合并请求多篇(如 ArxivApiFetcher)，流水线按块调用 fetch_all 而不是逐篇 fetch
+    batched = False
+    # 可以复用的抓取结果来源，abs 页面包含完整的提交历史
+    sources = ('abs',)
+
+    def __init__(self,
+                 cache_dir: str=None,
+                 max_workers: int=8,
+                 per_host: int=4,
+                 retries: int=3,
+                 backoff: float=1.0,
+                 timeout: int=10) -> None:
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # requests 只在构造抓取器时导入，没有待处理日期的运行不需要加载
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._host_locks = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def accepts(self, item: dict):
+        '''索引或进度日志中的抓取结果是否可以代替这次抓取，没有 source 的为 abs 页面的结果'''
+        return item.get('source', 'abs') in self.sources
+
+    def _cache_path(self, arxiv_id: str, version: str, namespace: str=''):
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, namespace, arxiv_id[:4], f'{arxiv_id}_{version}.json')
+
+    def _load_cache(self, arxiv_id: str, version: str, namespace: str=''):
+        cache_path = self._cache_path(arxiv_id, version, namespace)
+        if cache_path is None or not os.path.exists(cache_path):
+            return None
+        with open(cache_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_cache(self, arxiv_id: str, version: str, item: dict, namespace: str=''):
+        cache_path = self._cache_path(arxiv_id, version, namespace)
+        if cache_path is None:
+            return None
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(item, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+
+    def _host_semaphore(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_locks:
+                self._host_locks[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_locks[host]
+
+    def get(self, url: str):
+        '''带重试的 GET 请求，连接错误、429 与 5xx 按指数退避重试，其他 4xx(如 404)直接抛出'''
+        semaphore = self._host_semaphore(url)
+        for attempt in range(self.retries + 1):
+            try:
+                with semaphore:
+                    start = time.perf_counter()
+                    response = self._session.get(url=url, timeout=self.timeout)
+                    METRICS.observe('abs', time.perf_counter() - start)
+                METRICS.incr('http.abs.requests')
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise Exception(f"HTTP {response.status_code}")
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise e
+                METRICS.incr('http.abs.retries')
+                time.sleep(self.backoff * 2**attempt)
+                continue
+            # 其他 4xx 重试也不会改变结果
+            response.raise_for_status()
+            METRICS.incr('http.abs.bytes', len(response.content))
+            return response.content
+
+    def fetch(self, arxiv_id: str, url: str, version: str, parse_fn):
+        item = self._load_cache(arxiv_id, version)
+        if item is not None:
+            METRICS.incr('abs.disk_cache.hit')
+            return item
+        METRICS.incr('abs.disk_cache.miss')
+        item = parse_fn(self.get(url))
+        # 限流提示页等返回 200 但没有摘要的页面不写入缓存，按抓取失败处理，下次运行重新抓取
+        if not item.get('abstract'):
+            METRICS.incr('abs.empty')
+            raise Exception(f"no abstract in {url}")
+        self._save_cache(arxiv_id, version, item)
+        return item
+
+    def fetch_all(self, tasks: list, parse_fn):
+        '''tasks: [(arxiv_id, url, version)]，返回 {arxiv_id: item 或 Exception}'''
+        results = {}
+        if len(tasks) == 0:
+            return results
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch, arxiv_id, url, version, parse_fn): arxiv_id
+                       for arxiv_id, url, version in tasks}
+            for future, arxiv_id in futures.items():
+                try:
+                    results[arxiv_id] = future.result()
+                except Exception as e:
+                    results[arxiv_id] = e
+        return results
+
+    def close(self):
+        self._session.close()
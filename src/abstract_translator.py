@@ -0,0 +1,118 @@
+'''摘要翻译: 摘要按句子切分为单次请求大小的片段，经翻译缓存去重后用批量接口翻译
+
+AbstractScheduler 在每轮运行的字符与时间预算内安排翻译:
+- 已在缓存中的片段不占预算，多天或多个站点中重复的片段只翻译一次
+- 按类别优先级(例如 Survey、Benchmark 在前，没有类别的最后)选择要翻译的摘要，同一优先级按页面顺序
+- 超出预算或翻译失败的摘要这次不显示译文，页面照常发布；下一轮运行重新渲染这一天时再补齐
+
+用法:
+    ABSTRACTS=1 ABSTRACT_CHARS=20000 ABSTRACT_SECONDS=120 python src/main.py
+    ABSTRACTS=1 ABSTRACT_PRIORITY=Survey,Benchmark python src/main.py
+'''
+import re
+import time
+import textwrap
+
+from metrics import METRICS
+
+# 句末标点之后的空白处切分
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_sentences(text: str, max_chars: int=1000):
+    '''按句子边界切分并合并为不超过 max_chars 的片段，超长的单句按空格切开；相同的摘要总是得到相同的片段'''
+    chunks, current = [], ''
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = ' '.join(sentence.split())
+        if not sentence:
+            continue
+        pieces = [sentence] if len(sentence) <= max_chars else textwrap.wrap(sentence, max_chars)
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f'{current} {piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class AbstractScheduler:
+    def __init__(self,
+                 translator,
+                 priority: list=(),
+                 max_chars: int=20000,
+                 max_seconds: float=120,
+                 chunk_chars: int=1000) -> None:
+        self.translator = translator
+        # 类别名 -> 优先级，越小越先翻译
+        self.priority = {name: i for i, name in enumerate(priority)}
+        self.max_chars = max_chars
+        self.max_seconds = max_seconds
+        self.chunk_chars = chunk_chars
+        self.reset()
+
+    def reset(self):
+        '''新一轮运行开始时恢复预算'''
+        self.spent_chars = 0
+        self.spent_seconds = 0.0
+
+    def config(self):
+        # 预算只影响译文出现的早晚，不影响页面格式，不计入配置哈希
+        return dict(priority=sorted(self.priority, key=self.priority.get), chunk_chars=self.chunk_chars)
+
+    def rank(self, categories):
+        '''不在优先级列表中的类别排在列表之后，没有类别(Other)的最后'''
+        if not categories:
+            return len(self.priority) + 1
+        return min(self.priority.get(name, len(self.priority)) for name in categories)
+
+    def _send(self, batch: list, chars: int, done: dict):
+        '''翻译一批片段，时间预算用完或请求失败时跳过，这批片段对应的摘要留到下一轮'''
+        if not batch:
+            return None
+        if self.spent_seconds >= self.max_seconds:
+            METRICS.incr('abstract.skipped_chars', chars)
+            return None
+        start = time.perf_counter()
+        try:
+            translations = self.translator.translate_batch(batch)
+        except Exception as e:
+            METRICS.error('abstract_translate', e)
+            return None
+        finally:
+            self.spent_seconds += time.perf_counter() - start
+        self.spent_chars += chars
+        METRICS.incr('abstract.chars', chars)
+        done.update((text, zh) for text, zh in zip(batch, translations) if zh)
+
+    def translate(self, abstracts: list, ranks: list):
+        '''abstracts 与 ranks 一一对应，返回与输入对齐的译文，预算内没有完成的为 None'''
+        chunks = [split_sentences(text, self.chunk_chars) for text in abstracts]
+        done = self.translator.lookup(list({chunk for parts in chunks for chunk in parts}))
+
+        # 按优先级挑选需要翻译的片段，凑满一次批量请求后发送
+        queued, batch, batch_chars = set(), [], 0
+        for i in sorted(range(len(abstracts)), key=lambda i: (ranks[i], i)):
+            pending = [chunk for chunk in dict.fromkeys(chunks[i]) if chunk not in done and chunk not in queued]
+            cost = sum(len(chunk) for chunk in pending)
+            if cost == 0:
+                continue
+            # 超出字符预算的留到下一轮，继续尝试之后较短的摘要
+            if self.spent_chars + batch_chars + cost > self.max_chars:
+                continue
+            queued.update(pending)
+            batch += pending
+            batch_chars += cost
+            if batch_chars >= self.translator.batch_chars:
+                self._send(batch, batch_chars, done)
+                batch, batch_chars = [], 0
+        self._send(batch, batch_chars, done)
+
+        results = [''.join(done[chunk] for chunk in parts) if all(chunk in done for chunk in parts) else None
+                   for parts in chunks]
+        deferred = results.count(None)
+        METRICS.incr('abstract.translated', len(results) - deferred)
+        METRICS.incr('abstract.deferred', deferred)
+        return results
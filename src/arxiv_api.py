@@ -0,0 +1,239 @@
+'''通过 arxiv export API 批量获取替换版本论文的摘要与版本信息
+
+一次请求用 id_list 查询多篇论文，返回的 Atom feed 用 iterparse 流式解析，每解析完一个 entry 就释放；
+API 中缺少的论文或请求失败的批次退回逐篇抓取 abs 页面。
+
+API 只提供第一版的提交时间(published)与最新版本的时间(updated)，中间版本的时间不可得，历史版本中只列出这两项。
+因此 API 的结果带有 source='api'，缓存在单独的 api 目录下；关闭 ARXIV_API 后逐篇抓取不会复用这些结果，
+全局索引与进度日志中来自 API 的记录也会重新抓取 abs 页面，补齐完整的历史版本。
+
+用法:
+    python src/arxiv_api.py 2407.03993 2401.07187
+    # 本地替身服务器，用录制的 feed(目录下的 *.xml)响应 /api/query 与 /abs/<id>
+    python src/arxiv_api.py --serve tests/feeds --port 8000
+    ARXIV_API=1 ARXIV_API_URL=http://127.0.0.1:8000/api/query python src/main.py
+'''
+import io
+import os
+import re
+import time
+import threading
+import argparse
+from datetime import datetime
+from urllib.parse import urlencode, urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.sax.saxutils import escape
+from lxml import etree
+
+from abs_fetcher import AbsFetcher
+from metrics import METRICS
+
+API_URL = 'http://export.arxiv.org/api/query'
+ATOM = '{http://www.w3.org/2005/Atom}'
+ID_PATTERN = re.compile(r'abs/(?P<arxiv_id>.+?)(?:v(?P<version>\d+))?$')
+
+
+def format_date(text: str):
+    '''2024-07-04T15:25:49Z 转换为 abs 页面中的格式 Thu, 4 Jul 2024 15:25:49 UTC'''
+    date = datetime.strptime(text.strip(), '%Y-%m-%dT%H:%M:%SZ')
+    return f"{date:%a}, {date.day} {date:%b %Y %H:%M:%S} UTC"
+
+
+def parse_feed(content):
+    '''解析 Atom feed，返回 {arxiv_id: dict(abstract, history, versions)}，跳过 API 的错误条目'''
+    results = {}
+    for _, entry in etree.iterparse(io.BytesIO(content), events=('end',), tag=f'{ATOM}entry'):
+        match = ID_PATTERN.search((entry.findtext(f'{ATOM}id') or '').strip())
+        summary = entry.findtext(f'{ATOM}summary')
+        if match and summary is not None:
+            versions = int(match.group('version') or 1)
+            history = f"[v1] {format_date(entry.findtext(f'{ATOM}published'))}"
+            if versions > 1:
+                history += f"\n[v{versions}] {format_date(entry.findtext(f'{ATOM}updated'))}"
+            results[match.group('arxiv_id')] = dict(abstract=' '.join(summary.split()), history=history, versions=versions)
+        # 释放已处理的 entry，内存占用与 feed 大小无关
+        entry.clear()
+        while entry.getprevious() is not None:
+            del entry.getparent()[0]
+    return results
+
+
+class ArxivApiFetcher(AbsFetcher):
+    '''按 batch_size 批量请求 export API，优先使用 abs 页面的缓存，API 的结果缓存在 api 目录下，缺失的论文交给 AbsFetcher 逐篇抓取'''
+    # 按批次而不是逐篇调用 fetch_all
+    batched = True
+    sources = ('abs', 'api')
+    # API 结果的缓存目录，与 abs 页面的缓存分开
+    namespace = 'api'
+
+    def __init__(self,
+                 api_url: str=API_URL,
+                 batch_size: int=100,
+                 interval: float=3.0,
+                 **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.api_url = api_url
+        self.batch_size = batch_size
+        # arxiv 要求 API 请求之间至少间隔 3 秒
+        self.interval = interval
+        self._api_lock = threading.Lock()
+        self._last_request = 0.0
+
+    def query(self, arxiv_ids: list):
+        '''一次请求查询多篇论文，返回 parse_feed 的结果'''
+        url = f"{self.api_url}?{urlencode(dict(id_list=','.join(arxiv_ids), max_results=len(arxiv_ids)))}"
+        with self._api_lock:
+            wait = self._last_request + self.interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                content = self.get(url)
+            finally:
+                self._last_request = time.monotonic()
+        METRICS.incr('http.api.requests')
+        with METRICS.stage('parse.api_feed'):
+            return parse_feed(content)
+
+    def fetch_all(self, tasks: list, parse_fn):
+        '''tasks: [(arxiv_id, url, version)]，返回 {arxiv_id: item 或 Exception}'''
+        results = {}
+        pending = []
+        for arxiv_id, url, version in tasks:
+            item = self._load_cache(arxiv_id, version)
+            if item is None:
+                item = self._load_cache(arxiv_id, version, self.namespace)
+            if item is not None:
+                METRICS.incr('abs.disk_cache.hit')
+                results[arxiv_id] = item
+            else:
+                pending.append((arxiv_id, url, version))
+
+        fallback = []
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start+self.batch_size]
+            try:
+                found = self.query([arxiv_id for arxiv_id, _, _ in batch])
+            except Exception as e:
+                METRICS.error('arxiv_api', f"批量查询失败，改为逐篇抓取 {len(batch)} 篇: {e}")
+                found = {}
+            for arxiv_id, url, version in batch:
+                entry = found.get(arxiv_id)
+                if entry is None:
+                    fallback.append((arxiv_id, url, version))
+                    continue
+                item = dict(abstract=entry['abstract'], history=entry['history'], source='api')
+                self._save_cache(arxiv_id, version, item, self.namespace)
+                results[arxiv_id] = item
+        # 逐篇抓取的缓存未命中由父类的 fetch 计数
+        METRICS.incr('abs.disk_cache.miss', len(pending) - len(fallback))
+        METRICS.incr('api.hit', len(pending) - len(fallback))
+        METRICS.incr('api.fallback', len(fallback))
+        # 父类的 fetch 逐篇抓取 abs 页面
+        results.update(super().fetch_all(fallback, parse_fn))
+        return results
+
+
+def format_feed(entries: list):
+    '''把 [dict(arxiv_id, title, abstract, published, updated, versions)] 写成 API 格式的 Atom feed，供替身服务器使用'''
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<feed xmlns="http://www.w3.org/2005/Atom">',
+             f'  <opensearch:totalResults xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">{len(entries)}</opensearch:totalResults>']
+    for entry in entries:
+        lines += ['  <entry>',
+                  f"    <id>http://arxiv.org/abs/{entry['arxiv_id']}v{entry.get('versions', 1)}</id>",
+                  f"    <updated>{entry['updated']}</updated>",
+                  f"    <published>{entry['published']}</published>",
+                  f"    <title>{escape(entry.get('title', ''))}</title>",
+                  f"    <summary>{escape(entry['abstract'])}</summary>",
+                  '  </entry>']
+    lines.append('</feed>')
+    return '\n'.join(lines).encode('utf-8')
+
+
+class RecordedFeedServer(ThreadingHTTPServer):
+    '''本地替身服务器: 读取目录下录制的 feed，按 id_list 组合成新的 feed 返回，/abs/<id> 返回只含摘要与历史版本的 abs 页面
+    hidden 中的论文只出现在 abs 页面(API 的索引尚未更新)，fail_requests 为接下来返回 503 的 API 请求数'''
+    daemon_threads = True
+
+    def __init__(self, feed_dir: str=None, port: int=0, entries: dict=None, hidden: set=()) -> None:
+        self.entries = dict(entries or {})
+        self.hidden = set(hidden)
+        self.fail_requests = 0
+        for name in sorted(os.listdir(feed_dir)) if feed_dir else []:
+            if name.endswith('.xml'):
+                with open(os.path.join(feed_dir, name), 'rb') as f:
+                    self.load(f.read())
+        self.requests = 0
+        self.paths = []
+        super().__init__(('127.0.0.1', port), RecordedFeedHandler)
+
+    def load(self, content: bytes):
+        for _, entry in etree.iterparse(io.BytesIO(content), events=('end',), tag=f'{ATOM}entry'):
+            match = ID_PATTERN.search((entry.findtext(f'{ATOM}id') or '').strip())
+            if match:
+                self.entries[match.group('arxiv_id')] = dict(
+                    arxiv_id=match.group('arxiv_id'), versions=int(match.group('version') or 1),
+                    title=entry.findtext(f'{ATOM}title') or '', abstract=entry.findtext(f'{ATOM}summary') or '',
+                    published=entry.findtext(f'{ATOM}published'), updated=entry.findtext(f'{ATOM}updated'))
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class RecordedFeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        self.server.paths.append(self.path)
+        url = urlparse(self.path)
+        if url.path.startswith('/abs/'):
+            entry = self.server.entries.get(url.path[len('/abs/'):])
+            if entry is None:
+                return self.send_error(404)
+            history = ''.join(f'<br/>[v{i}] {format_date(entry["published"] if i == 1 else entry["updated"])}'
+                              for i in sorted({1, entry['versions']}))
+            body = (f'<html><body><blockquote class="abstract mathjax">Abstract: {escape(entry["abstract"])}</blockquote>'
+                    f'<div class="submission-history">From: stand-in {history}</div></body></html>').encode('utf-8')
+            content_type = 'text/html; charset=utf-8'
+        else:
+            if self.server.fail_requests > 0:
+                self.server.fail_requests -= 1
+                return self.send_error(503)
+            ids = [i for i in parse_qs(url.query).get('id_list', [''])[0].split(',') if i]
+            body = format_feed([self.server.entries[i] for i in ids
+                                if i in self.server.entries and i not in self.server.hidden])
+            content_type = 'application/atom+xml; charset=utf-8'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == '__main__':
+    from paper_parser import parse_abs_page
+
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('ids', nargs='*', help='要查询的 arxiv id')
+    arg_parser.add_argument('--api_url', default=os.getenv('ARXIV_API_URL', API_URL))
+    arg_parser.add_argument('--serve', default=None, help='启动替身服务器，使用该目录下录制的 feed')
+    arg_parser.add_argument('--port', type=int, default=8000)
+    args = arg_parser.parse_args()
+
+    if args.serve:
+        server = RecordedFeedServer(args.serve, args.port)
+        print(f"serving {len(server.entries)} entries at {server.url}/api/query")
+        server.serve_forever()
+    elif args.ids:
+        fetcher = ArxivApiFetcher(api_url=args.api_url, interval=0)
+        results = fetcher.fetch_all([(i, f'https://arxiv.org/abs/{i}', 'latest') for i in args.ids], parse_abs_page)
+        for arxiv_id, item in results.items():
+            print(arxiv_id, item if isinstance(item, Exception) else item['history'].replace('\n', ' | '))
+            if not isinstance(item, Exception):
+                print('   ', item['abstract'][:120])
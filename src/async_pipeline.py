@@ -0,0 +1,208 @@
+'''asyncio 流水线: 摘要 txt → 解析 → 抓取替换版本的 abs 页面 → 写 json 并过滤 → 翻译标题 → 渲染
+
+记录按 chunk_size 分块在各阶段之间流动，阶段之间是有界队列，下游处理不过来时上游自动等待；
+abs 页面与翻译接口的网络等待放到线程中执行，和解析、写文件等 CPU 工作重叠。
+json 按输入顺序写到临时文件，全部写完后替换原文件；翻译结果按块号重新排序后渲染，输出与同步流程逐字节一致。
+parser 设置了 checkpoint_dir 时与同步流程共用单天进度日志，中断后重新运行只补做未完成的抓取与翻译
+
+用法:
+    parser = PaperParser(..., async_pipeline=True, pipeline_options=dict(fetch_concurrency=8))
+    parser.extra_paper('paper_240701.txt', '240701.rst', date='240701')
+'''
+import os
+import re
+import time
+import asyncio
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+
+from digest_tokenizer import DigestTokenizer
+from abs_fetcher import get_version_tag
+from checkpoint import AtomicFile
+from metrics import METRICS
+
+
+class AsyncPipeline:
+    def __init__(self,
+                 parser,
+                 parse_fn,
+                 chunk_size: int=100,
+                 queue_size: int=4,
+                 enrich_workers: int=4,
+                 fetch_concurrency: int=None,
+                 translate_concurrency: int=2) -> None:
+        self.parser = parser
+        self.parse_fn = parse_fn
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.enrich_workers = enrich_workers
+        self.fetch_concurrency = fetch_concurrency or parser.fetcher.max_workers
+        self.translate_concurrency = translate_concurrency
+
+    def run(self, input_file: str, output_file: str, date: str=None):
+        self.journal = self.parser.open_journal(input_file)
+        try:
+            asyncio.run(self._run(input_file, output_file, date))
+        except BaseException:
+            if self.journal is not None:
+                self.journal.close()
+            raise
+        if self.journal is not None:
+            self.journal.close(done=True)
+
+    async def _run(self, input_file: str, output_file: str, date: str):
+        json_file = input_file.replace('.txt', '.json')
+        # 解析之后、写 json 之前同时在处理的块数，限制乱序等待时占用的内存
+        self._window = asyncio.Semaphore(self.queue_size + self.enrich_workers)
+        parsed = asyncio.Queue(self.queue_size)
+        enriched = asyncio.Queue(self.queue_size)
+        filtered = asyncio.Queue(self.queue_size)
+        self._records = []
+        self._translated = {}
+
+        # 抓取与翻译各用一个线程池，线程数即并发上限；抓取完成的线程直接取下一个请求，不需要等事件循环调度
+        self._fetch_executor = ThreadPoolExecutor(max_workers=self.fetch_concurrency)
+        self._translate_executor = ThreadPoolExecutor(max_workers=self.translate_concurrency)
+        tasks = [asyncio.create_task(self._tokenize(input_file, parsed))]
+        tasks += [asyncio.create_task(self._enrich(date, parsed, enriched)) for _ in range(self.enrich_workers)]
+        tasks.append(asyncio.create_task(self._write(json_file, date, enriched, filtered)))
+        tasks += [asyncio.create_task(self._translate(filtered)) for _ in range(self.translate_concurrency)]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._fetch_executor.shutdown()
+            self._translate_executor.shutdown()
+        self.parser.report_rejected(results[0])
+
+        store = self.parser.store
+        if store is not None and not store.readonly and date:
+            with METRICS.stage('store.write'):
+                store.write_day(date, self._records, json_file)
+        self._records = []
+
+        profiles = self.parser.profiles
+        routed, titles, known = [[] for _ in profiles], [[] for _ in profiles], {}
+        for seq in sorted(self._translated):
+            chunk_routed, chunk_titles, chunk_known = self._translated[seq]
+            for i in range(len(profiles)):
+                routed[i] += chunk_routed[i]
+                titles[i] += chunk_titles[i]
+            known.update(chunk_known)
+        self.parser.count_untranslated(routed, titles)
+        # 摘要按整天的类别优先级安排翻译
+        self.parser.translate_abstracts(routed)
+        # 与同步流程一致，页面标题使用日期
+        for profile, papers, titles_zh in zip(profiles, routed, titles):
+            self.parser.write_pages(papers, titles_zh, known, output_file, date, profile)
+
+    async def _tokenize(self, input_file: str, out: asyncio.Queue):
+        tokenizer = DigestTokenizer()
+        chunk, seq, cost, count = [], 0, 0.0, 0
+        with open(input_file, encoding='utf-8') as infile:
+            start = time.perf_counter()
+            for paper in tokenizer.tokenize(infile):
+                paper['arxiv_id'] = re.findall(r'https://arxiv.org/abs/(\d+\.\d+)', paper['url'])[0]
+                paper['version'] = get_version_tag(paper['date'])
+                chunk.append(paper)
+                count += 1
+                if len(chunk) < self.chunk_size:
+                    continue
+                cost += time.perf_counter() - start
+                await self._window.acquire()
+                await out.put((seq, chunk))
+                chunk, seq = [], seq + 1
+                start = time.perf_counter()
+            cost += time.perf_counter() - start
+        if chunk:
+            await self._window.acquire()
+            await out.put((seq, chunk))
+        for _ in range(self.enrich_workers):
+            await out.put(None)
+        METRICS.add_time('parse.tokenize', cost)
+        METRICS.incr('parse.bytes', os.path.getsize(input_file))
+        METRICS.incr('parse.records', count)
+        METRICS.incr('parse.rejected', tokenizer.rejected)
+        return tokenizer
+
+    async def _fetch(self, arxiv_id: str, url: str, version: str):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._fetch_executor, self.parser.fetcher.fetch, arxiv_id, url, version, self.parse_fn)
+        except Exception as e:
+            return e
+
+    async def _enrich(self, date: str, inp: asyncio.Queue, out: asyncio.Queue):
+        while True:
+            item = await inp.get()
+            if item is None:
+                await out.put(None)
+                return None
+            seq, papers = item
+            revised, tasks = self.parser.revised_tasks(papers, self.journal)
+            if tasks:
+                start = time.perf_counter()
+                if self.parser.fetcher.batched:
+                    loop = asyncio.get_running_loop()
+                    fetched = await loop.run_in_executor(self._fetch_executor, self.parser.fetcher.fetch_all, tasks, self.parse_fn)
+                else:
+                    results = await asyncio.gather(*[self._fetch(*task) for task in tasks])
+                    fetched = {task[0]: result for task, result in zip(tasks, results)}
+                METRICS.add_time('parse.fetch_abs', time.perf_counter() - start)
+                if self.journal is not None:
+                    self.journal.enriched(tasks, fetched)
+                revised.update(fetched)
+            records, versions = [], []
+            for paper in papers:
+                record, version = self.parser.clean_record(paper, revised.get(paper['arxiv_id']), date)
+                records.append(record)
+                if version is not None:
+                    versions.append(version)
+            await out.put((seq, records, versions))
+
+    async def _write(self, json_file: str, date: str, inp: asyncio.Queue, out: asyncio.Queue):
+        '''按块号顺序写 json、更新全局索引并过滤，过滤后的论文交给翻译'''
+        pending, next_seq, finished = {}, 0, 0
+        keep = self.parser.store is not None and not self.parser.store.readonly and date
+        progress = tqdm(position=1, desc=os.path.basename(json_file), leave=False, colour='green', ncols=80, disable=METRICS.quiet)
+        with AtomicFile(json_file) as all_out:
+            while finished < self.enrich_workers:
+                item = await inp.get()
+                if item is None:
+                    finished += 1
+                    continue
+                pending[item[0]] = item
+                while next_seq in pending:
+                    _, records, versions = pending.pop(next_seq)
+                    start = time.perf_counter()
+                    all_out.write(''.join(record.to_json()+'\n' for record in records))
+                    METRICS.add_time('parse.write_json', time.perf_counter() - start)
+                    if self.parser.index is not None:
+                        with METRICS.stage('index.write'):
+                            self.parser.index.update_versions(versions)
+                    if keep:
+                        self._records += records
+                    # 过滤只改动 categories 与 title_zh，列式存储读取的字段不变，可以共用同一批 Paper
+                    routed = self.parser.route_records(records)
+                    progress.update(len(records))
+                    self._window.release()
+                    await out.put((next_seq, routed))
+                    next_seq += 1
+        progress.close()
+        if self.journal is not None:
+            self.journal.sync()
+        for _ in range(self.translate_concurrency):
+            await out.put(None)
+
+    async def _translate(self, inp: asyncio.Queue):
+        while True:
+            item = await inp.get()
+            if item is None:
+                return None
+            seq, routed = item
+            titles, known = await asyncio.get_running_loop().run_in_executor(self._translate_executor, self.parser.translate_routed, routed, self.journal)
+            self._translated[seq] = (routed, titles, known)
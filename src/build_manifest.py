@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import hashlib
+
+
+def file_hash(path: str):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class BuildManifest:
+    '''记录每天输入文件的哈希、解析配置的哈希与输出路径，只重建输入或配置发生变化的 json/rst
+
+    manifest 结构:
+        dirs:   {数据目录相对路径: mtime}，目录未变化时不再列出其中的文件
+        days:   {日期: {input, input_hash/mtime/size, json_hash/mtime/size, config, output}}
+    '''
+    def __init__(self, manifest_file: str, data_dir: str, filetype: str='txt') -> None:
+        self.manifest_file = manifest_file
+        self.data_dir = data_dir
+        self.filetype = filetype
+        self.exists = os.path.exists(manifest_file)
+        self.dirs = {}
+        self.days = {}
+        if self.exists:
+            with open(manifest_file, encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.dirs = manifest.get('dirs', {})
+            self.days = manifest.get('days', {})
+
+    def save(self):
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(dict(dirs=self.dirs, days=self.days), f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.manifest_file)
+        self.exists = True
+
+    def _abspath(self, rel_path: str):
+        return os.path.join(self.data_dir, rel_path)
+
+    def _json_path(self, rel_path: str):
+        return re.sub(f'.{self.filetype}$', '.json', self._abspath(rel_path))
+
+    def scan(self, rel_dir: str=''):
+        '''刷新输入文件列表，mtime 未变化的目录不再列出，只检查其中登记过的子目录'''
+        path = self._abspath(rel_dir) if rel_dir else self.data_dir
+        if not os.path.isdir(path):
+            return None
+        mtime = os.stat(path).st_mtime
+        if self.dirs.get(rel_dir) == mtime:
+            for child in [d for d in self.dirs if d and os.path.dirname(d) == rel_dir]:
+                self.scan(child)
+            return None
+
+        # 删除该目录下已不存在的输入与子目录
+        for date, entry in list(self.days.items()):
+            if os.path.dirname(entry['input']) == rel_dir and not os.path.exists(self._abspath(entry['input'])):
+                self.days.pop(date)
+        for child in [d for d in self.dirs if d and os.path.dirname(d) == rel_dir]:
+            if not os.path.isdir(self._abspath(child)):
+                self.dirs.pop(child)
+        with os.scandir(path) as entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.is_dir():
+                    self.scan(rel_path)
+                elif entry.name.endswith(f'.{self.filetype}'):
+                    dates = re.findall(r'\d{6}', entry.name)
+                    if not dates:
+                        continue
+                    self.days.setdefault(dates[0], {})['input'] = rel_path
+        self.dirs[rel_dir] = mtime
+
+    def dates(self, min_date: str=None, max_date: str=None):
+        '''按日期范围查询已登记的日期，min_date 不包含，max_date 包含'''
+        min_date = min_date or ''
+        max_date = max_date or '999999'
+        return [date for date in sorted(self.days) if min_date < date <= max_date]
+
+    def _hash(self, path: str, entry: dict, prefix: str):
+        # 文件大小与修改时间未变化时沿用已记录的哈希，避免每次运行都重新读取全部文件
+        stat = os.stat(path)
+        if entry.get(f'{prefix}_mtime') == stat.st_mtime and entry.get(f'{prefix}_size') == stat.st_size:
+            return entry[f'{prefix}_hash']
+        return file_hash(path)
+
+    def pending(self, config: str, output_fn, min_date: str=None, max_date: str=None, rebuild: bool=False):
+        '''返回需要重建的日期，格式与 paper_from_path 一致；输入变化时重新解析 txt，只有配置或 json 变化时从 json 重新渲染'''
+        items = []
+        for date in self.dates(min_date, max_date):
+            entry = self.days[date]
+            input_path = self._abspath(entry['input'])
+            json_path = self._json_path(entry['input'])
+            if (rebuild or 'input_hash' not in entry or not os.path.exists(json_path)
+                    or self._hash(input_path, entry, 'input') != entry['input_hash']):
+                items.append({'time': date, 'parts': [input_path]})
+            elif (config != entry.get('config') or not os.path.exists(output_fn(date))
+                  or self._hash(json_path, entry, 'json') != entry.get('json_hash')):
+                items.append({'time': date, 'parts': [json_path]})
+        return items
+
+    def record(self, date: str, config: str, output_file: str):
+        '''某天构建完成后登记当前的输入、json 与配置哈希'''
+        entry = self.days[date]
+        for prefix, path in [('input', self._abspath(entry['input'])), ('json', self._json_path(entry['input']))]:
+            stat = os.stat(path)
+            entry[f'{prefix}_hash'] = file_hash(path)
+            entry[f'{prefix}_mtime'] = stat.st_mtime
+            entry[f'{prefix}_size'] = stat.st_size
+        entry['config'] = config
+        entry['output'] = os.path.relpath(output_file, os.path.dirname(self.manifest_file))
+
+    def bootstrap(self, latest_date: str, config: str, output_fn):
+        '''首次使用 manifest 时，把 latest.date 之前已经生成过 json 与 rst 的日期登记为已构建'''
+        for date in self.dates(max_date=latest_date):
+            entry = self.days[date]
+            if os.path.exists(self._json_path(entry['input'])) and os.path.exists(output_fn(date)):
+                self.record(date, config, output_fn(date))
@@ -0,0 +1,260 @@
+'''TF-IDF 类别分类器: 标题加摘要的 TF-IDF 向量与各类别质心计算余弦相似度，代替只看标题的子串规则
+
+训练时用历史 datasets 中的 json 建立词表与 idf，以现有类别规则在标题上命中的论文作为种子，
+每个类别的质心为种子向量的均值，阈值取种子相似度的分位数。
+词表、idf、质心与阈值保存在目录中，启动时用 mmap 读取；每天的论文一次构造稀疏矩阵，
+与质心矩阵相乘得到全部相似度。依赖 numpy，有 scipy 时使用 scipy.sparse 计算矩阵乘法
+
+用法:
+    python src/category_classifier.py --model ~/.cache/arxiv/classifier --json datasets/2407/paper_240701.json
+'''
+import os
+import json
+import math
+import string
+import hashlib
+import argparse
+from itertools import filterfalse
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+from keyword_matcher import KeywordMatcher
+
+SEPARATOR = '\x00'
+# 除连字符外的标点替换为空格后按空白切分，比正则分词快得多
+PUNCTUATION = str.maketrans({c: ' ' for c in string.punctuation.replace('-', '')})
+STOP_WORDS = frozenset('''a an and are as at be by can for from has have in into is it its of on or our that the their
+these this to via we which with without while both more than such using based new show also over under between
+through those not only how what when where who whose - --'''.split())
+
+
+def split_words(text: str):
+    return list(filterfalse(STOP_WORDS.__contains__, text.lower().translate(PUNCTUATION).split()))
+
+
+def tokenize(text: str):
+    '''小写单词与相邻单词组成的二元词组(以空格连接)，去掉停用词'''
+    words = split_words(text)
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+def iter_json(data_dir: str):
+    for root, _, files in os.walk(data_dir):
+        for name in sorted(files):
+            if name.startswith('paper_') and name.endswith('.json'):
+                with open(os.path.join(root, name), encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+
+
+class CategoryClassifier:
+    '''words 为词表中出现过的全部单词；unigram_terms[单词编号] 为单词本身的词项编号(不在词表中为 -1)，
+    二元词组以 前词编号*单词数+后词编号 为键，排序后保存在 bigram_keys 中，对应词项编号为 bigram_terms'''
+    FILES = ('meta.json', 'idf.npy', 'centroids.npy', 'unigram_terms.npy', 'bigram_keys.npy', 'bigram_terms.npy')
+
+    def __init__(self, categories: list, words: list, unigram_terms, bigram_keys, bigram_terms,
+                 idf, centroids, thresholds: dict, version: str='') -> None:
+        if np is None:
+            raise Exception("Category classifier requires numpy")
+        self.categories = categories
+        self.version = version
+        self.word_index = {word: i for i, word in enumerate(words)}
+        self.unigram_terms = unigram_terms
+        self.bigram_keys = bigram_keys
+        self.bigram_terms = bigram_terms
+        self.idf = idf
+        # (类别数, 词项数)，每行已归一化
+        self.centroids = centroids
+        self.thresholds = np.array([thresholds.get(key, 1.0) for key in categories], dtype=np.float32)
+
+    @classmethod
+    def from_terms(cls, categories: list, terms: list, idf, centroids=None, thresholds: dict={}, version: str=''):
+        words = {}
+        unigrams, bigrams = {}, {}
+        for j, term in enumerate(terms):
+            parts = term.split(' ')
+            for word in parts:
+                words.setdefault(word, len(words))
+            if len(parts) == 1:
+                unigrams[words[term]] = j
+            else:
+                bigrams[words[parts[0]], words[parts[1]]] = j
+        size = max(len(words), 1)
+        unigram_terms = np.full(len(words), -1, dtype=np.int64)
+        unigram_terms[list(unigrams.keys())] = list(unigrams.values())
+        keys = np.array([a * size + b for a, b in bigrams.keys()], dtype=np.int64)
+        order = np.argsort(keys)
+        return cls(categories, list(words), unigram_terms, keys[order],
+                   np.array(list(bigrams.values()), dtype=np.int64)[order], idf, centroids, thresholds, version)
+
+    @classmethod
+    def load(cls, model_dir: str):
+        if np is None:
+            raise Exception("Category classifier requires numpy")
+        with open(os.path.join(model_dir, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(model_dir, f'{name}.npy'), mmap_mode='r')
+                  for name in ('unigram_terms', 'bigram_keys', 'bigram_terms', 'idf', 'centroids')}
+        return cls(meta['categories'], meta['words'], thresholds=meta['thresholds'], version=meta['version'], **arrays)
+
+    def save(self, model_dir: str, **extra):
+        os.makedirs(model_dir, exist_ok=True)
+        for name in ('unigram_terms', 'bigram_keys', 'bigram_terms', 'idf', 'centroids'):
+            np.save(os.path.join(model_dir, f'{name}.npy'), getattr(self, name))
+        meta = dict(categories=self.categories, thresholds=dict(zip(self.categories, map(float, self.thresholds))),
+                    words=list(self.word_index), **extra)
+        digest = hashlib.md5(np.ascontiguousarray(self.idf).tobytes() + np.ascontiguousarray(self.centroids).tobytes())
+        digest.update(json.dumps(meta, sort_keys=True).encode('utf-8'))
+        self.version = meta['version'] = digest.hexdigest()
+        tmp_path = os.path.join(model_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(model_dir, 'meta.json'))
+
+    @staticmethod
+    def exists(model_dir: str):
+        return all(os.path.exists(os.path.join(model_dir, name)) for name in CategoryClassifier.FILES)
+
+    def _matrix(self, texts: list):
+        '''返回行归一化的 TF-IDF 稀疏矩阵的 (rows, cols, data)
+
+        分词之外全部用 numpy 完成: 单词先映射为编号，一元词项查表，二元词项在排序的键上二分查找，
+        再对 (文档, 词项) 计数'''
+        # 整天的文本拼接后一次切分，文档之间用不会出现在文本中的分隔符隔开
+        flat = f' {SEPARATOR} '.join(texts).lower().translate(PUNCTUATION).split()
+        get = self.word_index.get
+        day_index = {word: -2 if word in STOP_WORDS else get(word, -1) for word in set(flat)}
+        day_index[SEPARATOR] = -3
+        wids = np.fromiter(map(day_index.__getitem__, flat), dtype=np.int64, count=len(flat))
+        separators = wids == -3
+        docs = np.cumsum(separators)
+        keep = wids > -2
+        wids, docs = wids[keep], docs[keep]
+
+        known = wids >= 0
+        unigram = np.where(known, self.unigram_terms[np.where(known, wids, 0)] if len(self.unigram_terms) else -1, -1)
+        size = max(len(self.word_index), 1)
+        pair = known[:-1] & known[1:] & (docs[:-1] == docs[1:])
+        keys = wids[:-1][pair] * size + wids[1:][pair]
+        pos = np.searchsorted(self.bigram_keys, keys)
+        found = pos < len(self.bigram_keys)
+        found[found] = self.bigram_keys[pos[found]] == keys[found]
+        bigram = np.full(len(keys), -1, dtype=np.int64)
+        bigram[found] = self.bigram_terms[pos[found]]
+
+        terms = np.concatenate([unigram, bigram])
+        term_docs = np.concatenate([docs, docs[:-1][pair]])
+        mask = terms >= 0
+        vocab_size = len(self.idf)
+        cells, counts = np.unique(term_docs[mask] * vocab_size + terms[mask], return_counts=True)
+        rows, cols = cells // vocab_size, cells % vocab_size
+        data = (1 + np.log(counts.astype(np.float32))) * self.idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights=data*data, minlength=len(texts)))
+        data = data / np.maximum(norms[rows], 1e-12)
+        return rows, cols, data
+
+    def scores(self, texts: list):
+        '''(文本数, 类别数) 的余弦相似度'''
+        rows, cols, data = self._matrix(texts)
+        if sparse is not None:
+            matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(texts), len(self.idf)))
+            return np.asarray(matrix @ self.centroids.T)
+        scores = np.zeros((len(texts), len(self.categories)), dtype=np.float64)
+        for k in range(len(self.categories)):
+            scores[:, k] = np.bincount(rows, weights=data*self.centroids[k, cols], minlength=len(texts))
+        return scores
+
+    def classify(self, records: list):
+        '''返回与 records 对齐的类别列表，类别顺序与训练时一致'''
+        if len(records) == 0:
+            return []
+        scores = self.scores([item['title'] + '\n' + item['abstract'] for item in records])
+        hits = scores >= self.thresholds
+        return [[self.categories[k] for k in np.flatnonzero(row)] for row in hits]
+
+
+def train(data_dir: str, category_words: dict, model_dir: str,
+          min_df: int=3, max_df: float=0.5, max_features: int=200000, quantile: float=0.2, min_score: float=0.05):
+    '''从 data_dir 下的全部 json 训练并保存到 model_dir，返回 CategoryClassifier'''
+    if np is None:
+        raise Exception("Category classifier requires numpy")
+    matcher = KeywordMatcher([], category_words)
+    categories = list(category_words)
+    # 同一篇论文可能在多天出现，只保留最后一次
+    docs = {}
+    for item in iter_json(data_dir):
+        docs[item['arxiv_id']] = (item['title'], item['abstract'])
+    if len(docs) == 0:
+        raise Exception(f"No paper json found in {data_dir}")
+
+    texts = [title + '\n' + abstract for title, abstract in docs.values()]
+    df = {}
+    for text in texts:
+        for term in set(tokenize(text)):
+            df[term] = df.get(term, 0) + 1
+    n = len(docs)
+    terms = [term for term, count in df.items() if count >= min_df and count <= max_df * n]
+    terms = sorted(terms, key=lambda term: (-df[term], term))[:max_features]
+    idf = np.array([math.log((1 + n) / (1 + df[term])) + 1 for term in terms], dtype=np.float32)
+
+    classifier = CategoryClassifier.from_terms(categories, terms, idf)
+    rows, cols, data = classifier._matrix(texts)
+    seeds = [matcher.categories(title) for title, _ in docs.values()]
+    seed_rows = {key: [i for i, labels in enumerate(seeds) if key in labels] for key in categories}
+    centroids = np.zeros((len(categories), len(terms)), dtype=np.float32)
+    for k, key in enumerate(categories):
+        if not seed_rows[key]:
+            continue
+        mask = np.isin(rows, seed_rows[key])
+        centroid = np.bincount(cols[mask], weights=data[mask], minlength=len(terms))
+        centroids[k] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    classifier.centroids = centroids
+
+    # 阈值: 种子论文与自身类别质心相似度的 quantile 分位数，不低于 min_score；没有种子的类别不会命中
+    scores = classifier.scores(texts)
+    classifier.thresholds = np.array([max(float(np.quantile(scores[seed_rows[key], k], quantile)), min_score)
+                                      if seed_rows[key] else 1.0 for k, key in enumerate(categories)], dtype=np.float32)
+    classifier.save(model_dir, category_words=category_words, documents=n)
+    return CategoryClassifier.load(model_dir)
+
+
+def load_or_train(model_dir: str, data_dir: str, category_words: dict, retrain: bool=False):
+    '''已有模型且类别词一致时直接读取，否则重新训练'''
+    if not retrain and CategoryClassifier.exists(model_dir):
+        with open(os.path.join(model_dir, 'meta.json'), encoding='utf-8') as f:
+            if json.load(f).get('category_words') == category_words:
+                return CategoryClassifier.load(model_dir)
+    return train(data_dir, category_words, model_dir)
+
+
+if __name__ == '__main__':
+    import time
+    from columnar_store import load_json
+
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--model', default=os.path.join(os.path.expanduser('~'), '.cache', 'arxiv', 'classifier'))
+    arg_parser.add_argument('--json', required=True, help='用于对比规则与分类器结果的某一天的 json')
+    args = arg_parser.parse_args()
+
+    classifier = CategoryClassifier.load(args.model)
+    records = load_json(args.json)
+    with open(os.path.join(args.model, 'meta.json'), encoding='utf-8') as f:
+        matcher = KeywordMatcher([], json.load(f)['category_words'])
+    start = time.perf_counter()
+    predicted = classifier.classify(records)
+    cost = time.perf_counter() - start
+    rules = [matcher.categories(item['title']) for item in records]
+    print(f"{len(records)} records, classify {cost:.3f}s")
+    print(f"{'category':24s} {'rules':>6s} {'tfidf':>6s} {'both':>6s}")
+    for key in classifier.categories + ['Other']:
+        a = [key in labels if key != 'Other' else not labels for labels in rules]
+        b = [key in labels if key != 'Other' else not labels for labels in predicted]
+        print(f"{key:24s} {sum(a):6d} {sum(b):6d} {sum(x and y for x, y in zip(a, b)):6d}")
@@ -0,0 +1,144 @@
+'''原子写文件与单天处理进度日志，中断(翻译错误、网络超时、Ctrl-C)后从断点继续
+
+AtomicFile 先写同目录下的临时文件，成功后 rename 为目标文件，失败时删除临时文件，目标文件要么是旧内容要么是完整的新内容。
+
+DayJournal 是每天一个的追加式 jsonl 日志，每条记录写入后立即 flush:
+    {"input": [size, mtime_ns]}                     输入 txt 的状态，txt 变化后日志作废
+    {"e": "<arxiv_id>:<version>", "r": 抓取结果}      替换版本抓取到的摘要与历史版本
+    {"t": "<标题哈希>", "zh": 译文}                   翻译完成的标题
+解析与整理记录不涉及网络，重新处理时 txt 仍流式解析(比读日志更快)，日志中已有的抓取结果与译文直接复用，
+只补做未完成的网络请求；当天页面写完后删除日志。
+
+用法:
+    CHECKPOINT=1 python src/main.py --min_date 240101
+    python src/checkpoint.py ~/.cache/arxiv/checkpoint     # 查看未完成的日志
+'''
+import os
+import sys
+import json
+import threading
+
+from paper_index import text_hash
+from columnar_store import source_state
+
+
+class AtomicFile:
+    '''写入临时文件，commit 时 rename 为目标文件；也可以用作 with 语句，异常时丢弃临时文件'''
+    def __init__(self, path: str, mode: str='w', encoding: str='utf-8', **kwargs) -> None:
+        self.path = path
+        self.tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self._file = open(self.tmp_path, mode=mode, encoding=encoding, **kwargs)
+
+    def write(self, content):
+        return self._file.write(content)
+
+    def writelines(self, lines):
+        return self._file.writelines(lines)
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class DayJournal:
+    '''单天的抓取与翻译进度，多线程追加时加锁，每次追加后 flush，每块写完后 sync 落盘'''
+    def __init__(self, path: str, input_file: str) -> None:
+        self.path = path
+        self.records = {}
+        self.titles = {}
+        self._lock = threading.Lock()
+        state = source_state(input_file)
+        valid = self._load(state)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, mode='a' if valid else 'w', encoding='utf-8')
+        if not valid:
+            self._append(dict(input=state))
+
+    @property
+    def resumed(self):
+        return len(self.records) + len(self.titles)
+
+    def _load(self, state: list):
+        '''读取已有日志，输入变化时返回 False；中断时写了一半的最后一行被截掉'''
+        if not os.path.exists(self.path):
+            return False
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for number, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if number == 0 and entry.get('input') != state:
+                    return False
+                if 'e' in entry:
+                    self.records[entry['e']] = entry['r']
+                elif 't' in entry:
+                    self.titles[entry['t']] = entry['zh']
+                offset += len(line)
+        if offset == 0:
+            return False
+        if offset < os.path.getsize(self.path):
+            os.truncate(self.path, offset)
+        return True
+
+    def _append(self, *entries):
+        content = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+        with self._lock:
+            self._file.write(content)
+            self._file.flush()
+
+    def get_record(self, arxiv_id: str, version: str):
+        '''日志中该版本的抓取结果，没有时返回 None'''
+        return self.records.get(f'{arxiv_id}:{version}')
+
+    def enriched(self, tasks: list, results: dict):
+        '''tasks: [(arxiv_id, url, version)]，results: {arxiv_id: 抓取结果或 Exception}，抓取失败的不记录，重新运行时再次抓取'''
+        self._append(*[dict(e=f'{arxiv_id}:{version}', r=results[arxiv_id]) for arxiv_id, _, version in tasks
+                       if arxiv_id in results and not isinstance(results[arxiv_id], Exception)])
+
+    def get_title(self, title: str):
+        return self.titles.get(text_hash(title))
+
+    def translated(self, items: list):
+        '''items: [(标题, 译文)]，空译文(翻译失败)不记录'''
+        self._append(*[dict(t=text_hash(title), zh=title_zh) for title, title_zh in items if title_zh])
+
+    def sync(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self, done: bool=False):
+        '''done 为 True 时当天已经完整输出，删除日志'''
+        self._file.close()
+        if done and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+if __name__ == '__main__':
+    journal_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.expanduser('~'), '.cache', 'arxiv', 'checkpoint')
+    names = sorted(name for name in os.listdir(journal_dir) if name.endswith('.journal')) if os.path.isdir(journal_dir) else []
+    for name in names:
+        records, titles = 0, 0
+        with open(os.path.join(journal_dir, name), 'rb') as f:
+            for line in f:
+                records += line.startswith(b'{"e"')
+                titles += line.startswith(b'{"t"')
+        print(f'{name}: {records} records, {titles} titles')
+    if not names:
+        print('no unfinished journal')
@@ -0,0 +1,277 @@
+'''按月分区的列式论文存储，列文件通过 mmap 读取，只加载需要的列
+
+目录结构:
+    <store_dir>/<yymm>/meta.json             分区元数据: 代号、行数、各列字节数、每天的行范围与来源 json 的状态
+    <store_dir>/<yymm>/<列名>.<代号>.bin      该列所有行的 utf-8 字节顺序拼接
+    <store_dir>/<yymm>/<列名>.<代号>.off      每行结束位置(uint64, 小端)
+
+新的一天直接追加到列文件末尾，meta.json 最后原子替换，中断时按 meta.json 记录的大小截断未提交的数据；
+重写已存在的一天时生成新代号的列文件，替换 meta.json 后再删除旧文件。
+
+用法:
+    python src/columnar_store.py --migrate datasets
+'''
+import os
+import sys
+import json
+import mmap
+import argparse
+from array import array
+
+COLUMNS = ('datadate', 'arxiv_id', 'url', 'title', 'submitdate', 'authors', 'abstract')
+
+
+def source_state(path: str):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class _Column:
+    '''单列的只读 mmap 视图'''
+    def __init__(self, bin_file: str, off_file: str, rows: int) -> None:
+        self.rows = rows
+        self._files = [open(bin_file, 'rb'), open(off_file, 'rb')]
+        self._data = self._map(self._files[0])
+        self._offsets = self._map(self._files[1])
+
+    @staticmethod
+    def _map(f):
+        # 空文件不能 mmap
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, start: int, end: int):
+        '''返回第 start 到 end-1 行的字符串'''
+        if end <= start:
+            return []
+        offsets = array('Q')
+        first = max(start - 1, 0)
+        offsets.frombytes(self._offsets[first*8:end*8])
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        if start == 0:
+            offsets.insert(0, 0)
+        data = self._data[offsets[0]:offsets[-1]]
+        base = offsets[0]
+        bounds = [offset - base for offset in offsets]
+        text = data.decode('utf-8')
+        if len(text) == len(data):
+            # 纯 ascii 时字节偏移就是字符偏移，整段解码一次后直接切片
+            return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+        return [data[a:b].decode('utf-8') for a, b in zip(bounds, bounds[1:])]
+
+    def close(self):
+        for view in (self._data, self._offsets):
+            if isinstance(view, mmap.mmap):
+                view.close()
+        for f in self._files:
+            f.close()
+
+
+class _Partition:
+    def __init__(self, part_dir: str) -> None:
+        self.part_dir = part_dir
+        self.meta_file = os.path.join(part_dir, 'meta.json')
+        self.meta = dict(generation=0, rows=0, sizes={}, days={})
+        self.meta_mtime = None
+        self._columns = {}
+        self.load()
+
+    def load(self):
+        self.close()
+        if os.path.exists(self.meta_file):
+            self.meta_mtime = os.stat(self.meta_file).st_mtime_ns
+            with open(self.meta_file, encoding='utf-8') as f:
+                self.meta = json.load(f)
+
+    def _path(self, column: str, suffix: str, generation: int=None):
+        generation = self.meta['generation'] if generation is None else generation
+        return os.path.join(self.part_dir, f'{column}.{generation}.{suffix}')
+
+    def _save_meta(self):
+        tmp_file = self.meta_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_file, self.meta_file)
+        self.meta_mtime = os.stat(self.meta_file).st_mtime_ns
+
+    def column(self, name: str):
+        if name not in self._columns:
+            self._columns[name] = _Column(self._path(name, 'bin'), self._path(name, 'off'), self.meta['rows'])
+        return self._columns[name]
+
+    def read(self, start: int, end: int, columns: tuple):
+        values = [self.column(name).read(start, end) for name in columns]
+        return [dict(zip(columns, row)) for row in zip(*values)]
+
+    def _append(self, records: list, generation: int, sizes: dict, rows: int):
+        '''把 records 追加到指定代号的列文件末尾，返回新的各列字节数'''
+        new_sizes = {}
+        for name in COLUMNS:
+            size = sizes.get(name, 0)
+            with open(self._path(name, 'bin', generation), 'ab') as data_file, \
+                 open(self._path(name, 'off', generation), 'ab') as off_file:
+                # 丢弃上次中断时未提交的数据
+                data_file.truncate(size)
+                off_file.truncate(rows*8)
+                offsets = array('Q')
+                chunks = []
+                for record in records:
+                    value = (record.get(name) or '').encode('utf-8')
+                    chunks.append(value)
+                    size += len(value)
+                    offsets.append(size)
+                if sys.byteorder != 'little':
+                    offsets.byteswap()
+                data_file.write(b''.join(chunks))
+                off_file.write(offsets.tobytes())
+            new_sizes[name] = size
+        return new_sizes
+
+    def write_day(self, date: str, records: list, source: list=None):
+        self.close()
+        days = self.meta['days']
+        if date not in days:
+            sizes = self._append(records, self.meta['generation'], self.meta['sizes'], self.meta['rows'])
+            rows = self.meta['rows']
+            days[date] = dict(start=rows, end=rows+len(records), source=source)
+            self.meta.update(rows=rows+len(records), sizes=sizes)
+            self._save_meta()
+            return None
+
+        # 重写: 其余日期与新数据写入新代号的列文件
+        old_generation = self.meta['generation']
+        generation = old_generation + 1
+        sizes, rows, new_days = {}, 0, {}
+        for name in COLUMNS:
+            for suffix in ('bin', 'off'):
+                open(self._path(name, suffix, generation), 'wb').close()
+        for other, entry in sorted(days.items()):
+            if other == date:
+                continue
+            part = self.read(entry['start'], entry['end'], COLUMNS)
+            sizes = self._append(part, generation, sizes, rows)
+            new_days[other] = dict(entry, start=rows, end=rows+len(part))
+            rows += len(part)
+        self.close()
+        sizes = self._append(records, generation, sizes, rows)
+        new_days[date] = dict(start=rows, end=rows+len(records), source=source)
+        self.meta = dict(generation=generation, rows=rows+len(records), sizes=sizes, days=new_days)
+        self._save_meta()
+        for name in COLUMNS:
+            for suffix in ('bin', 'off'):
+                path = self._path(name, suffix, old_generation)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def close(self):
+        for column in self._columns.values():
+            column.close()
+        self._columns = {}
+
+
+class ColumnarStore:
+    '''按月分区的列式论文存储，记录字段与每天的 json 一致
+
+    同一时间只允许一个进程写入；readonly 的实例每次访问分区时检查 meta.json 是否被其他进程更新
+    '''
+    def __init__(self, store_dir: str, readonly: bool=False) -> None:
+        self.store_dir = store_dir
+        self.readonly = readonly
+        self._partitions = {}
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _partition(self, date: str):
+        month = date[:4]
+        if month not in self._partitions:
+            part_dir = os.path.join(self.store_dir, month)
+            os.makedirs(part_dir, exist_ok=True)
+            self._partitions[month] = _Partition(part_dir)
+        partition = self._partitions[month]
+        if self.readonly and os.path.exists(partition.meta_file) \
+                and os.stat(partition.meta_file).st_mtime_ns != partition.meta_mtime:
+            partition.load()
+        return partition
+
+    def dates(self, min_date: str=None, max_date: str=None):
+        '''min_date 不包含，max_date 包含'''
+        min_date = min_date or ''
+        max_date = max_date or '999999'
+        dates = []
+        for month in sorted(os.listdir(self.store_dir)):
+            if month[:4] < min_date[:4] or month > max_date[:4]:
+                continue
+            dates.extend(d for d in self._partition(month).meta['days'] if min_date < d <= max_date)
+        return sorted(dates)
+
+    def has_day(self, date: str):
+        return date in self._partition(date).meta['days']
+
+    def is_fresh(self, date: str, json_file: str):
+        '''该天已写入且来源 json 在写入后没有变化'''
+        entry = self._partition(date).meta['days'].get(date)
+        return entry is not None and os.path.exists(json_file) and entry.get('source') == source_state(json_file)
+
+    def write_day(self, date: str, records: list, json_file: str=None):
+        if self.readonly:
+            raise Exception(f"Columnar store {self.store_dir} is readonly")
+        self._partition(date).write_day(date, records, source_state(json_file) if json_file else None)
+
+    def read_day(self, date: str, columns: tuple=COLUMNS):
+        partition = self._partition(date)
+        entry = partition.meta['days'].get(date)
+        if entry is None:
+            return []
+        return partition.read(entry['start'], entry['end'], tuple(columns))
+
+    def scan(self, columns: tuple=COLUMNS, min_date: str=None, max_date: str=None):
+        '''按日期顺序遍历日期范围内的记录，只读取 columns 中的列'''
+        for date in self.dates(min_date, max_date):
+            yield from self.read_day(date, columns)
+
+    def close(self):
+        for partition in self._partitions.values():
+            partition.close()
+
+
+def iter_json(json_file: str):
+    '''逐行读取 jsonl，不把整个文件读入内存'''
+    with open(json_file, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_json(json_file: str):
+    return list(iter_json(json_file))
+
+
+def migrate(store: ColumnarStore, data_dir: str):
+    '''把 data_dir 下的每天 json 写入列式存储，已写入且未变化的跳过'''
+    count = 0
+    for root, _, names in os.walk(data_dir):
+        for name in sorted(names):
+            if not name.endswith('.json') or not name.startswith('paper_'):
+                continue
+            json_file = os.path.join(root, name)
+            date = name[len('paper_'):-len('.json')]
+            if store.is_fresh(date, json_file):
+                continue
+            store.write_day(date, load_json(json_file), json_file)
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--store', default=os.path.join(os.path.expanduser('~'), '.cache', 'arxiv', 'columnar'))
+    arg_parser.add_argument('--migrate', default=None, help='把该目录下的 json 转换到列式存储')
+    args = arg_parser.parse_args()
+
+    store = ColumnarStore(args.store)
+    if args.migrate:
+        print(f"migrated {migrate(store, args.migrate)} days")
+    dates = store.dates()
+    print(f"{len(dates)} days in store: {dates[0] if dates else ''} ~ {dates[-1] if dates else ''}")
+    store.close()
@@ -0,0 +1,108 @@
+import re
+
+SEPARATOR = '-' * 15
+REVISED_MARK = 'replaced with revised version'
+URL_PATTERN = re.compile(r'https://arxiv.org/[^ ,]*')
+
+
+class DigestTokenizer:
+    '''按行扫描 arxiv 邮件摘要，单遍输出 date/title/authors/abstract/url，替代 PATTERN/PATTERN_revised 正则'''
+    def __init__(self) -> None:
+        self.total = 0
+        self.rejected = 0
+        self.rejected_records = []
+
+    def _reset(self):
+        self._state = 'head'
+        self._date = None
+        self._revised = False
+        self._title = []
+        self._authors = []
+        self._abstract = []
+        self._url = None
+        self._lines = []
+
+    def _emit(self):
+        self.total += 1
+        if self._date is None or not self._title or not self._authors or self._url is None:
+            content = ''.join(self._lines).strip()
+            if content:
+                self.rejected += 1
+                self.rejected_records.append(content)
+            return None
+        # 与 PATTERN_revised 保持一致: 替换版本没有摘要，abstract 组只匹配到 "Categories"
+        abstract = '\n'.join(self._abstract) if not self._revised else 'Categories'
+        return dict(
+            date=self._date.strip(),
+            title='\n'.join(self._title).strip(),
+            authors='\n'.join(self._authors).strip(),
+            abstract=abstract.strip(),
+            url=self._url.strip()
+        )
+
+    def _feed(self, line: str):
+        text = line.rstrip('\r\n')
+        state = self._state
+        if state == 'head':
+            if self._date is None:
+                pos = text.find('Date:')
+                if pos >= 0 and 'GMT' in text[pos:]:
+                    self._date = text[pos+5:text.index('GMT', pos)+3]
+                elif REVISED_MARK in text and 'GMT' in text:
+                    pos = text.index('replaced')
+                    self._date = text[pos:text.index('GMT', pos)+3]
+                    self._revised = True
+            if text.startswith('Title:'):
+                self._state = 'title'
+                self._title.append(text[6:])
+        elif state == 'title':
+            if text.startswith('Authors:'):
+                self._state = 'authors'
+                self._authors.append(text[8:])
+            else:
+                self._title.append(text)
+        elif state == 'authors':
+            if text.startswith('Categories'):
+                self._state = 'meta'
+            else:
+                self._authors.append(text)
+        elif state == 'meta':
+            if text.startswith('\\\\'):
+                if self._revised:
+                    self._state = 'tail'
+                    self._search_url(text)
+                else:
+                    self._state = 'abstract'
+                    self._abstract.append(text[2:])
+        elif state == 'abstract':
+            if text.startswith('\\\\'):
+                self._state = 'tail'
+                self._search_url(text)
+            else:
+                self._abstract.append(text)
+        elif state == 'tail':
+            self._search_url(text)
+
+    def _search_url(self, text: str):
+        if self._url is not None:
+            return None
+        result = URL_PATTERN.search(text)
+        if result:
+            self._url = result.group()
+
+    def tokenize(self, lines):
+        '''lines 可以是文件对象，逐条产出论文记录字典'''
+        self._reset()
+        for line in lines:
+            if SEPARATOR in line:
+                paper = self._emit()
+                if paper is not None:
+                    yield paper
+                self._reset()
+                continue
+            self._lines.append(line)
+            self._feed(line)
+        paper = self._emit()
+        if paper is not None:
+            yield paper
+        self._reset()
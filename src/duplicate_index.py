@@ -0,0 +1,371 @@
+'''跨天的近重复论文检测: 标题加摘要的词 3-gram 计算 MinHash 签名，LSH 分段查找候选，再用签名估计相似度确认
+
+签名与分段哈希全部用 numpy 批量计算；索引按天追加到几个定长二进制文件中，通过 mmap 分块扫描，
+查询一天时只在内存中保留当天的分段哈希与命中的候选行。
+
+目录结构:
+    <index_dir>/meta.json             行数、代号、每天的行范围与来源 json 的状态、签名参数
+    <index_dir>/bands.<代号>.u32      每行 bands 个 32 位分段哈希
+    <index_dir>/sigs.<代号>.u8        每行 num_perm 个签名值的低 8 位(b-bit MinHash)，用于估计相似度
+    <index_dir>/ids.<代号>.s16        每行的 arxiv id，定长 16 字节
+
+重写已存在的一天时旧的行只从 meta.json 中移除，新数据追加到末尾；失效的行超过一半时整体重写为新代号。
+同一时间只允许一个进程写入，readonly 的实例在 meta.json 被其他进程更新后重新加载。
+
+用法:
+    python src/duplicate_index.py --index ~/.cache/arxiv/duplicates --add datasets
+    python src/duplicate_index.py --index ~/.cache/arxiv/duplicates --json datasets/2407/paper_240701.json
+'''
+import os
+import re
+import json
+import zlib
+import bisect
+import string
+import argparse
+
+from columnar_store import load_json, source_state
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEPARATOR = '\x00'
+PUNCTUATION = str.maketrans({c: ' ' for c in string.punctuation})
+ID_WIDTH = 16
+# 每次扫描的行数
+BLOCK_ROWS = 1 << 16
+
+
+class MinHasher:
+    '''one permutation hashing 的 MinHash: 每个 shingle 只哈希一次，按哈希值分到 num_perm 个桶中取最小值，
+    空桶从右侧最近的非空桶取值(rotation densification)。bands 段每段 num_perm//bands 行'''
+    def __init__(self, num_perm: int=128, bands: int=16, shingle: int=3, seed: int=1) -> None:
+        if np is None:
+            raise Exception("Duplicate detection requires numpy")
+        assert num_perm % bands == 0, "num_perm must be a multiple of bands"
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        rng = np.random.RandomState(seed)
+        odd = lambda size: rng.randint(1, 1 << 62, size=size, dtype=np.int64).astype(np.uint64) * np.uint64(2) + np.uint64(1)
+        self._shingle_mix = odd(shingle)
+        self._band_mix = odd(self.rows)
+        self._mix, self._offset = odd(2)
+
+    def shingles(self, texts: list):
+        '''返回 (shingle 的 64 位哈希, 所属文本下标)，按文本顺序排列'''
+        words = f' {SEPARATOR} '.join(texts).lower().translate(PUNCTUATION).split()
+        # 每个单词用 crc32 得到跨进程稳定的哈希
+        day_hash = {word: zlib.crc32(word.encode('utf-8')) for word in set(words)}
+        day_hash[SEPARATOR] = -1
+        hashes = np.fromiter(map(day_hash.__getitem__, words), dtype=np.int64, count=len(words))
+        separators = hashes < 0
+        docs = np.cumsum(separators)
+        hashes, docs = hashes[~separators].astype(np.uint64), docs[~separators]
+        k = self.shingle
+        if len(hashes) < k:
+            return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+        # 连续 k 个词属于同一文本时组成一个 shingle
+        valid = docs[:len(docs)-k+1] == docs[k-1:]
+        value = np.zeros(len(hashes)-k+1, dtype=np.uint64)
+        for i in range(k):
+            value += hashes[i:len(hashes)-k+1+i] * self._shingle_mix[i]
+        return value[valid], docs[:len(docs)-k+1][valid]
+
+    def signatures(self, texts: list):
+        '''返回 (len(texts), num_perm) 的 uint32 签名，没有 shingle 的文本整行为 0xffffffff'''
+        values, docs = self.shingles(texts)
+        num_perm = self.num_perm
+        signatures = np.full((len(texts), num_perm), 0xffffffff, dtype=np.uint32)
+        if len(values) == 0:
+            return signatures
+        mixed = values * self._mix
+        bins = (mixed >> np.uint64(32)) % np.uint64(num_perm)
+        # 低位乘法结果的质量较差，取值前再混合一次
+        hashed = (mixed * self._offset) >> np.uint64(32)
+        # (文本, 桶) 放在高位、哈希值放在低 32 位，排序后每个 (文本, 桶) 的第一个即最小值
+        keys = np.sort(((docs.astype(np.uint64) * np.uint64(num_perm) + bins) << np.uint64(32)) | hashed)
+        first = np.r_[True, (keys[1:] >> np.uint64(32)) != (keys[:-1] >> np.uint64(32))]
+        cells = (keys[first] >> np.uint64(32)).astype(np.int64)
+        signatures.ravel()[cells] = (keys[first] & np.uint64(0xffffffff)).astype(np.uint32)
+
+        # 空桶取右侧(循环)最近的非空桶，加上与距离相关的偏移，避免不同桶的取值相同
+        filled = np.zeros(signatures.shape, dtype=bool)
+        filled.ravel()[cells] = True
+        columns = np.arange(2 * num_perm)
+        nearest = np.where(np.tile(filled, 2), columns, 2 * num_perm)
+        nearest = np.minimum.accumulate(nearest[:, ::-1], axis=1)[:, ::-1][:, :num_perm]
+        has_any = filled.any(axis=1)
+        distance = (nearest - columns[:num_perm])[has_any]
+        source = np.take_along_axis(signatures[has_any], nearest[has_any] % num_perm, axis=1)
+        signatures[has_any] = source + (distance * 0x9e3779b1).astype(np.uint32)
+        return signatures
+
+    def band_hashes(self, signatures):
+        '''每段 rows 个签名值合成一个 32 位哈希，(文本数, bands)'''
+        grouped = signatures.astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        mixed = (grouped * self._band_mix).sum(axis=2, dtype=np.uint64)
+        return (mixed >> np.uint64(32)).astype(np.uint32)
+
+
+def similarity(sigs_a, sigs_b):
+    '''两组 b-bit(8 位)签名逐行估计 Jaccard 相似度'''
+    match = (sigs_a == sigs_b).mean(axis=-1)
+    return np.clip((match - 1/256) / (1 - 1/256), 0, 1)
+
+
+class DuplicateIndex:
+    FILES = (('bands', 'u32'), ('sigs', 'u8'), ('ids', 's16'))
+
+    def __init__(self, index_dir: str, readonly: bool=False, threshold: float=0.8,
+                 num_perm: int=128, bands: int=16) -> None:
+        self.index_dir = index_dir
+        self.readonly = readonly
+        self.threshold = threshold
+        self.meta_file = os.path.join(index_dir, 'meta.json')
+        self.meta_mtime = None
+        os.makedirs(index_dir, exist_ok=True)
+        self.meta = dict(generation=0, rows=0, days={}, num_perm=num_perm, bands=bands)
+        self.load()
+        self.hasher = MinHasher(self.meta['num_perm'], self.meta['bands'])
+
+    def load(self):
+        if os.path.exists(self.meta_file):
+            self.meta_mtime = os.stat(self.meta_file).st_mtime_ns
+            with open(self.meta_file, encoding='utf-8') as f:
+                self.meta = json.load(f)
+
+    def _refresh(self):
+        if self.readonly and os.path.exists(self.meta_file) and os.stat(self.meta_file).st_mtime_ns != self.meta_mtime:
+            self.load()
+
+    def _path(self, name: str, suffix: str, generation: int=None):
+        generation = self.meta['generation'] if generation is None else generation
+        return os.path.join(self.index_dir, f'{name}.{generation}.{suffix}')
+
+    def _width(self, name: str):
+        return dict(bands=self.meta['bands'] * 4, sigs=self.meta['num_perm'], ids=ID_WIDTH)[name]
+
+    def _save_meta(self):
+        tmp_file = self.meta_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_file, self.meta_file)
+        self.meta_mtime = os.stat(self.meta_file).st_mtime_ns
+
+    def _map(self, name: str):
+        '''只读 mmap 已提交的行，(行数, 每行宽度)'''
+        rows = self.meta['rows']
+        dtype = dict(bands=np.uint32, sigs=np.uint8, ids=f'S{ID_WIDTH}')[name]
+        shape = (rows, self.meta['bands']) if name == 'bands' else (rows, self.meta['num_perm']) if name == 'sigs' else (rows,)
+        if rows == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self._path(name, dict(self.FILES)[name]), dtype=dtype, mode='r', shape=shape)
+
+    def _append(self, arrays: dict, generation: int, rows: int):
+        for name, suffix in self.FILES:
+            with open(self._path(name, suffix, generation), 'ab') as f:
+                # 丢弃上次中断时未提交的数据
+                f.truncate(rows * self._width(name))
+                f.write(np.ascontiguousarray(arrays[name]).tobytes())
+
+    def _live(self, max_date: str=None):
+        '''有效行的布尔数组，max_date 不为空时只包含更早的日期'''
+        live = np.zeros(self.meta['rows'], dtype=bool)
+        for date, entry in self.meta['days'].items():
+            if max_date is None or date < max_date:
+                live[entry['start']:entry['end']] = True
+        return live
+
+    def dates(self):
+        self._refresh()
+        return sorted(self.meta['days'])
+
+    def is_fresh(self, date: str, json_file: str):
+        self._refresh()
+        entry = self.meta['days'].get(date)
+        return entry is not None and os.path.exists(json_file) and entry.get('source') == source_state(json_file)
+
+    @staticmethod
+    def texts(records: list):
+        return [item['title'] + '\n' + item['abstract'] for item in records]
+
+    def add_day(self, date: str, records: list, json_file: str=None):
+        '''写入一天的记录，已存在的同一天被替换'''
+        if self.readonly:
+            raise Exception(f"Duplicate index {self.index_dir} is readonly")
+        signatures = self.hasher.signatures(self.texts(records))
+        arrays = dict(bands=self.hasher.band_hashes(signatures), sigs=(signatures & 0xff).astype(np.uint8),
+                      ids=np.array([item['arxiv_id'].encode('ascii')[:ID_WIDTH] for item in records], dtype=f'S{ID_WIDTH}'))
+        days = self.meta['days']
+        days.pop(date, None)
+        rows = self.meta['rows']
+        self._append(arrays, self.meta['generation'], rows)
+        days[date] = dict(start=rows, end=rows+len(records), source=source_state(json_file) if json_file else None)
+        self.meta['rows'] = rows + len(records)
+        self._save_meta()
+        live = sum(entry['end'] - entry['start'] for entry in days.values())
+        if live * 2 < self.meta['rows']:
+            self.compact()
+
+    def compact(self):
+        '''去掉被替换的行，写入新代号的文件'''
+        old_generation = self.meta['generation']
+        generation = old_generation + 1
+        maps = {name: self._map(name) for name, _ in self.FILES}
+        for name, suffix in self.FILES:
+            open(self._path(name, suffix, generation), 'wb').close()
+        rows, days = 0, {}
+        for date, entry in sorted(self.meta['days'].items()):
+            part = {name: array[entry['start']:entry['end']] for name, array in maps.items()}
+            self._append(part, generation, rows)
+            days[date] = dict(entry, start=rows, end=rows+entry['end']-entry['start'])
+            rows = days[date]['end']
+        del maps
+        self.meta.update(generation=generation, rows=rows, days=days)
+        self._save_meta()
+        for name, suffix in self.FILES:
+            path = self._path(name, suffix, old_generation)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def find(self, records: list, date: str):
+        '''返回与 records 对齐的列表，元素为 None 或 (arxiv_id, 日期, 相似度)
+
+        与 date 之前各天的记录比较，同一天内排在前面的记录也算；相同 arxiv id 的重复公告同样视为重复'''
+        self._refresh()
+        if len(records) == 0:
+            return []
+        signatures = self.hasher.signatures(self.texts(records))
+        empty = (signatures == 0xffffffff).all(axis=1)
+        sigs = (signatures & 0xff).astype(np.uint8)
+        nbands = self.meta['bands']
+        # 分段序号放在高 32 位，一次二分查找全部分段
+        band_ids = np.arange(nbands, dtype=np.uint64) << np.uint64(32)
+        keys = (self.hasher.band_hashes(signatures).astype(np.uint64) | band_ids).ravel()
+        key_docs = np.repeat(np.arange(len(records)), nbands)
+        valid = ~np.repeat(empty, nbands)
+        keys, key_docs = keys[valid], key_docs[valid]
+        order = np.lexsort((key_docs, keys))
+        keys, key_docs = keys[order], key_docs[order]
+        # 每个位置所在的相同键区间的结束位置
+        run_end = np.searchsorted(keys, keys, side='right')
+
+        # 候选的来源: >= 0 为索引中的行，< 0 为当天的 -(下标+1)
+        best_score = np.full(len(records), -1.0)
+        best_source = np.zeros(len(records), dtype=np.int64)
+
+        def update(docs, sources, scores):
+            docs, sources, scores = docs[scores >= self.threshold], sources[scores >= self.threshold], scores[scores >= self.threshold]
+            if len(docs) == 0:
+                return
+            order = np.lexsort((-scores, docs))
+            first = order[np.r_[True, docs[order][1:] != docs[order][:-1]]]
+            better = scores[first] > best_score[docs[first]]
+            best_score[docs[first][better]] = scores[first][better]
+            best_source[docs[first][better]] = sources[first][better]
+
+        def expand(positions, counts):
+            '''positions[i] 之后的 counts[i] 个位置'''
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            return np.repeat(positions, counts) + offsets
+
+        # 之前各天: 分块扫描索引，在当天排序后的键中二分查找
+        live = self._live(max_date=date)
+        if live.any() and len(keys):
+            index_bands, index_sigs = self._map('bands'), self._map('sigs')
+            for start in range(0, self.meta['rows'], BLOCK_ROWS):
+                end = min(start + BLOCK_ROWS, self.meta['rows'])
+                block_live = live[start:end]
+                if not block_live.any():
+                    continue
+                block_keys = (np.asarray(index_bands[start:end]).astype(np.uint64) | band_ids).ravel()
+                pos = np.searchsorted(keys, block_keys)
+                pos[pos == len(keys)] = 0
+                hit = (keys[pos] == block_keys) & np.repeat(block_live, nbands)
+                if not hit.any():
+                    continue
+                # 当天可能有多条记录的分段哈希相同，展开整个区间
+                pos = pos[hit]
+                counts = run_end[pos] - pos
+                rows = np.repeat(np.flatnonzero(hit) // nbands + start, counts)
+                docs = key_docs[expand(pos, counts)]
+                pairs = np.unique(rows * len(records) + docs)
+                rows, docs = pairs // len(records), pairs % len(records)
+                update(docs, rows, similarity(sigs[docs], np.asarray(index_sigs[rows])))
+
+        # 当天内: 同一分段哈希相同的记录两两成为候选，后面的记录重复前面的；之前各天的记录相似度相同时优先
+        counts = run_end - np.arange(len(keys)) - 1
+        if counts.any():
+            first = np.repeat(key_docs, counts)
+            second = key_docs[expand(np.arange(len(keys)) + 1, counts)]
+            pairs = np.unique(second * len(records) + first)
+            second, first = pairs // len(records), pairs % len(records)
+            pairs = first != second
+            first, second = first[pairs], second[pairs]
+            update(second, -(first + 1), similarity(sigs[second], sigs[first]))
+
+        found = [None] * len(records)
+        if (best_score >= 0).any():
+            index_ids = self._map('ids')
+            row_dates = {}
+            for other_date, entry in self.meta['days'].items():
+                if entry['end'] > entry['start']:
+                    row_dates[entry['start']] = other_date
+            starts = sorted(row_dates)
+            for doc in np.flatnonzero(best_score >= 0).tolist():
+                source, score = int(best_source[doc]), float(best_score[doc])
+                if source < 0:
+                    found[doc] = (records[-source-1]['arxiv_id'], date, score)
+                else:
+                    found[doc] = (index_ids[source].decode('ascii'), row_dates[starts[bisect.bisect_right(starts, source) - 1]], score)
+        return found
+
+    def close(self):
+        pass
+
+
+def rebuild(index: DuplicateIndex, data_dir: str, record_filter=None):
+    '''按日期顺序加入 data_dir 下尚未加入或已变化的 json，record_filter 用于只索引需要渲染的记录'''
+    days = []
+    for root, _, names in os.walk(data_dir):
+        for name in names:
+            dates = re.findall(r'\d{6}', name)
+            if name.endswith('.json') and dates:
+                days.append((dates[0], os.path.join(root, name)))
+    count = 0
+    for date, json_file in sorted(days):
+        if not index.is_fresh(date, json_file):
+            records = load_json(json_file)
+            index.add_day(date, [item for item in records if record_filter is None or record_filter(item)], json_file)
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    import time
+
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--index', default=os.path.join(os.path.expanduser('~'), '.cache', 'arxiv', 'duplicates'))
+    arg_parser.add_argument('--add', default=None, help='把该目录下尚未加入或有变化的每天 json 加入索引')
+    arg_parser.add_argument('--json', default=None, help='查找该天 json 中与之前各天重复的记录')
+    arg_parser.add_argument('--threshold', type=float, default=0.8)
+    args = arg_parser.parse_args()
+
+    index = DuplicateIndex(args.index, threshold=args.threshold)
+    if args.add:
+        start = time.perf_counter()
+        count = rebuild(index, args.add)
+        print(f"added {count} days in {time.perf_counter()-start:.2f}s, {index.meta['rows']} rows")
+    if args.json:
+        records = load_json(args.json)
+        date = re.findall(r'\d{6}', os.path.basename(args.json))[0]
+        start = time.perf_counter()
+        found = index.find(records, date)
+        print(f"{sum(x is not None for x in found)}/{len(records)} duplicates in {time.perf_counter()-start:.2f}s")
+        for item, match in zip(records, found):
+            if match is not None:
+                print(f"  {item['arxiv_id']} ~ {match[0]} ({match[1]}, {match[2]:.2f}) {item['title'][:60]}")
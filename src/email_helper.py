@@ -1,85 +1,346 @@
 import os
 import re
+import ssl
+import time
 import poplib
-from email.parser import Parser
+import socket
+import binascii
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
 from email.header import decode_header
 from email.utils import parseaddr
 from datetime import datetime
 
+from metrics import METRICS
+
+
+class UidlLedger:
+    '''记录已处理过的邮件 UIDL，每行 "uid\t状态"，状态为 ingested(已下载附件) 或 skipped(非论文邮件)'''
+    def __init__(self, ledger_file: str=None) -> None:
+        self.ledger_file = ledger_file
+        self._seen = {}
+        self._lock = threading.Lock()
+        if ledger_file and os.path.exists(ledger_file):
+            for line in open(ledger_file, encoding='utf-8'):
+                if '\t' in line:
+                    uid, status = line.rstrip('\n').split('\t', 1)
+                    self._seen[uid] = status
+        if ledger_file:
+            os.makedirs(os.path.dirname(os.path.abspath(ledger_file)), exist_ok=True)
+
+    def __contains__(self, uid):
+        return uid in self._seen
+
+    def add(self, uid: str, status: str):
+        with self._lock:
+            self._seen[uid] = status
+            if self.ledger_file:
+                with open(self.ledger_file, mode='a', encoding='utf-8') as f:
+                    f.write(f'{uid}\t{status}\n')
+
+
+# 单行响应的长度上限，邮件中的行不超过 998 字节，留足余量
+MAX_LINE = 1 << 16
+
+
+class PopSession:
+    '''只实现用到的命令的 POP3 客户端: UIDL、TOP 的多行响应一次读完(很小)，RETR 的响应逐行产出，整封邮件不在内存中
+    poplib 的 retr 会把全部行读入一个列表，逐行读取只能依赖其私有方法，这里直接按协议实现'''
+    def __init__(self, host: str, port: int=110, timeout: float=10, use_ssl: bool=False) -> None:
+        sock = socket.create_connection((host, port), timeout)
+        if use_ssl:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        self.sock = sock
+        self.file = sock.makefile('rb')
+        self.welcome = self._response()
+
+    def _readline(self):
+        line = self.file.readline(MAX_LINE + 1)
+        if not line:
+            raise poplib.error_proto('-ERR connection closed')
+        if len(line) > MAX_LINE:
+            raise poplib.error_proto('-ERR line too long')
+        if line.endswith(b'\r\n'):
+            return line[:-2]
+        return line[:-1] if line.endswith(b'\n') else line
+
+    def _response(self):
+        line = self._readline()
+        if not line.startswith(b'+'):
+            raise poplib.error_proto(line)
+        return line
+
+    def _command(self, command: str):
+        self.sock.sendall(command.encode('utf-8') + b'\r\n')
+        return self._response()
+
+    def _lines(self):
+        '''多行响应，去掉行首转义的点，读到单独的 "." 为止'''
+        while True:
+            line = self._readline()
+            if line == b'.':
+                return None
+            yield line[1:] if line.startswith(b'..') else line
+
+    def user(self, user: str):
+        return self._command(f'USER {user}')
+
+    def pass_(self, pswd: str):
+        return self._command(f'PASS {pswd}')
+
+    def stat(self):
+        parts = self._command('STAT').split()
+        return int(parts[1]), int(parts[2])
+
+    def uidl(self):
+        resp = self._command('UIDL')
+        return resp, list(self._lines()), 0
+
+    def top(self, which: int, howmany: int):
+        resp = self._command(f'TOP {which} {howmany}')
+        return resp, list(self._lines()), 0
+
+    def retr_lines(self, which: int):
+        '''发送 RETR 后返回逐行产出邮件内容的迭代器，调用方需要读完'''
+        self._command(f'RETR {which}')
+        return self._lines()
+
+    def quit(self):
+        try:
+            return self._command('QUIT')
+        finally:
+            self.file.close()
+            self.sock.close()
+
+
+class AttachmentDecoder:
+    '''按附件的传输编码逐行解码并写入文件: base64 按 4 字节对齐分块解码，quoted-printable 处理软换行，其余原样写入
+    最后一行之后的换行属于 multipart 边界，不写入'''
+    def __init__(self, att_file, encoding: str) -> None:
+        self.att_file = att_file
+        self.encoding = encoding
+        self._buffer = b''
+        self._newline = False
+
+    def write(self, line: bytes):
+        if self.encoding == 'base64':
+            self._buffer += line.strip()
+            if len(self._buffer) >= 1 << 16:
+                size = len(self._buffer) // 4 * 4
+                self.att_file.write(binascii.a2b_base64(self._buffer[:size]))
+                self._buffer = self._buffer[size:]
+            return None
+        if self._newline:
+            self.att_file.write(b'\n')
+        if self.encoding == 'quoted-printable':
+            line = line.rstrip(b' \t')
+            soft = line.endswith(b'=')
+            self.att_file.write(binascii.a2b_qp(line[:-1] if soft else line))
+            self._newline = not soft
+        else:
+            self.att_file.write(line)
+            self._newline = True
+
+    def close(self):
+        if self._buffer:
+            self.att_file.write(binascii.a2b_base64(self._buffer))
+        self._buffer = b''
+
+
+def read_headers(lines):
+    '''读取到空行为止的头部，返回 (解析后的头部, 原始行)'''
+    raw = []
+    for line in lines:
+        if not line.strip():
+            break
+        raw.append(line)
+    return BytesParser().parsebytes(b'\n'.join(raw) + b'\n\n', headersonly=True), raw
+
+
+def is_boundary(line: bytes, boundaries: list):
+    line = line.rstrip()
+    return any(line == b'--' + boundary or line == b'--' + boundary + b'--' for boundary in boundaries)
+
+
+def read_until_boundary(lines, boundaries: list, sink=None):
+    '''读到任意一层的边界行为止并返回该行，之前的行交给 sink；读到结尾时返回 None'''
+    for line in lines:
+        if line.startswith(b'--') and is_boundary(line, boundaries):
+            return line
+        if sink is not None:
+            sink(line)
+    return None
+
 
 class EmailReader:
     '''参考 https://blog.csdn.net/weixin_39146980/article/details/111180449'''
-    def __init__(self, address, auth_code, **kwargs) -> None:
-        self.email_server: poplib.POP3 = None
-        self._connet(address, auth_code, **kwargs)
+    def __init__(self, address, auth_code, ledger_file: str=None, **kwargs) -> None:
+        self.email_server: PopSession = None
+        self.ledger = UidlLedger(ledger_file)
+        self._address = address
+        self._auth_code = auth_code
+        self._kwargs = kwargs
+        self.email_server = self._connet(address, auth_code, **kwargs)
 
-    def _connet(self, address, auth_code, pop_host='pop.163.com', pop_port=110, timeout=10):
+    def _connet(self, address, auth_code, pop_host='pop.163.com', pop_port=110, timeout=10, use_ssl=False):
         try:
-            # 连接pop服务器。如果没有使用SSL，将POP3_SSL()改成POP3(),且监听端口改为：110即可
-            self.email_server = poplib.POP3(host=pop_host, port=pop_port, timeout=timeout)
+            # 连接pop服务器。使用SSL时 use_ssl=True，端口一般为 995
+            email_server = PopSession(host=pop_host, port=pop_port, timeout=timeout, use_ssl=use_ssl)
         except Exception as e:
             raise Exception(f"POP server connet failed: {e}")
 
         try:
             # 验证用户邮箱
-            self.email_server.user(address)
+            email_server.user(address)
             # 验证邮箱授权码（不是登陆密码）
-            self.email_server.pass_(auth_code)
+            email_server.pass_(auth_code)
         except Exception as e:
             raise Exception(f"Email authorized failed: {e}")
+        return email_server
+
+    @staticmethod
+    def list_uids(email_server: PopSession):
+        '''返回 [(邮件编号, uid)]'''
+        resp, lines, octets = email_server.uidl()
+        uids = []
+        for line in lines:
+            num, uid = line.decode('utf-8').split(' ', 1)
+            uids.append((int(num), uid.strip()))
+        return uids
+
+    def read_message(self, lines, part_dir: str):
+        '''逐行解析邮件: 按 multipart 边界切分，附件边接收边解码写入 part_dir，正文部分(很小)收集后解析
+        返回 (正文, 附件路径列表)'''
+        contents, parts = [], []
+        headers, raw = read_headers(lines)
+        self._read_part(headers, lines, [], part_dir, contents, parts, raw)
+        # 读完剩余的响应，之后才能发送下一条命令
+        for _ in lines:
+            pass
+        return '\n'.join(content for content in contents if content), parts
+
+    def _read_part(self, headers, lines, boundaries: list, part_dir: str, contents: list, parts: list, raw_headers: list=()):
+        '''读取一个 part 直到外层的边界行，返回该边界行，读到结尾时返回 None；raw_headers 为原始头部，用于解析正文'''
+        boundary = headers.get_boundary() if headers.get_content_maintype() == 'multipart' else None
+        if boundary:
+            inner = boundaries + [boundary.encode('utf-8')]
+            close = b'--' + inner[-1] + b'--'
+            # 跳过 preamble
+            line = read_until_boundary(lines, inner)
+            while line is not None and line.rstrip() != close and is_boundary(line, inner[-1:]):
+                sub_headers, raw = read_headers(lines)
+                line = self._read_part(sub_headers, lines, inner, part_dir, contents, parts, raw)
+            if line is not None and line.rstrip() == close:
+                # 跳过 epilogue
+                line = read_until_boundary(lines, boundaries)
+            return line
+
+        file_name = headers.get_filename()
+        if file_name is None:
+            if headers.get_content_maintype() != 'text':
+                return read_until_boundary(lines, boundaries)
+            body = []
+            line = read_until_boundary(lines, boundaries, body.append)
+            contents.append(self.parser_content(BytesParser().parsebytes(b'\n'.join(raw_headers) + b'\n\n' + b'\n'.join(body))))
+            return line
 
-    def parse_email_server(self, min_date='', part_dir: str='data'):
-        resp, mails, octets = self.email_server.list()
+        att_path = os.path.join(part_dir, file_name)
+        tmp_path = att_path + '.tmp'
+        try:
+            with METRICS.stage('email.save_attachment'), open(tmp_path, 'wb') as att_file:
+                decoder = AttachmentDecoder(att_file, headers.get('Content-Transfer-Encoding', '').strip().lower())
+                line = read_until_boundary(lines, boundaries, decoder.write)
+                decoder.close()
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, att_path)
+        parts.append(att_path)
+        METRICS.incr('email.attachments')
+        METRICS.info("附件: " + file_name + " 保存成功！")
+        return line
+
+    @staticmethod
+    def count_bytes(lines):
+        count = 0
+        for line in lines:
+            count += len(line) + 2
+            yield line
+        METRICS.incr('email.bytes', count)
+        METRICS.incr('email.messages')
+
+    def _download(self, email_server: PopSession, which: int, item: dict, part_dir: str):
+        '''逐行接收整封邮件，附件直接解码写入磁盘'''
+        with METRICS.stage('email.download'):
+            content, item['parts'] = self.read_message(self.count_bytes(email_server.retr_lines(which)), part_dir)
+        if item.get('time') is None:
+            item['content'] = content
+            item['time'] = EmailReader.parser_received_date(item['subject']+' '+item['content'][:2000])
+        return item
+
+    def _download_worker(self, tasks: list, part_dir: str):
+        '''额外的 POP 会话，按 uid 定位邮件编号后下载'''
+        email_server = self._connet(self._address, self._auth_code, **self._kwargs)
+        try:
+            nums = {uid: num for num, uid in self.list_uids(email_server)}
+            for uid, item in tasks:
+                if uid in nums:
+                    self._download(email_server, nums[uid], item, part_dir)
+        finally:
+            email_server.quit()
+
+    def parse_email_server(self, min_date='', part_dir: str='data', workers: int=1):
+        uids = self.list_uids(self.email_server)
         num, total_size = self.email_server.stat()
 
-        print("Total email count: " + str(num))
-        print(f"latest received date: {min_date}")
-
-        # mails存储了邮件编号列表，
-        index = len(mails)
-        # 倒序遍历邮件
-        for i in range(index, 0, -1):
-            item = {}
-            # 倒序遍历邮件，这样取到的第一封就是最新邮件
-            resp, lines, octets = self.email_server.retr(i)
-            # lines存储了邮件的原始文本的每一行,
-            # 邮件的原始文本:# lines是邮件内容，列表形式使用join拼成一个byte变量
-            msg_content = b'\r\n'.join(lines).decode('utf-8')
-
-            # 解析邮件:
-            msg = Parser().parsestr(msg_content)
-
-            # 解析邮件具体内容，包括正文，标题，和附件
-            # 邮件的From, To, Subject存在于根对象上:
-            # 调用解析邮件头部内容的函数
+        METRICS.info("Total email count: " + str(num))
+        METRICS.info(f"latest received date: {min_date}")
+        scan_start = time.perf_counter()
+
+        # 先用 TOP n 0 只读取邮件头判断主题，已处理过的 uid 直接跳过
+        candidates = []
+        # 倒序遍历邮件，这样取到的第一封就是最新邮件
+        for i, uid in reversed(uids):
+            if uid in self.ledger:
+                METRICS.incr('email.ledger.hit')
+                continue
+            METRICS.incr('email.ledger.miss')
+            resp, lines, octets = self.email_server.top(i, 0)
+            msg = BytesParser().parsebytes(b'\r\n'.join(lines), headersonly=True)
+            item = {'uid': uid}
             item.update(EmailReader.parser_email_header(msg))
             if 'paper_' not in item['subject']:
+                self.ledger.add(uid, 'skipped')
                 continue
-            item['content'] = self.parser_content(msg)
 
             # 获取arxiv发送时的时间，由于arxiv发送的邮件通过gmail邮件手动转发到163邮箱，因此可能存在人为的操作延迟
-            # 论文接收日期
-            received_date = EmailReader.parser_received_date(item['subject']+' '+item['content'][:2000])
-
-            item['time'] = received_date
+            # 论文接收日期优先从主题中解析，解析不到时下载全文后从正文解析
+            received_date = re.findall(r'paper_(\d{6})[^\d]', item['subject']+' ')
+            if len(received_date) == 1:
+                item['time'] = received_date[0]
+            else:
+                self._download(self.email_server, i, item, part_dir)
 
             if item['time'] <= min_date:
-                print(f"The min received date is {min_date}, but got current received date is {item['time']}, stop parse.")
+                METRICS.info(f"The min received date is {min_date}, but got current received date is {item['time']}, stop parse.")
                 break
+            candidates.append((i, uid, item))
+        METRICS.add_time('email.scan', time.perf_counter() - scan_start)
+
+        if workers > 1 and len(candidates) > 1:
+            # 多个 POP 会话并行下载，各会话分到不同的邮件
+            pending = [(uid, item) for i, uid, item in candidates if 'parts' not in item]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._download_worker, pending[k::workers], part_dir) for k in range(workers)]
+                for future in futures:
+                    future.result()
 
-            # 下载附件
-            item['parts'] = []
-            for part in msg.walk():
-                file_name = part.get_filename()
-                if file_name is None:
-                    continue
-                data = part.get_payload(decode=True)  # 下载附件
-                att_path = os.path.join(part_dir, file_name)
-                att_file = open(att_path, 'wb')
-                att_file.write(data)  # 保存附件
-                att_file.close()
-                item['parts'].append(att_path)
-                print("附件: " + file_name + " 保存成功！")
+        for i, uid, item in candidates:
+            if 'parts' not in item:
+                self._download(self.email_server, i, item, part_dir)
+            self.ledger.add(uid, 'ingested')
             yield item
 
     def close(self):
@@ -154,5 +415,5 @@ class EmailReader:
                 received_date = datetime.strftime(datetime.strptime(received_date, '%Y年%m月%d日'), '%y%m%d')
             return received_date
         except:
-            print(f"content: {content[:1000]}...")
+            METRICS.error('received_date', f"content: {content[:1000]}...")
             raise Exception("论文接收日期解析错误")
@@ -0,0 +1,250 @@
+import os
+import re
+import base64
+import imaplib
+import quopri
+import select
+from datetime import datetime
+from email.parser import BytesParser
+
+from email_helper import EmailReader, UidlLedger
+from metrics import METRICS
+
+# imaplib 默认不支持 ID 命令，163 邮箱在 SELECT 之前要求客户端上报 ID，否则返回 Unsafe Login
+imaplib.Commands.setdefault('ID', ('AUTH', 'SELECTED'))
+
+
+def parse_imap_list(data: bytes):
+    '''解析 IMAP 括号列表(如 BODYSTRUCTURE)，返回嵌套的 list，字符串为 str，NIL 为 None'''
+    pos = 0
+    stack = [[]]
+    while pos < len(data):
+        char = data[pos:pos+1]
+        if char in (b' ', b'\r', b'\n'):
+            pos += 1
+        elif char == b'(':
+            stack.append([])
+            pos += 1
+        elif char == b')':
+            if len(stack) == 1:
+                # 多出的右括号属于外层响应，解析结束
+                break
+            value = stack.pop()
+            stack[-1].append(value)
+            pos += 1
+        elif char == b'"':
+            end = pos + 1
+            value = b''
+            while data[end:end+1] != b'"':
+                if data[end:end+1] == b'\\':
+                    end += 1
+                value += data[end:end+1]
+                end += 1
+            stack[-1].append(value.decode('utf-8', errors='replace'))
+            pos = end + 1
+        elif char == b'{':
+            end = data.index(b'}', pos)
+            size = int(data[pos+1:end])
+            start = data.index(b'\n', end) + 1
+            stack[-1].append(data[start:start+size].decode('utf-8', errors='replace'))
+            pos = start + size
+        else:
+            result = re.match(rb'[^\s()"]+', data[pos:])
+            value = result.group().decode('utf-8')
+            stack[-1].append(None if value.upper() == 'NIL' else value)
+            pos += len(result.group())
+    return stack[0]
+
+
+def join_response(data: list):
+    '''将 imaplib 返回的 [(头部, 字面量), b')'] 拼回原始字节'''
+    raw = b''
+    for part in data:
+        if isinstance(part, tuple):
+            raw += part[0] + b'\r\n' + part[1]
+        elif part is not None:
+            raw += part
+    return raw
+
+
+def walk_bodystructure(structure: list, prefix: str=''):
+    '''遍历 BODYSTRUCTURE，产出 (部件编号, 类型, 编码, 文件名)'''
+    if structure and isinstance(structure[0], list):
+        for i, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            yield from walk_bodystructure(child, f'{prefix}{i+1}.')
+        return None
+    content_type = f'{structure[0]}/{structure[1]}'.lower()
+    params = structure[2] if isinstance(structure[2], list) else []
+    params = {str(params[i]).lower(): params[i+1] for i in range(0, len(params)-1, 2)}
+    file_name = params.get('name')
+    # 扩展字段中的 Content-Disposition: ("attachment" ("filename" "xxx"))
+    for field in structure[7:]:
+        if isinstance(field, list) and len(field) == 2 and isinstance(field[1], list):
+            disposition = {str(field[1][i]).lower(): field[1][i+1] for i in range(0, len(field[1])-1, 2)}
+            file_name = disposition.get('filename', file_name)
+    encoding = (structure[5] or '7bit').lower()
+    yield (prefix.rstrip('.') or '1'), content_type, encoding, file_name
+
+
+def decode_part(data: bytes, encoding: str):
+    if encoding == 'base64':
+        return base64.b64decode(data)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
+
+
+class ImapEmailReader:
+    '''基于 IMAP(SSL) 的邮件读取，接口与 EmailReader.parse_email_server 一致
+
+    - 服务端 SEARCH 按主题与日期筛选，不需要在客户端遍历整个邮箱
+    - 只获取 BODYSTRUCTURE 与附件部件 BODY.PEEK[n]，不下载整封邮件
+    - wait_for_mail 基于 IDLE 等待新邮件
+    '''
+    def __init__(self, address, auth_code, ledger_file: str=None, **kwargs) -> None:
+        self.email_server: imaplib.IMAP4 = None
+        self.ledger = UidlLedger(ledger_file)
+        self._connet(address, auth_code, **kwargs)
+
+    def _connet(self, address, auth_code, imap_host='imap.163.com', imap_port=993, timeout=10, use_ssl=True, mailbox='INBOX'):
+        try:
+            imap_class = imaplib.IMAP4_SSL if use_ssl else imaplib.IMAP4
+            self.email_server = imap_class(host=imap_host, port=imap_port, timeout=timeout)
+        except Exception as e:
+            raise Exception(f"IMAP server connet failed: {e}")
+
+        try:
+            self.email_server.login(address, auth_code)
+        except Exception as e:
+            raise Exception(f"Email authorized failed: {e}")
+
+        try:
+            self.email_server._simple_command('ID', '("name" "ArxivPaperReader" "version" "1.0")')
+        except Exception:
+            pass
+        typ, data = self.email_server.select(mailbox)
+        if typ != 'OK':
+            raise Exception(f"Select mailbox {mailbox} failed: {data}")
+        self._uidvalidity = (self.email_server.untagged_responses.get('UIDVALIDITY') or [b''])[0].decode()
+
+    def search(self, min_date: str=''):
+        '''服务端搜索主题包含 paper_ 且不早于 min_date 的邮件，返回 uid 列表(从新到旧)'''
+        criteria = ['SUBJECT', '"paper_"']
+        if min_date:
+            since = datetime.strptime(min_date, '%y%m%d').strftime('%d-%b-%Y')
+            criteria += ['SINCE', since]
+        typ, data = self.email_server.uid('SEARCH', *criteria)
+        if typ != 'OK':
+            raise Exception(f"IMAP search failed: {data}")
+        uids = [uid.decode() for uid in data[0].split()]
+        return sorted(uids, key=int, reverse=True)
+
+    def _fetch(self, uid: str, items: str):
+        with METRICS.stage('email.fetch'):
+            typ, data = self.email_server.uid('FETCH', uid, f'({items})')
+        if typ != 'OK' or not data or data[0] is None:
+            raise Exception(f"IMAP fetch {uid} {items} failed: {data}")
+        return data
+
+    def _fetch_part(self, uid: str, part: str):
+        data = self._fetch(uid, f'BODY.PEEK[{part}]')
+        for piece in data:
+            if isinstance(piece, tuple):
+                METRICS.incr('email.bytes', len(piece[1]))
+                return piece[1]
+        return b''
+
+    def parse_email_server(self, min_date='', part_dir: str='data'):
+        with METRICS.stage('email.search'):
+            uids = self.search(min_date)
+        METRICS.info(f"Matched email count: {len(uids)}")
+        METRICS.info(f"latest received date: {min_date}")
+
+        for uid in uids:
+            key = f'imap:{self._uidvalidity}:{uid}'
+            if key in self.ledger:
+                METRICS.incr('email.ledger.hit')
+                continue
+            METRICS.incr('email.ledger.miss')
+            data = self._fetch(uid, 'BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (SUBJECT FROM TO)]')
+            raw = join_response(data)
+            header = b''
+            for piece in data:
+                if isinstance(piece, tuple) and b'HEADER.FIELDS' in piece[0]:
+                    header = piece[1]
+            msg = BytesParser().parsebytes(header, headersonly=True)
+            item = {'uid': uid}
+            item.update(EmailReader.parser_email_header(msg))
+            if 'paper_' not in item['subject']:
+                # IMAP 的 SUBJECT 搜索是子串匹配，这里再确认一次
+                self.ledger.add(key, 'skipped')
+                continue
+
+            structure = parse_imap_list(raw[raw.index(b'BODYSTRUCTURE')+len(b'BODYSTRUCTURE'):])[0]
+            parts = list(walk_bodystructure(structure))
+
+            content = ''
+            received_date = re.findall(r'paper_(\d{6})[^\d]', item['subject']+' ')
+            if len(received_date) != 1:
+                for part, content_type, encoding, file_name in parts:
+                    if file_name is None and content_type in ('text/plain', 'text/html'):
+                        content = decode_part(self._fetch_part(uid, part), encoding).decode('utf-8', errors='replace')
+                        break
+            item['time'] = EmailReader.parser_received_date(item['subject']+' '+content[:2000])
+
+            if item['time'] <= min_date:
+                METRICS.info(f"The min received date is {min_date}, but got current received date is {item['time']}, stop parse.")
+                break
+
+            # 只下载附件部件
+            item['parts'] = []
+            for part, content_type, encoding, file_name in parts:
+                if file_name is None:
+                    continue
+                att_path = os.path.join(part_dir, file_name)
+                tmp_path = att_path + '.tmp'
+                with open(tmp_path, 'wb') as att_file:
+                    att_file.write(decode_part(self._fetch_part(uid, part), encoding))
+                os.replace(tmp_path, att_path)
+                item['parts'].append(att_path)
+                METRICS.incr('email.attachments')
+                METRICS.info("附件: " + file_name + " 保存成功！")
+            METRICS.incr('email.messages')
+            self.ledger.add(key, 'ingested')
+            yield item
+
+    def wait_for_mail(self, timeout: int=29*60):
+        '''发送 IDLE 等待新邮件到达，收到 EXISTS 或超时后结束 IDLE，有新邮件时返回 True'''
+        server = self.email_server
+        tag = server._new_tag()
+        server.send(tag + b' IDLE\r\n')
+        line = server.readline()
+        if not line.startswith(b'+'):
+            raise Exception(f"IMAP IDLE not supported: {line}")
+        arrived = False
+        sock = server.socket()
+        try:
+            while not arrived:
+                # SSL 连接可能已经缓存了数据，此时不需要等待 select
+                pending = getattr(sock, 'pending', lambda: 0)()
+                if not pending and not select.select([sock], [], [], timeout)[0]:
+                    break
+                line = server.readline()
+                if not line:
+                    break
+                arrived = b'EXISTS' in line
+        finally:
+            server.send(b'DONE\r\n')
+            while True:
+                line = server.readline()
+                if not line or line.startswith(tag):
+                    break
+        return arrived
+
+    def close(self):
+        try:
+            self.email_server.close()
+        finally:
+            self.email_server.logout()
@@ -0,0 +1,65 @@
+import re
+
+
+def compile_keyword(word: str):
+    '''普通关键词按子串匹配(忽略大小写)；带双引号的关键词按整词/短语匹配，例如 '"api"' 不会匹配 rapid
+
+    返回 (小写字面量, 整词正则或 None)
+    '''
+    if len(word) > 2 and word.startswith('"') and word.endswith('"'):
+        words = word[1:-1].lower().split()
+        pattern = re.compile(r'\b' + r'\s+'.join(re.escape(w) for w in words) + r'\b')
+        return ' '.join(words), pattern
+    return word.lower(), None
+
+
+class KeywordMatcher:
+    '''在 PaperParser 初始化时编译 filter_words 与 category_words，一次调用同时得到过滤结果与全部命中类别
+
+    - 关键词统一转小写并去重，同一个词出现在多个类别中只检查一次
+    - 每段文本只转一次小写，子串规则使用 str 的 in 判断(C 实现的子串查找)
+    - 整词规则先用字面量快速排除，再用正则确认边界
+    - 过滤词在标题中命中后不再扫描摘要，类别只对保留的论文计算
+
+    注: CPython 的 re 对几百个分支的合并正则、以及纯 Python 实现的 Aho-Corasick，
+    实测都比逐个子串查找慢一个数量级，因此这里没有采用。
+    '''
+    def __init__(self, filter_words: list, category_words: dict) -> None:
+        self._filter_rules = self._compile({None: filter_words})
+        self._category_rules = self._compile(category_words)
+
+    @staticmethod
+    def _compile(words_dict: dict):
+        rules = {}
+        for key, words in words_dict.items():
+            for word in words:
+                literal, pattern = compile_keyword(word)
+                labels = rules.setdefault((literal, pattern.pattern if pattern else None), (literal, pattern, []))[2]
+                if key not in labels:
+                    labels.append(key)
+        return list(rules.values())
+
+    @staticmethod
+    def _hit(text: str, literal: str, pattern):
+        return literal in text and (pattern is None or pattern.search(text) is not None)
+
+    def filter(self, *texts):
+        for text in texts:
+            text = text.lower()
+            if any(self._hit(text, literal, pattern) for literal, pattern, _ in self._filter_rules):
+                return True
+        return False
+
+    def categories(self, text: str):
+        text = text.lower()
+        labels = []
+        for literal, pattern, keys in self._category_rules:
+            if self._hit(text, literal, pattern):
+                labels.extend(key for key in keys if key not in labels)
+        return labels
+
+    def match(self, title: str, abstract: str):
+        '''过滤词作用于标题与摘要，类别只根据标题判断，返回 (是否保留, 命中类别列表)'''
+        if not self.filter(title, abstract):
+            return False, []
+        return True, self.categories(title)
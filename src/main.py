@@ -1,20 +1,63 @@
 import os
 import re
 import sys
+import time
+import argparse
 import textwrap
-from tqdm import tqdm
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from email_helper import EmailReader
-from paper_parser import PaperParser
+# 邮件、TF-IDF 分类器(numpy/scipy)、重复检测、export API 与多进程只在启用时导入，缩短没有新数据时的启动时间
+from paper_parser import PaperParser, config_hash
 from translate import YoudaoTranslator
+from abs_fetcher import AbsFetcher
+from build_manifest import BuildManifest
+from paper_index import PaperIndex
+from columnar_store import ColumnarStore, load_json
+from checkpoint import AtomicFile
+from profiles import load_profiles
+from search_index import SearchIndex, rebuild as rebuild_search_index
+from keyword_matcher import KeywordMatcher
+from metrics import METRICS
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'datasets')
 DOCS_DIR = os.path.join(BASE_DIR, 'docs', 'source')
+MANIFEST_FILE = os.path.join(BASE_DIR, 'build.manifest.json')
+# 网页端检索使用的静态索引分片
+SEARCH_EXPORT_DIR = os.path.join(DOCS_DIR, '_static', 'search')
+# 标题后标注论文之前出现过的日期
+SHOW_SEEN = os.getenv('SHOW_SEEN', '0') == '1'
+# 同时把每天的记录写入列式存储，重新渲染时优先从中读取
+COLUMNAR_STORE = os.getenv('COLUMNAR_STORE', '0') == '1'
+# 渲染 RST 时一并输出的格式，逗号分隔: feed(JSON Feed)、html(HTML 片段)
+RENDER_FORMATS = [f.strip() for f in os.getenv('RENDER_FORMATS', '').split(',') if f.strip()]
+# 大于 0 时每天拆分为汇总页与各类别的子页面，每页最多 PAGE_SIZE 篇
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 0))
+# txt 输入使用 asyncio 流水线，解析、抓取、翻译与写出重叠进行
+ASYNC_PIPELINE = os.getenv('ASYNC_PIPELINE', '0') == '1'
+# 使用 TF-IDF 分类器判断类别，模型不存在或类别词变化时用 datasets 重新训练
+CLASSIFIER = os.getenv('CLASSIFIER', '0') == '1'
+# 近重复论文的处理方式: annotate 在标题后标注最早出现的论文，collapse 不再显示，为空时不检测
+DEDUP = os.getenv('DEDUP', '')
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0.8))
+# 替换版本的摘要与版本信息通过 export API 按批查询，API 中没有的论文仍逐篇抓取 abs 页面
+ARXIV_API = os.getenv('ARXIV_API', '0') == '1'
+# 逐条记录每天的补全与翻译进度，中断后重新运行时从断点继续，适合长时间的历史数据回填
+CHECKPOINT = os.getenv('CHECKPOINT', '0') == '1'
+# 同时翻译摘要，每轮运行最多翻译 ABSTRACT_CHARS 个字符、用时 ABSTRACT_SECONDS 秒，按 ABSTRACT_PRIORITY(默认为类别顺序)优先，其余留到下一轮
+ABSTRACTS = os.getenv('ABSTRACTS', '0') == '1'
+ABSTRACT_CHARS = int(os.getenv('ABSTRACT_CHARS', 20000))
+ABSTRACT_SECONDS = float(os.getenv('ABSTRACT_SECONDS', 120))
+ABSTRACT_PRIORITY = [c.strip() for c in os.getenv('ABSTRACT_PRIORITY', '').split(',') if c.strip()]
+FEED_DIR = os.path.join(DOCS_DIR, '_static', 'feed')
+FRAGMENT_DIR = os.path.join(DOCS_DIR, '_static', 'fragments')
+# 其他主题站点的 json 配置，每个站点输出到 docs/source/<name>，与默认站点共用解析、抓取与翻译
+PROFILES = load_profiles(os.getenv('PROFILES', ''), DOCS_DIR,
+                         FEED_DIR if 'feed' in RENDER_FORMATS else None,
+                         FRAGMENT_DIR if 'html' in RENDER_FORMATS else None)
 
 if sys.platform.startswith('linux'):            # Linux
     HOME_DIR = os.path.expanduser("~")
@@ -37,16 +80,28 @@ def get_latest_date():
 
 def update_latest_date(latest_date):
     latest_file = os.path.join(BASE_DIR, 'latest.date')
-    with open(latest_file, 'w') as f:
+    with AtomicFile(latest_file) as f:
         f.write(latest_date)
 
 
-def get_save_dir(time: str):
+def add_to_toctree(index_file: str, entry: str):
+    '''把 entry 加入 index_file 第一个 toctree，条目倒序排列，已经收录的不再重写'''
+    index_lines = open(index_file).readlines()
+    if f'   {entry}\n' in index_lines:
+        return None
+    index_lines.append(f'   {entry}\n')
+    idx = index_lines.index('.. toctree::\n') + 1
+    with AtomicFile(index_file) as f:
+        f.writelines(index_lines[:idx]+['\n'])
+        f.writelines(sorted(set(index_lines[idx:]), reverse=True))
+
+
+def get_save_dir(time: str, docs_dir: str=DOCS_DIR, site_title: str=None):
     name = f'20{time[:4]}'
-    save_dir = os.path.join(DOCS_DIR, name)
+    save_dir = os.path.join(docs_dir, name)
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
-        with open(os.path.join(save_dir, 'index.rst'), 'w') as f:
+        with AtomicFile(os.path.join(save_dir, 'index.rst')) as f:
             f.write(
                 textwrap.dedent(f"""
                 {name}
@@ -58,37 +113,79 @@ def get_save_dir(time: str):
                 """).lstrip()
             )
         
+        # profile 站点第一次输出时创建站点首页
+        root_index = os.path.join(docs_dir, 'index.rst')
+        if not os.path.exists(root_index):
+            with AtomicFile(root_index) as f:
+                f.write(f"{site_title}\n{'='*len(site_title)}\n\n.. toctree::\n\n")
+
         # update root index.rst
-        index_lines = open(os.path.join(DOCS_DIR, 'index.rst')).readlines()
-        index_lines.append(f'   {name}/index\n')
-        idx = index_lines.index('.. toctree::\n') + 1
-        with open(os.path.join(DOCS_DIR, 'index.rst'), 'w') as f:
-            f.writelines(index_lines[:idx]+['\n'])
-            f.writelines(sorted(set(index_lines[idx:]), reverse=True))
+        add_to_toctree(root_index, f'{name}/index')
     return save_dir
 
 
+def prepare_output(time: str):
+    '''创建默认站点与各 profile 站点当天的目录，返回默认站点的输出文件'''
+    for profile in PROFILES:
+        get_save_dir(time, profile.output_dir, profile.name)
+        # profile 站点的首页收录在默认站点首页的目录中
+        add_to_toctree(os.path.join(DOCS_DIR, 'index.rst'),
+                       f'{os.path.relpath(profile.output_dir, DOCS_DIR)}/index'.replace(os.sep, '/'))
+    return os.path.join(get_save_dir(time), time+'.rst')
+
+
+def get_output_file(time: str):
+    return os.path.join(DOCS_DIR, f'20{time[:4]}', time+'.rst')
+
+
 def update_index(file_path: str):
     index_dir = os.path.dirname(file_path)
     file_name = os.path.basename(file_path)
 
     index_lines = open(os.path.join(index_dir, 'index.rst')).readlines()
+    # 已经收录的页面不再重写目录
+    if f'   {file_name}\n' in index_lines:
+        return None
     index_lines.append(f'   {file_name}\n')
     idx = index_lines.index('   :maxdepth: 3\n') + 1
-    with open(os.path.join(index_dir, 'index.rst'), 'w') as f:
+    with AtomicFile(os.path.join(index_dir, 'index.rst')) as f:
         f.writelines(index_lines[:idx]+['\n'])
         f.writelines(sorted(set(index_lines[idx:]), reverse=True))
 
 
-def paper_from_email(latest_date: str):
+def update_indexes(output_file: str):
+    update_index(output_file)
+    for profile in PROFILES:
+        update_index(profile.output_file(output_file))
+
+
+def get_email_reader():
     email_user = os.getenv('EMAIL_USER', None)
     auth_code = os.getenv('EMAIL_AUTH_CODE', None)
 
     assert email_user and auth_code, "Missing email user or auth code."
 
-    email_reader = EmailReader(email_user, auth_code)
-    emails = email_reader.parse_email_server(min_date=latest_date, part_dir=DATA_DIR)
-    return emails
+    # EMAIL_BACKEND 可选 pop3(默认) 或 imap
+    backend = os.getenv('EMAIL_BACKEND', 'pop3').lower()
+    if backend == 'imap':
+        from imap_helper import ImapEmailReader
+        return ImapEmailReader(email_user, auth_code,
+                               ledger_file=os.path.join(HOME_DIR, '.cache', 'email', 'imap_uid.txt'),
+                               imap_host=os.getenv('EMAIL_IMAP_HOST', 'imap.163.com'),
+                               imap_port=int(os.getenv('EMAIL_IMAP_PORT', 993)))
+    elif backend == 'pop3':
+        from email_helper import EmailReader
+        return EmailReader(email_user, auth_code,
+                           ledger_file=os.path.join(HOME_DIR, '.cache', 'email', 'uidl.txt'))
+    raise Exception(f"Unknown email backend: {backend}")
+
+
+def paper_from_email(latest_date: str, email_reader=None):
+    email_reader = email_reader or get_email_reader()
+    if os.getenv('EMAIL_BACKEND', 'pop3').lower() == 'pop3':
+        return email_reader.parse_email_server(min_date=latest_date, part_dir=DATA_DIR,
+                                               workers=int(os.getenv('POP_WORKERS', 1)))
+    return email_reader.parse_email_server(min_date=latest_date, part_dir=DATA_DIR)
 
 
 def paper_from_path(path: str, min_date: str, max_date: str=None, filetype: str='txt'):
@@ -113,39 +210,429 @@ def paper_from_path(path: str, min_date: str, max_date: str=None, filetype: str=
     return items
 
 
-if __name__=='__main__':
-    latest_date = get_latest_date()
+FILTER_WORDS = ['LLM', 'large language model']
+
+CATEGORY_WORDS = {
+    'Survey': ['survey'],
+    'Benchmark': ['benchmark'],
+    'Accelerate': ['Accelerate', 'Decoding', 'Efficient', 'Accelerating', 'KV cache'],
+    'In-Context Learning': ['In-Context Learning', 'Memory Learning'],
+    'Reasoning': ['Reasoning'],
+    'ToolUse': ['"tool"', '"tools"', '"api"', '"apis"'],
+    'Retrieval-Augmented': ['Retrieval', 'Retriever', 'RAG'],
+    'Agent': ['Agent']
+}
+
+
+def get_store_dir():
+    return os.path.join(HOME_DIR, '.cache', 'arxiv', 'columnar')
+
+
+def get_classifier_dir():
+    return os.path.join(HOME_DIR, '.cache', 'arxiv', 'classifier')
+
+
+def get_duplicates_dir():
+    return os.path.join(HOME_DIR, '.cache', 'arxiv', 'duplicates')
+
+
+def get_checkpoint_dir():
+    return os.path.join(HOME_DIR, '.cache', 'arxiv', 'checkpoint')
+
+
+def build_parser(workers: int=1, store: ColumnarStore=None):
+    # 多进程时每个进程各自限流，按进程数放大请求间隔，保证总的翻译请求速率不变
     translator = YoudaoTranslator(api_key=os.getenv('YOUDAO_API_KEY', None),
                             api_secret=os.getenv('YOUDAO_API_SECRET', None),
                             cache_dir=os.path.join(HOME_DIR, '.cache', 'youdao'),
-                            delta_t=1)
-    parser = PaperParser(
+                            delta_t=1*max(workers, 1))
+    fetch_options = dict(cache_dir=os.path.join(HOME_DIR, '.cache', 'arxiv'),
+                         max_workers=int(os.getenv('FETCH_WORKERS', 8)),
+                         per_host=max(int(os.getenv('FETCH_PER_HOST', 4))//max(workers, 1), 1))
+    if ARXIV_API:
+        from arxiv_api import ArxivApiFetcher, API_URL
+        # API 请求间隔同样按进程数放大
+        fetcher = ArxivApiFetcher(api_url=os.getenv('ARXIV_API_URL', API_URL),
+                                  interval=float(os.getenv('ARXIV_API_INTERVAL', 3))*max(workers, 1),
+                                  **fetch_options)
+    else:
+        fetcher = AbsFetcher(**fetch_options)
+    classifier, duplicates, abstracts = None, None, None
+    if ABSTRACTS:
+        from abstract_translator import AbstractScheduler
+        # 字符预算按进程数平分，各进程并行翻译，时间预算不变
+        abstracts = AbstractScheduler(translator, priority=ABSTRACT_PRIORITY or list(CATEGORY_WORDS),
+                                      max_chars=ABSTRACT_CHARS//max(workers, 1), max_seconds=ABSTRACT_SECONDS)
+    if CLASSIFIER:
+        from category_classifier import CategoryClassifier
+        classifier = CategoryClassifier.load(get_classifier_dir())
+    if DEDUP:
+        from duplicate_index import DuplicateIndex
+        # 重复检测索引只由主进程写入
+        duplicates = DuplicateIndex(get_duplicates_dir(), readonly=True, threshold=DEDUP_THRESHOLD)
+    return PaperParser(
         translator=translator,
-        category_words={
-            'Survey': ['survey'],
-            'Benchmark': ['benchmark'],
-            'Accelerate': ['Accelerate', 'Decoding', 'Efficient', 'Accelerating', 'KV cache'],
-            'In-Context Learning': ['In-Context Learning', 'Memory Learning'],
-            'Reasoning': ['Reasoning'],
-            'ToolUse': ['tool', 'api'],
-            'Retrieval-Augmented': ['Retrieval', 'Retriever', 'RAG'],
-            'Agent': ['Agent']
-        })
-
-    # items = paper_from_email(latest_date=latest_date)
-    items = paper_from_path(path=DATA_DIR, min_date=latest_date, filetype='txt')
-    max_date = latest_date
-    for item in tqdm(items, position=0, desc=f'Processing', leave=False, colour='green', ncols=80):
+        fetcher=fetcher,
+        index=PaperIndex(os.path.join(HOME_DIR, '.cache', 'arxiv', 'papers.sqlite')),
+        show_seen=SHOW_SEEN,
+        store=store,
+        feed_dir=FEED_DIR if 'feed' in RENDER_FORMATS else None,
+        html_dir=FRAGMENT_DIR if 'html' in RENDER_FORMATS else None,
+        page_size=PAGE_SIZE,
+        async_pipeline=ASYNC_PIPELINE,
+        pipeline_options=dict(translate_concurrency=int(os.getenv('TRANSLATE_WORKERS', 2))),
+        classifier=classifier,
+        duplicates=duplicates,
+        dedup_mode=DEDUP or 'annotate',
+        checkpoint_dir=get_checkpoint_dir() if CHECKPOINT else None,
+        profiles=PROFILES,
+        abstracts=abstracts,
+        filter_words=FILTER_WORDS,
+        category_words=CATEGORY_WORDS)
+
+
+_worker_parser: PaperParser = None
+_worker_run: float = None
+
+
+def _init_worker(workers: int, quiet: bool=False, profile_stages: list=None, profile_dir: str=None):
+    global _worker_parser
+    METRICS.quiet = quiet
+    if profile_stages:
+        METRICS.enable_profile(profile_stages, profile_dir)
+    # 列式存储只由主进程写入，子进程只读
+    store = ColumnarStore(get_store_dir(), readonly=True) if COLUMNAR_STORE else None
+    _worker_parser = build_parser(workers, store)
+
+
+def process_item(item: dict, output_file: str, run: float=None):
+    '''在子进程中解析一天的论文，只写当天的 json 与 rst，不修改 index.rst 与 latest.date；同时返回这一天的指标与没有译文的标题、摘要数供主进程合并
+    run 为这一轮的开始时间，新一轮的第一天恢复摘要翻译的预算'''
+    global _worker_run
+    if _worker_parser.abstracts is not None and run != _worker_run:
+        _worker_parser.abstracts.reset()
+        _worker_run = run
+    METRICS.reset()
+    start = time.time()
+    error = None
+    try:
+        _worker_parser.extra_paper(input_file=item['parts'][0], output_file=output_file, title=item['time'], date=item['time'])
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    if METRICS.profile_dir:
+        METRICS.dump_profiles(suffix=f'.{os.getpid()}')
+    return time.time() - start, error, METRICS.snapshot(), dict(_worker_parser.untranslated)
+
+
+def create_executor(workers: int):
+    from concurrent.futures import ProcessPoolExecutor
+    initargs = (workers, METRICS.quiet, sorted(METRICS.profile_stages), METRICS.profile_dir)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs)
+
+
+def run_parallel(items: list, latest_date: str, workers: int, summary: bool=False, on_done=None, executor=None):
+    '''多进程并行处理多天，主进程按日期顺序更新 index.rst 与 latest.date，失败的日期之后不再推进 latest.date
+    on_done 返回 False 的日期(需要下一轮重新渲染)同样停止推进 latest.date
+    传入 executor 时复用其中已初始化的子进程，不传时新建并在结束后关闭'''
+    from tqdm import tqdm
+    for item in items:
         if len(item['parts']) == 0:
-            print("未发现附件", item)
-            continue
-        # print('============', item['time'], '============')
-        save_dir = get_save_dir(item['time'])
-        output_file = os.path.join(save_dir, item['time']+'.rst')
-        parser.extra_paper(input_file=item['parts'][0], output_file=output_file, title=item['time'], date=item['time'])
+            METRICS.error('no_attachment', f"未发现附件 {item}")
+    items = [item for item in items if len(item['parts']) > 0]
+    max_date = latest_date
+    failed = []
+    held = False
+    start = time.time()
+    own_executor = executor is None
+    executor = executor or create_executor(workers)
+    try:
+        futures = []
+        for item in items:
+            output_file = prepare_output(item['time'])
+            futures.append((item, output_file, executor.submit(process_item, item, output_file, start)))
+
+        for item, output_file, future in tqdm(futures, position=0, desc=f'Processing', leave=False, colour='green', ncols=80, disable=METRICS.quiet):
+            cost, error, snapshot, item['untranslated'] = future.result()
+            METRICS.merge(snapshot)
+            METRICS.add_time('day', cost)
+            if error is not None:
+                failed.append(item['time'])
+                METRICS.error('day', f"处理失败 {item['time']}: {error}")
+                continue
+            update_indexes(output_file)
+            if on_done is not None and on_done(item, output_file) is False:
+                held = True
+            if summary:
+                print(f"{item['time']} 完成, 耗时 {cost:.1f}s")
+            if not failed and not held and item['time'] > max_date:
+                max_date = item['time']
+                update_latest_date(latest_date=max_date)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    METRICS.incr('days.processed', len(items))
+    METRICS.incr('days.failed', len(failed))
+    METRICS.info(f"共处理 {len(items)} 天, 失败 {len(failed)} 天, 总耗时 {time.time()-start:.1f}s, latest.date: {max_date}")
+    if failed:
+        METRICS.info("失败日期: " + ' '.join(failed))
+    return max_date
+
+
+class Runner:
+    '''单次运行与常驻服务共用的状态: 检索索引、匹配器、build manifest、列式存储、重复检测索引、
+    PaperParser(翻译缓存与 HTTP 会话)、子进程池与邮箱连接都只创建一次，每次 run_once 只处理新增或变化的日期'''
+    def __init__(self, args) -> None:
+        self.args = args
+        self.rebuild = args.rebuild
+        # 正在处理的这一轮中还没有完成的天数
+        self.queued = 0
+
+        # 全文检索索引，每天处理完成后增量加入当天的 json
+        self.search_index = SearchIndex(os.path.join(HOME_DIR, '.cache', 'arxiv', 'search.sqlite'))
+        self.search_matcher = KeywordMatcher(FILTER_WORDS, CATEGORY_WORDS)
+        if not self.search_index.dates():
+            with METRICS.stage('search.rebuild'):
+                rebuild_search_index(self.search_index, DATA_DIR, self.search_category)
+                self.search_index.export(SEARCH_EXPORT_DIR)
+        self.search_terms = set()
+        self.search_dates = set()
+        # 重新索引的日期中旧记录所在的文档分片
+        self.search_buckets = set()
+
+        # 子进程直接读取训练好的模型，训练只在主进程中进行
+        classifier_version = None
+        if CLASSIFIER:
+            from category_classifier import load_or_train
+            with METRICS.stage('classifier.load'):
+                classifier_version = load_or_train(get_classifier_dir(), DATA_DIR, CATEGORY_WORDS).version
+
+        # 先补齐之前各天的签名，并行处理时每天的结果不依赖其他进程的完成顺序
+        self.duplicates = None
+        if DEDUP:
+            from duplicate_index import DuplicateIndex, rebuild as rebuild_duplicates
+            self.duplicates = DuplicateIndex(get_duplicates_dir(), threshold=DEDUP_THRESHOLD)
+            with METRICS.stage('dedup.rebuild'):
+                rebuild_duplicates(self.duplicates, DATA_DIR, lambda item: self.search_matcher.filter(item['title'], item['abstract']))
+
+        abstracts = None
+        if ABSTRACTS:
+            from abstract_translator import AbstractScheduler
+            abstracts = AbstractScheduler(None, priority=ABSTRACT_PRIORITY or list(CATEGORY_WORDS)).config()
+        self.config = config_hash(FILTER_WORDS, CATEGORY_WORDS, SHOW_SEEN, PAGE_SIZE, classifier_version,
+                                  f'{DEDUP}:{DEDUP_THRESHOLD}' if DEDUP else None, PROFILES,
+                                  abstracts)
+        # --watermark 时按 latest.date 扫描 datasets 目录，否则只重建输入文件或解析配置发生变化的日期
+        self.manifest = None if args.watermark else BuildManifest(MANIFEST_FILE, DATA_DIR)
+        self.store = ColumnarStore(get_store_dir()) if COLUMNAR_STORE else None
+        self._parser = None
+        self._executor = None
+        self._email_reader = None
+
+    def search_category(self, item):
+        passed, categories = self.search_matcher.match(item['title'], item['abstract'])
+        return categories if passed else []
+
+    @property
+    def parser(self):
+        if self._parser is None:
+            self._parser = build_parser(store=self.store)
+        return self._parser
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = create_executor(self.args.workers)
+        return self._executor
+
+    def fetch_email(self):
+        '''把新邮件中的摘要附件下载到 datasets；IMAP 连接常驻复用，POP3 只有重新登录才能看到新邮件，每次用完即关闭'''
+        try:
+            if self._email_reader is None:
+                self._email_reader = get_email_reader()
+            with METRICS.stage('email.fetch'):
+                items = list(paper_from_email(get_latest_date(), self._email_reader))
+        except Exception:
+            self.close_email()
+            raise
+        if os.getenv('EMAIL_BACKEND', 'pop3').lower() == 'pop3':
+            self.close_email()
+        METRICS.incr('email.items', len(items))
+        return items
+
+    def wait_for_mail(self, timeout: int):
+        '''IMAP 连接上用 IDLE 等待新邮件，有新邮件时返回 True；不支持时返回 None，由调用方按计划轮询'''
+        if self._email_reader is None or not hasattr(self._email_reader, 'wait_for_mail'):
+            return None
+        try:
+            return self._email_reader.wait_for_mail(timeout)
+        except Exception as e:
+            METRICS.error('email_idle', e)
+            self.close_email()
+            return None
+
+    def close_email(self):
+        if self._email_reader is not None:
+            try:
+                self._email_reader.close()
+            except Exception:
+                pass
+            self._email_reader = None
+
+    def pending(self):
+        '''需要处理的日期，格式与 paper_from_path 一致'''
+        latest_date = get_latest_date()
+        if self.manifest is None:
+            return paper_from_path(path=DATA_DIR, min_date=self.args.min_date or latest_date, max_date=self.args.max_date, filetype='txt')
+        self.manifest.scan()
+        if not self.manifest.exists:
+            self.manifest.bootstrap(latest_date, self.config, get_output_file)
+            self.manifest.save()
+        items = self.manifest.pending(self.config, get_output_file, min_date=self.args.min_date, max_date=self.args.max_date, rebuild=self.rebuild)
+        # --rebuild 只对第一轮生效，常驻时之后只处理新的变化
+        self.rebuild = False
+        return items
+
+    def on_done(self, item, output_file):
+        '''登记完成的一天，返回 False 表示 --watermark 时 latest.date 不能越过这一天'''
+        self.queued = max(self.queued - 1, 0)
+        # 有标题翻译失败或摘要留到下一轮时不登记为完成，下一轮从 json 重新渲染这一天:
+        # 使用 manifest 时记录为 :incomplete，--watermark 时 latest.date 停在这一天之前
+        untranslated = item.get('untranslated') or {}
+        incomplete = any(untranslated.values())
+        if untranslated.get('titles'):
+            METRICS.info(f"{item['time']}: {untranslated['titles']} 个标题翻译失败，下一轮重新翻译")
+        if untranslated.get('abstracts'):
+            METRICS.info(f"{item['time']}: {untranslated['abstracts']} 篇摘要留到下一轮翻译")
+        if self.manifest is not None:
+            config = f"{self.config}:incomplete" if incomplete else self.config
+            with METRICS.stage('manifest.record'):
+                self.manifest.record(item['time'], config, output_file)
+                self.manifest.save()
+        json_file = re.sub(r'\.txt$', '.json', item['parts'][0])
+        if self.store is not None and not self.store.is_fresh(item['time'], json_file):
+            with METRICS.stage('store.write'):
+                self.store.write_day(item['time'], load_json(json_file), json_file)
+        if self.duplicates is not None and not self.duplicates.is_fresh(item['time'], json_file):
+            with METRICS.stage('dedup.add_day'):
+                records = [r for r in load_json(json_file) if self.search_matcher.filter(r['title'], r['abstract'])]
+                self.duplicates.add_day(item['time'], records, json_file)
+        with METRICS.stage('search.add_day'):
+            terms, buckets = self.search_index.add_day(json_file, item['time'], self.search_category)
+        self.search_terms.update(terms)
+        self.search_buckets.update(buckets)
+        self.search_dates.add(item['time'])
+        return self.manifest is not None or not incomplete
+
+    def process(self, items: list):
+        items = list(items)
+        self.queued = len(items)
+        try:
+            if self.args.workers > 1:
+                run_parallel(items, get_latest_date(), workers=self.args.workers, summary=self.args.summary,
+                             on_done=self.on_done, executor=self.executor)
+            else:
+                self.process_sequential(items)
+        finally:
+            self.queued = 0
+
+    def process_sequential(self, items: list):
+        from tqdm import tqdm
+        max_date = get_latest_date()
+        held = False
+        for item in tqdm(items, position=0, desc=f'Processing', leave=False, colour='green', ncols=80, disable=METRICS.quiet):
+            if len(item['parts']) == 0:
+                METRICS.error('no_attachment', f"未发现附件 {item}")
+                continue
+            # print('============', item['time'], '============')
+            start = time.time()
+            output_file = prepare_output(item['time'])
+            with METRICS.stage('day'):
+                self.parser.extra_paper(input_file=item['parts'][0], output_file=output_file, title=item['time'], date=item['time'])
+            METRICS.incr('days.processed')
+            item['untranslated'] = dict(self.parser.untranslated)
+
+            update_indexes(output_file)
+            if not self.on_done(item, output_file):
+                held = True
+
+            if not held and item['time'] > max_date:
+                max_date = item['time']
+                update_latest_date(latest_date=max_date)
+            if self.args.summary:
+                print(f"{item['time']} 完成, 耗时 {time.time()-start:.1f}s")
+
+    def finish(self):
+        '''导出受影响的检索分片，写运行报告'''
+        # 只重写受影响的静态索引分片
+        if self.search_dates:
+            with METRICS.stage('search.export'):
+                self.search_index.export(SEARCH_EXPORT_DIR, self.search_terms, self.search_dates, self.search_buckets)
+            self.search_terms, self.search_dates, self.search_buckets = set(), set(), set()
+
+        args = self.args
+        if args.profile:
+            METRICS.dump_profiles()
+        if args.report:
+            os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+            METRICS.write_json(args.report, args=vars(args), latest_date=get_latest_date())
+        if args.prometheus:
+            METRICS.write_prometheus(args.prometheus)
+
+    def run_once(self):
+        '''拉取邮件(--email)、处理待处理的日期并导出，返回处理的天数'''
+        if self._parser is not None and self._parser.abstracts is not None:
+            self._parser.abstracts.reset()
+        try:
+            if self.args.email:
+                self.fetch_email()
+            items = self.pending()
+            self.process(items)
+        finally:
+            self.finish()
+        return len(items)
+
+    def latest_date(self):
+        return get_latest_date()
+
+    def close(self):
+        self.close_email()
+        if self._executor is not None:
+            self._executor.shutdown()
+        if self._parser is not None and self._parser.translator is not None:
+            self._parser.translator.close()
+        self.search_index.close()
+
+
+if __name__=='__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--workers', type=int, default=1, help='并行处理的进程数, 1 表示逐天顺序处理')
+    arg_parser.add_argument('--summary', action='store_true', help='输出每天的处理耗时与汇总')
+    arg_parser.add_argument('--watermark', action='store_true', help='按 latest.date 扫描 datasets 目录，不使用 build manifest；有翻译未完成的日期时 latest.date 停在这一天之前')
+    arg_parser.add_argument('--rebuild', action='store_true', help='忽略 build manifest 记录，重建日期范围内的全部文件')
+    arg_parser.add_argument('--min_date', default=None, help='只处理该日期之后的数据(不包含)，例如 240101')
+    arg_parser.add_argument('--max_date', default=None, help='只处理该日期及之前的数据，例如 240630')
+    arg_parser.add_argument('--quiet', action='store_true', help='不输出进度条与提示信息，只在运行报告中记录')
+    arg_parser.add_argument('--report', default=os.path.join(HOME_DIR, '.cache', 'arxiv', 'run_report.json'), help='json 运行报告')
+    arg_parser.add_argument('--prometheus', default=None, help='同时输出 Prometheus 文本格式的指标，例如 /var/lib/node_exporter/arxiv.prom')
+    arg_parser.add_argument('--profile', default=None, help='逗号分隔的阶段名称(如 parse.tokenize,render.write)，* 表示全部，对这些阶段启用 cProfile')
+    arg_parser.add_argument('--profile_dir', default=os.path.join(HOME_DIR, '.cache', 'arxiv', 'profile'))
+    arg_parser.add_argument('--email', action='store_true', help='处理前先从邮箱下载新的摘要附件到 datasets')
+    arg_parser.add_argument('--daemon', action='store_true', help='常驻运行，按 --interval 轮询(IMAP 时用 IDLE 等待)新的摘要')
+    arg_parser.add_argument('--interval', type=int, default=600, help='常驻时两次轮询的间隔秒数')
+    arg_parser.add_argument('--status_port', type=int, default=None, help='常驻时在该端口提供 /health 状态接口，POST /run 立即触发一轮')
+    args = arg_parser.parse_args()
 
-        update_index(file_path=output_file)
+    METRICS.quiet = args.quiet
+    if args.profile:
+        METRICS.enable_profile(args.profile.split(','), args.profile_dir)
 
-        if item['time'] > max_date:
-            max_date = item['time']
-            update_latest_date(latest_date=max_date)
+    runner = Runner(args)
+    try:
+        if args.daemon:
+            from service import Service
+            Service(runner, interval=args.interval, status_port=args.status_port).serve_forever()
+        else:
+            runner.run_once()
+    finally:
+        runner.close()
@@ -0,0 +1,178 @@
+'''运行指标: 各阶段耗时、计数、HTTP 延迟直方图与错误，输出 json 运行报告或 Prometheus 文本格式
+
+用法:
+    from metrics import METRICS
+
+    with METRICS.stage('render.translate'):
+        ...
+    METRICS.incr('translate.cache_hit', len(cached))
+    METRICS.observe('youdao', cost)
+    METRICS.error('abs_fetch', f"{arxiv_id}: {e}")
+'''
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# HTTP 延迟直方图的桶(秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_ERROR_MESSAGES = 100
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # quiet 为 True 时不再输出进度条与提示信息，错误只记录到报告中
+        self.quiet = False
+        self.profile_stages = set()
+        self.profile_dir = None
+        self._profiles = {}
+        self._profiling = False
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages = {}
+            self.counters = {}
+            self.histograms = {}
+            self.errors = []
+
+    def enable_profile(self, stages: list, profile_dir: str):
+        '''对指定阶段启用 cProfile，'*' 表示所有阶段；同一时间只分析一个阶段，嵌套阶段不重复分析'''
+        self.profile_stages = set(stages)
+        self.profile_dir = profile_dir
+        os.makedirs(profile_dir, exist_ok=True)
+
+    def _want_profile(self, name: str):
+        return self.profile_dir and not self._profiling and ('*' in self.profile_stages or name in self.profile_stages) \
+            and threading.current_thread() is threading.main_thread()
+
+    @contextmanager
+    def stage(self, name: str):
+        profile = None
+        if self._want_profile(name):
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield None
+        finally:
+            cost = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+            self.add_time(name, cost)
+
+    def add_time(self, name: str, cost: float, calls: int=1):
+        with self._lock:
+            stage = self.stages.setdefault(name, dict(calls=0, seconds=0.0, max=0.0))
+            stage['calls'] += calls
+            stage['seconds'] += cost
+            stage['max'] = max(stage['max'], cost)
+
+    def incr(self, name: str, value: int=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.setdefault(name, dict(buckets=[0]*len(LATENCY_BUCKETS), count=0, sum=0.0))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+
+    def error(self, name: str, message: str=''):
+        self.incr(f'errors.{name}')
+        with self._lock:
+            if len(self.errors) < MAX_ERROR_MESSAGES:
+                self.errors.append(dict(name=name, message=str(message)[:500]))
+        if not self.quiet:
+            print(f"ERROR [{name}] {message}")
+
+    def info(self, message: str):
+        if not self.quiet:
+            print(message)
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(dict(stages=self.stages, counters=self.counters,
+                                              histograms=self.histograms, errors=self.errors)))
+
+    def merge(self, snapshot: dict):
+        '''合并子进程的指标'''
+        for name, stage in snapshot.get('stages', {}).items():
+            with self._lock:
+                current = self.stages.setdefault(name, dict(calls=0, seconds=0.0, max=0.0))
+                current['calls'] += stage['calls']
+                current['seconds'] += stage['seconds']
+                current['max'] = max(current['max'], stage['max'])
+        for name, value in snapshot.get('counters', {}).items():
+            self.incr(name, value)
+        with self._lock:
+            for name, histogram in snapshot.get('histograms', {}).items():
+                current = self.histograms.setdefault(name, dict(buckets=[0]*len(LATENCY_BUCKETS), count=0, sum=0.0))
+                current['buckets'] = [a + b for a, b in zip(current['buckets'], histogram['buckets'])]
+                current['count'] += histogram['count']
+                current['sum'] += histogram['sum']
+            self.errors.extend(snapshot.get('errors', [])[:max(MAX_ERROR_MESSAGES - len(self.errors), 0)])
+
+    def dump_profiles(self, suffix: str=''):
+        '''把各阶段累计的 cProfile 结果写入 profile_dir/<阶段><suffix>.prof，可用 snakeviz 或 pstats 查看'''
+        for name, profile in self._profiles.items():
+            profile.dump_stats(os.path.join(self.profile_dir, f'{name}{suffix}.prof'))
+
+    def report(self, **extra):
+        report = dict(started=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+                      elapsed=time.time() - self.started, **extra)
+        report.update(self.snapshot())
+        # 常用的比例直接算好
+        ratios = {}
+        for prefix in sorted(set(name.rsplit('.', 1)[0] for name in self.counters if name.endswith(('.hit', '.miss')))):
+            hit, miss = self.counters.get(f'{prefix}.hit', 0), self.counters.get(f'{prefix}.miss', 0)
+            if hit + miss:
+                ratios[f'{prefix}.hit_ratio'] = hit / (hit + miss)
+        report['ratios'] = ratios
+        return report
+
+    def write_json(self, path: str, **extra):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(**extra), f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def write_prometheus(self, path: str, prefix: str='arxiv'):
+        '''node_exporter textfile collector 格式'''
+        snapshot = self.snapshot()
+        # 同一指标的样本必须连续输出
+        lines = [f'# TYPE {prefix}_stage_seconds_total counter']
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds_total{{stage="{name}"}} {stage["seconds"]:.6f}')
+        lines.append(f'# TYPE {prefix}_stage_calls_total counter')
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append(f'{prefix}_stage_calls_total{{stage="{name}"}} {stage["calls"]}')
+        lines.append(f'# TYPE {prefix}_events_total counter')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+        lines.append(f'# TYPE {prefix}_http_latency_seconds histogram')
+        for name, histogram in sorted(snapshot['histograms'].items()):
+            for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+                lines.append(f'{prefix}_http_latency_seconds_bucket{{name="{name}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_http_latency_seconds_bucket{{name="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{prefix}_http_latency_seconds_sum{{name="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'{prefix}_http_latency_seconds_count{{name="{name}"}} {histogram["count"]}')
+        lines.append(f'# TYPE {prefix}_last_run_timestamp_seconds gauge')
+        lines.append(f'{prefix}_last_run_timestamp_seconds {time.time():.0f}')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+# 进程内共享的默认实例
+METRICS = Metrics()
@@ -0,0 +1,113 @@
+import os
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+
+def text_hash(text: str):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:16]
+
+
+class PaperIndex:
+    '''以 arxiv id 为键的全局论文索引(SQLite, WAL)，跨天复用已获取的版本、历史、摘要与标题译文
+
+    字段:
+        version:       最新已知版本标识(提交或替换时间 YYYYmmddHHMMSS，可直接比较大小)
+        history:       提交历史
+        abstract:      zlib 压缩后的摘要
+        abstract_hash: 摘要哈希
+        title_hash:    标题哈希，标题变化后译文失效
+        title_zh:      标题译文
+        dates:         出现过的数据日期，逗号分隔
+        source:        版本信息的来源，abs 为 abs 页面(完整历史)，api 为 export API(只有首末两个版本)
+    '''
+    def __init__(self, db_file: str, timeout: int=30) -> None:
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS paper ('
+            'arxiv_id TEXT PRIMARY KEY, version TEXT, history TEXT, abstract BLOB, abstract_hash TEXT, '
+            "title_hash TEXT, title_zh TEXT, dates TEXT NOT NULL DEFAULT '', source TEXT NOT NULL DEFAULT 'abs')"
+        )
+        # 旧版本创建的索引没有 source 列，其中的记录都来自 abs 页面
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(paper)')]
+        if 'source' not in columns:
+            self._conn.execute("ALTER TABLE paper ADD COLUMN source TEXT NOT NULL DEFAULT 'abs'")
+
+    @staticmethod
+    def _row_to_entry(row):
+        arxiv_id, version, history, abstract, abstract_hash, title_hash, title_zh, dates, source = row
+        return dict(
+            arxiv_id=arxiv_id,
+            version=version,
+            history=history or '',
+            abstract=zlib.decompress(abstract).decode('utf-8') if abstract else '',
+            abstract_hash=abstract_hash,
+            title_hash=title_hash,
+            title_zh=title_zh,
+            dates=[d for d in dates.split(',') if d],
+            source=source
+        )
+
+    def get_many(self, arxiv_ids: list):
+        arxiv_ids = list(dict.fromkeys(arxiv_ids))
+        result = {}
+        with self._lock:
+            for i in range(0, len(arxiv_ids), 500):
+                chunk = arxiv_ids[i:i+500]
+                marks = ','.join('?'*len(chunk))
+                for row in self._conn.execute(f'SELECT * FROM paper WHERE arxiv_id IN ({marks})', chunk):
+                    result[row[0]] = self._row_to_entry(row)
+        return result
+
+    def get(self, arxiv_id: str):
+        return self.get_many([arxiv_id]).get(arxiv_id)
+
+    def _execute_many(self, sql: str, rows: list):
+        if len(rows) == 0:
+            return None
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.execute('COMMIT')
+            except Exception as e:
+                self._conn.execute('ROLLBACK')
+                raise e
+
+    def update_versions(self, papers: list):
+        '''papers: [dict(arxiv_id, version, history, abstract, date, source)]，只在版本前进时覆盖版本信息，日期总是追加
+        同一版本的 abs 页面结果会替换 API 的结果'''
+        rows = []
+        for paper in papers:
+            abstract = paper.get('abstract') or ''
+            rows.append((paper['arxiv_id'], paper['version'], paper.get('history', ''),
+                         zlib.compress(abstract.encode('utf-8')) if abstract else None,
+                         text_hash(abstract) if abstract else None, paper['date'], paper.get('source', 'abs')))
+        newer = ("(excluded.version > COALESCE(version, '') "
+                 "OR (excluded.version = version AND source = 'api' AND excluded.source != 'api'))")
+        self._execute_many(
+            "INSERT INTO paper (arxiv_id, version, history, abstract, abstract_hash, dates, source) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(arxiv_id) DO UPDATE SET "
+            f"version=CASE WHEN {newer} THEN excluded.version ELSE version END, "
+            f"history=CASE WHEN {newer} THEN excluded.history ELSE history END, "
+            f"abstract=CASE WHEN {newer} THEN excluded.abstract ELSE abstract END, "
+            f"abstract_hash=CASE WHEN {newer} THEN excluded.abstract_hash ELSE abstract_hash END, "
+            f"source=CASE WHEN {newer} THEN excluded.source ELSE source END, "
+            "dates=CASE WHEN instr(',' || dates || ',', ',' || excluded.dates || ',') > 0 THEN dates "
+            "WHEN dates = '' THEN excluded.dates ELSE dates || ',' || excluded.dates END",
+            rows)
+
+    def update_titles(self, titles: list):
+        '''titles: [(arxiv_id, title, title_zh)]'''
+        rows = [(title_zh, text_hash(title), arxiv_id) for arxiv_id, title, title_zh in titles if title_zh]
+        self._execute_many('UPDATE paper SET title_zh=?, title_hash=? WHERE arxiv_id=?', rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
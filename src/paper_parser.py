@@ -1,11 +1,21 @@
 import os
 import re
 import json
-import requests
-from lxml import etree
-from tqdm import tqdm
+import time
+import hashlib
+import itertools
 
 from translate import YoudaoTranslator
+from digest_tokenizer import DigestTokenizer
+from abs_fetcher import AbsFetcher, get_version_tag
+from profiles import Profile
+from abstract_translator import AbstractScheduler
+from paper_record import Paper, as_papers, intern_categories
+from paper_index import PaperIndex, text_hash
+from columnar_store import ColumnarStore, iter_json, load_json
+from checkpoint import AtomicFile, DayJournal
+from metrics import METRICS
+from renderer import RstSink, PagedRstSink, JsonFeedSink, HtmlSink, render, remove_pages, output_path
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 CACHE_DIR = os.path.join(BASE_DIR, '.cache')
@@ -26,9 +36,18 @@ TEMPLATE = """
 ------------
 """.strip()
 
+# 翻译摘要时译文作为摘要之后的一段，预算内没有完成的为空
+TEMPLATE_ABSTRACT = TEMPLATE.replace('{abstract}', '{abstract}\n\n{abstract_zh}')
+
+
+def html_tree(byte_content):
+    # lxml 在第一次解析 abs 页面时才导入
+    from lxml import etree
+    return etree.HTML(byte_content) if isinstance(byte_content, (bytes, str)) else byte_content
+
 
 def parse_abstract(byte_content):
-    e_html = etree.HTML(byte_content)
+    e_html = html_tree(byte_content)
     elements = e_html.xpath("//blockquote[@class='abstract mathjax']")
 
     abstract = ''
@@ -39,7 +58,7 @@ def parse_abstract(byte_content):
 
 
 def parse_history(byte_content):
-    e_html = etree.HTML(byte_content)
+    e_html = html_tree(byte_content)
     elements = e_html.xpath("//div[@class='submission-history']")
 
     text = ''
@@ -55,134 +74,449 @@ def parse_history(byte_content):
     return history.strip()
 
 
+def parse_abs_page(byte_content):
+    # 只构建一次 HTML 树，同时提取摘要与历史版本
+    e_html = html_tree(byte_content)
+    return dict(abstract=parse_abstract(e_html), history=parse_history(e_html))
+
+
+def config_hash(filter_words: list, category_words: dict, show_seen: bool=False, page_size: int=0, classifier: str=None, dedup: str=None, profiles: list=None, abstracts: dict=None):
+    '''影响 json 渲染结果的配置: 过滤词、类别词、模板、分页大小、分类模型版本、重复论文的处理方式、其他站点(Profile)与摘要翻译'''
+    config = dict(filter_words=filter_words, category_words=category_words, template=TEMPLATE)
+    if show_seen:
+        config['show_seen'] = True
+    if page_size > 0:
+        config['page_size'] = page_size
+    if classifier:
+        config['classifier'] = classifier
+    if dedup:
+        config['dedup'] = dedup
+    if profiles:
+        config['profiles'] = [profile.config() for profile in profiles]
+    if abstracts:
+        config['abstracts'] = abstracts
+    return hashlib.md5(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
 class PaperParser:
     def __init__(self,
                  translator: YoudaoTranslator=None,
                  filter_words: list=['LLM', 'large language model'],
-                 category_words: dict={}) -> None:
+                 category_words: dict={},
+                 fetcher: AbsFetcher=None,
+                 index: PaperIndex=None,
+                 show_seen: bool=False,
+                 store: ColumnarStore=None,
+                 feed_dir: str=None,
+                 html_dir: str=None,
+                 page_size: int=0,
+                 async_pipeline: bool=False,
+                 pipeline_options: dict=None,
+                 classifier=None,
+                 duplicates=None,
+                 dedup_mode: str='annotate',
+                 checkpoint_dir: str=None,
+                 chunk_size: int=1000,
+                 profiles: list=None,
+                 abstracts: AbstractScheduler=None) -> None:
         self.translator = translator
+        self.fetcher = fetcher or AbsFetcher(cache_dir=os.path.join(CACHE_DIR, 'abs'))
         self.filter_words = filter_words
         self.category_words = category_words
-    
-    def update_insert_file(self, filepth, title, items):
-        if filepth is None or len(items) == 0:
+        # 第一个 profile 是默认站点，其余站点共用解析、抓取与翻译，只各自过滤与渲染
+        self.profiles = [Profile('default', filter_words, category_words, feed_dir=feed_dir, html_dir=html_dir)] + list(profiles or [])
+        self.matcher = self.profiles[0].matcher
+        # 全局 arxiv id 索引，show_seen 为 True 时在标题后标注之前出现过的日期
+        self.index = index
+        self.show_seen = show_seen
+        # 可选的列式存储，json 未变化时直接从中读取，写 json 时同步写入
+        self.store = store
+        # 同时输出 JSON Feed 与 HTML 片段的目录，None 表示不输出
+        self.feed_dir = feed_dir
+        self.html_dir = html_dir
+        # 大于 0 时当天页面只保留链接，每个类别按 page_size 拆分为子页面
+        self.page_size = page_size
+        # txt 输入使用 asyncio 流水线: 解析、抓取、翻译与写出重叠进行
+        self.async_pipeline = async_pipeline
+        self.pipeline_options = pipeline_options or {}
+        # 设置 CategoryClassifier 时类别由 TF-IDF 分类器根据标题与摘要判断，不再使用标题的子串规则
+        self.classifier = classifier
+        # 设置 DuplicateIndex 时查找与之前各天(及当天前面)近重复的论文，annotate 在标题后标注，collapse 直接去掉
+        if dedup_mode not in ('annotate', 'collapse'):
+            raise Exception(f"Unknown dedup mode {dedup_mode}, expected annotate or collapse")
+        self.duplicates = duplicates
+        self.dedup_mode = dedup_mode
+        # 设置 checkpoint_dir 时逐条记录抓取与翻译的进度，中断后重新处理当天只补做未完成的网络请求
+        self.checkpoint_dir = checkpoint_dir
+        # txt 按块流式解析、抓取与写出，内存占用与当天的论文数无关
+        self.chunk_size = chunk_size
+        # 设置 AbstractScheduler 时在预算内翻译摘要
+        self.abstracts = abstracts
+        # 最近一次 extra_paper 中翻译失败的标题数与留到下一轮的摘要数，不为 0 时这一天需要重新渲染
+        self.untranslated = dict(titles=0, abstracts=0)
+
+    def config_hash(self):
+        return config_hash(self.filter_words, self.category_words, self.show_seen, self.page_size,
+                           self.classifier.version if self.classifier is not None else None,
+                           self.dedup_config(), self.profiles[1:],
+                           self.abstracts.config() if self.abstracts is not None else None)
+
+    def dedup_config(self):
+        if self.duplicates is None:
+            return None
+        return f'{self.dedup_mode}:{self.duplicates.threshold}'
+
+    def open_journal(self, input_file: str):
+        if self.checkpoint_dir is None:
             return None
-        head_content = []
-        end_head = False
-        last_content = []
-        with open(filepth, "r", encoding='utf-8') as file:
-            for line in file:
-                if not end_head:
-                    head_content.append(line)
+        name = os.path.splitext(os.path.basename(input_file))[0]
+        journal = DayJournal(os.path.join(self.checkpoint_dir, name + '.journal'), input_file)
+        if journal.resumed:
+            METRICS.incr('checkpoint.resumed_records', len(journal.records))
+            METRICS.incr('checkpoint.resumed_titles', len(journal.titles))
+            METRICS.info(f"从断点继续 {name}: 已抓取 {len(journal.records)} 篇, 已翻译 {len(journal.titles)} 个标题")
+        return journal
+
+    def extra_paper_from_json(self, input_file: str, output_file: str, title: str=None, date: str=None, journal: DayJournal=None):
+        if self.store is not None and not self.store.readonly and date and not self.store.is_fresh(date, input_file):
+            with METRICS.stage('render.read_json'):
+                records = load_json(input_file)
+            with METRICS.stage('store.write'):
+                self.store.write_day(date, records, input_file)
+        else:
+            # 逐行读取，过滤时只保留命中关键词的记录
+            records = iter_json(input_file)
+        self.render_papers(records, output_file, title, os.path.basename(input_file), journal)
+
+    def extra_paper_from_store(self, date: str, output_file: str, title: str=None):
+        '''从列式存储读取当天记录并渲染，不需要逐行解析 json'''
+        with METRICS.stage('store.read'):
+            records = self.store.read_day(date)
+        self.render_papers(records, output_file, title, f'paper_{date}')
+
+    def route_records(self, records):
+        '''一遍扫描把记录分发给各站点，返回与 self.profiles 对齐的 Paper 列表；records 可以是逐条产出 Paper 或 dict 的迭代器
+        默认站点直接在记录上写入命中的类别，其余站点使用带各自类别的副本'''
+        routed = [[] for _ in self.profiles]
+        extra = list(enumerate(self.profiles[1:], 1))
+        count = 0
+        with METRICS.stage('render.filter'):
+            for item in as_papers(records):
+                count += 1
+                if self.classifier is not None:
+                    if self.matcher.filter(item.title, item.abstract):
+                        routed[0].append(item)
                 else:
-                    last_content.append(line)
-                if '======' in line:
-                    end_head = True
-        all_content = ''.join(head_content)
-        all_content += '\n\n' + f'**{title}({len(items)})**' + '\n\n'
-        all_content += '\n\n'.join(items) + '\n'
-        all_content += ''.join(last_content)
-        with open(filepth, "w", encoding='utf-8') as file:
-            file.write(all_content)
-
-    def add_category_items(self, category_items, content, item):
-        added = False
-        for key, items in category_items.items():
-            words = self.category_words[key]
-            if any([w.lower() in content.lower() for w in words]):
-                items.append(item)
-                added = True
-        return added
-
-    def extra_paper_from_json(self, input_file: str, output_file: str, title: str=None):
-        lines = open(input_file, encoding='utf-8').readlines()
-        file_name = os.path.basename(input_file)
-        outfile = open(output_file, mode='w', encoding='utf-8')
-        outfile.write(f"{title}\n========\n\n")
-        outfile.flush()
+                    passed, categories = self.matcher.match(item.title, item.abstract)
+                    if passed:
+                        item.categories = intern_categories(categories)
+                        routed[0].append(item)
+                for i, profile in extra:
+                    passed, categories = profile.matcher.match(item.title, item.abstract)
+                    if passed:
+                        routed[i].append(item.copy(categories))
+        if self.classifier is not None:
+            with METRICS.stage('render.classify'):
+                for item, categories in zip(routed[0], self.classifier.classify(routed[0])):
+                    item.categories = intern_categories(categories)
+        METRICS.incr('render.records', count)
+        METRICS.incr('render.papers', len(routed[0]))
+        for i, profile in extra:
+            METRICS.incr(f'profile.{profile.name}.papers', len(routed[i]))
+        return routed
 
-        category_items = {key: [] for key in self.category_words.keys()}
-        other_items = []
+    def translate_routed(self, routed: list, journal: DayJournal=None):
+        '''各站点的论文按 (arxiv id, 标题) 合并后一起翻译，返回 (与 routed 对齐的译文列表, 全局索引中已有的条目)'''
+        if len(routed) == 1:
+            titles_zh, known = self.translate_titles(routed[0], journal)
+            return [titles_zh], known
+        union = {}
+        for papers in routed:
+            for item in papers:
+                union.setdefault((item.arxiv_id, item.title), item)
+        METRICS.incr('profile.shared_titles', sum(len(papers) for papers in routed) - len(union))
+        titles_zh, known = self.translate_titles(list(union.values()), journal)
+        translated = dict(zip(union, titles_zh))
+        return [[translated[(item.arxiv_id, item.title)] for item in papers] for papers in routed], known
 
-        index_contents = []
+    def translate_abstracts(self, routed: list):
+        '''各站点的论文按 (arxiv id, 摘要) 合并，按类别优先级在预算内翻译摘要并写入 abstract_zh，返回留到下一轮的篇数'''
+        if self.abstracts is None:
+            return 0
+        union, ranks = {}, {}
+        for papers in routed:
+            for item in papers:
+                key = (item.arxiv_id, item.abstract)
+                union.setdefault(key, []).append(item)
+                rank = self.abstracts.rank(item.categories)
+                ranks[key] = min(ranks.get(key, rank), rank)
+        with METRICS.stage('render.translate_abstracts'):
+            results = self.abstracts.translate([key[1] for key in union], [ranks[key] for key in union])
+        for items, abstract_zh in zip(union.values(), results):
+            for item in items:
+                item.abstract_zh = abstract_zh or ''
+        deferred = results.count(None)
+        self.untranslated['abstracts'] += deferred
+        return deferred
 
-        for content in tqdm(lines, position=1, desc=file_name, leave=False, colour='green', ncols=80):
-            item = json.loads(content.strip())
-            # 只考虑包含关键词的
-            title_abstract = item['title'].lower() + '\n' + item['abstract'].lower()
-            if not any([kw.lower() in title_abstract for kw in self.filter_words]):
+    def count_untranslated(self, routed: list, titles: list):
+        '''记录翻译失败的标题数，同一篇论文在多个站点中只计一次'''
+        if self.translator is None:
+            return 0
+        failed = {(item.arxiv_id, item.title) for papers, titles_zh in zip(routed, titles)
+                  for item, title_zh in zip(papers, titles_zh) if not title_zh}
+        self.untranslated['titles'] += len(failed)
+        return len(failed)
+
+    def translate_titles(self, papers: list, journal: DayJournal=None):
+        '''返回 (与 papers 对齐的标题译文, 全局索引中已有的条目)'''
+        # 全局索引中标题未变化的直接使用已有译文
+        with METRICS.stage('index.read'):
+            known = self.index.get_many([item.arxiv_id for item in papers]) if self.index is not None else {}
+        titles_zh = [''] * len(papers)
+        pending = []
+        for i, item in enumerate(papers):
+            entry = known.get(item.arxiv_id)
+            if entry and entry['title_zh'] and entry['title_hash'] == text_hash(item.title):
+                titles_zh[i] = entry['title_zh']
+            elif journal is not None and journal.get_title(item.title):
+                titles_zh[i] = journal.get_title(item.title)
+            else:
+                pending.append(i)
+        METRICS.incr('index.title.hit', len(papers) - len(pending))
+        METRICS.incr('index.title.miss', len(pending))
+
+        # 其余标题批量翻译，记录进度时按块翻译，每块完成后写入日志
+        step = self.chunk_size if journal is not None else len(pending)
+        try:
+            for start in range(0, len(pending) if self.translator is not None else 0, max(step, 1)):
+                part = pending[start:start+step]
+                with METRICS.stage('render.translate'):
+                    translations = self.translator.translate_batch(texts=[papers[i].title for i in part])
+                for i, title_zh in zip(part, translations):
+                    titles_zh[i] = title_zh
+                if self.index is not None:
+                    with METRICS.stage('index.write'):
+                        self.index.update_titles([(papers[i].arxiv_id, papers[i].title, titles_zh[i]) for i in part])
+                if journal is not None:
+                    journal.translated([(papers[i].title, titles_zh[i]) for i in part])
+        except Exception as e:
+            METRICS.error('translate', e)
+        return titles_zh, known
+
+    def mark_duplicates(self, papers: list, titles_zh: list):
+        '''查找近重复的论文，collapse 时返回去掉重复后的 (papers, titles_zh)，annotate 时在译文后标注'''
+        date = papers[0].datadate if papers else None
+        if self.duplicates is None or not date:
+            return papers, titles_zh
+        with METRICS.stage('render.dedup'):
+            found = self.duplicates.find(papers, date)
+        METRICS.incr('dedup.duplicates', sum(match is not None for match in found))
+        if self.dedup_mode == 'collapse':
+            kept = [i for i, match in enumerate(found) if match is None]
+            METRICS.incr('dedup.collapsed', len(papers) - len(kept))
+            return [papers[i] for i in kept], [titles_zh[i] for i in kept]
+        titles_zh = list(titles_zh)
+        for i, match in enumerate(found):
+            if match is None:
                 continue
-            item.pop('datadate')
-            title_zh = ''
-            try:
-                if self.translator is not None:
-                    title_zh = self.translator.translate(text=item['title'])
-            except Exception as e:
-                print(f"translate error {e}")
-            out_content = TEMPLATE.format(title_zh=title_zh, **item)
-            added = self.add_category_items(category_items, item['title'], out_content)
-            if not added:
-                other_items.append(out_content)
-                index_contents.append(f"`[{item['arxiv_id']}] {item['title']} <{item['url']}>`__ {title_zh}".strip())
-        
-        category_items['Other'] = other_items
-        category_items['Index'] = index_contents
-        for key, items in category_items.items():
-            if len(items) == 0:
+            arxiv_id, d, _ = match
+            where = f' on :doc:`{d} </20{d[:4]}/{d}>`' if d != date else ''
+            titles_zh[i] = f'{titles_zh[i]} (duplicate of [{arxiv_id}]{where})'.strip()
+        return papers, titles_zh
+
+    def write_pages(self, papers: list, titles_zh: list, known: dict, output_file: str, title: str=None, profile: Profile=None):
+        '''output_file 为默认站点的页面，profile 为其他站点时写到该站点目录下的同名页面'''
+        profile = profile or self.profiles[0]
+        if profile is self.profiles[0]:
+            # 重复检测索引只收录默认站点的论文
+            papers, titles_zh = self.mark_duplicates(papers, titles_zh)
+        else:
+            output_file = profile.output_file(output_file)
+            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        for item, title_zh in zip(papers, titles_zh):
+            datadate = item.datadate or ''
+            entry = known.get(item.arxiv_id)
+            if self.show_seen and entry:
+                seen = [d for d in entry['dates'] if d < datadate]
+                if seen:
+                    links = ', '.join(f':doc:`{d} <{profile.doc_path(d)}>`' for d in seen)
+                    title_zh = f'{title_zh} (previously seen on {links})'.strip()
+            item.title_zh = title_zh
+
+        # RST 之外的格式按配置写入各自目录，文件名与页面一致
+        name = os.path.splitext(os.path.basename(output_file))[0]
+        template = TEMPLATE_ABSTRACT if self.abstracts is not None else TEMPLATE
+        # 各 sink 在构造时打开临时文件，之后的 sink 构造失败时丢弃已经打开的
+        sinks = []
+        try:
+            if self.page_size > 0:
+                sinks.append(PagedRstSink(output_file, template, self.page_size))
+            else:
+                remove_pages(output_file)
+                sinks.append(RstSink(output_file, template))
+            if profile.feed_dir:
+                sinks.append(JsonFeedSink(output_path(profile.feed_dir, name, '.json')))
+            if profile.html_dir:
+                sinks.append(HtmlSink(output_path(profile.html_dir, name, '.html')))
+        except BaseException:
+            for sink in sinks:
+                sink.abort()
+            raise
+        with METRICS.stage('render.write'):
+            render(papers, title, list(profile.category_words.keys()), sinks)
+        METRICS.incr('render.bytes', os.path.getsize(output_file))
+
+    def render_papers(self, records, output_file: str, title: str=None, file_name: str='', journal: DayJournal=None):
+        self.render_routed(self.route_records(records), output_file, title, journal)
+
+    def render_routed(self, routed: list, output_file: str, title: str=None, journal: DayJournal=None):
+        '''翻译 route_records 分发后的论文并写出各站点的页面'''
+        titles, known = self.translate_routed(routed, journal)
+        self.count_untranslated(routed, titles)
+        self.translate_abstracts(routed)
+        for profile, papers, titles_zh in zip(self.profiles, routed, titles):
+            self.write_pages(papers, titles_zh, known, output_file, title, profile)
+
+    def clean_record(self, paper: dict, result, date: str=None):
+        '''把摘要邮件中的一条论文整理为 Paper 记录，result 为替换版本抓取到的 abs 页面信息
+        返回 (记录, 写入全局索引的版本信息)，抓取失败时版本信息为 None'''
+        title = paper['title'].replace('\n', '').replace('  ', ' ')
+        authors = ' '.join([a.strip() for a in paper['authors'].split('\n')])
+        abstract = ''.join([a.strip()+'\n' if a.strip().endswith('.') else a.strip()+' ' for a in paper['abstract'].strip().split('\n')]).strip()
+        history = ''
+        version = None
+        if 'replaced with revised version' in paper['date']:
+            if isinstance(result, Exception):
+                METRICS.error('abs_fetch', f"获取历史版本信息错误 {title}: {result}")
+            else:
+                abstract = result['abstract']
+                history = result['history']
+                version = dict(arxiv_id=paper['arxiv_id'], version=paper['version'], history=history, abstract=abstract, date=date,
+                               source=result.get('source', 'abs'))
+        else:
+            version = dict(arxiv_id=paper['arxiv_id'], version=paper['version'], abstract=abstract, date=date)
+        submitdate = paper['date']
+        if history:
+            submitdate = submitdate + '\n    ' + history.replace('\n', '\n    ')
+        item = Paper(
+            datadate=date,
+            arxiv_id=paper['arxiv_id'],
+            url=paper['url'],
+            title=title,
+            submitdate=submitdate,
+            authors=authors,
+            abstract=abstract
+        )
+        return item, version
+
+    def revised_tasks(self, papers: list, journal: DayJournal=None):
+        '''替换版本中全局索引里版本没有前进的或进度日志中已经抓取的直接复用，返回 (已有结果, 需要抓取的 [(arxiv_id, url, version)])
+        来源不被当前抓取器接受的(关闭 ARXIV_API 后 API 的结果)重新抓取'''
+        with METRICS.stage('index.read'):
+            known = self.index.get_many([paper['arxiv_id'] for paper in papers]) if self.index is not None else {}
+        tasks = []
+        revised = {}
+        for paper in papers:
+            if 'replaced with revised version' not in paper['date']:
                 continue
-            sub_title = f'{key} ({len(items)})'
-            overline = '-'*len(sub_title)
-            outfile.write(f'{overline}\n{sub_title}\n{overline}\n\n')
-            outfile.write('\n\n'.join(items)+'\n\n')
-            outfile.flush()
-        outfile.close()
+            entry = known.get(paper['arxiv_id'])
+            record = journal.get_record(paper['arxiv_id'], paper['version']) if journal is not None else None
+            if entry and entry['abstract'] and entry['version'] >= paper['version'] and self.fetcher.accepts(entry):
+                revised[paper['arxiv_id']] = dict(abstract=entry['abstract'], history=entry['history'], source=entry['source'])
+            elif record is not None and self.fetcher.accepts(record):
+                revised[paper['arxiv_id']] = record
+            else:
+                tasks.append((paper['arxiv_id'], paper['url'], paper['version']))
+        METRICS.incr('index.version.hit', len(revised))
+        METRICS.incr('index.version.miss', len(tasks))
+        return revised, tasks
 
     def extra_paper(self, input_file: str, output_file: str, title: str=None, date: str=None):
+        self.untranslated = dict(titles=0, abstracts=0)
         if input_file.endswith('.json'):
-            self.extra_paper_from_json(input_file, output_file, title)
+            if self.store is not None and date and self.store.is_fresh(date, input_file):
+                self.extra_paper_from_store(date, output_file, title)
+            else:
+                self.extra_paper_from_json(input_file, output_file, title, date)
+            return None
+        if self.async_pipeline:
+            from async_pipeline import AsyncPipeline
+            AsyncPipeline(self, parse_abs_page, **self.pipeline_options).run(input_file, output_file, date)
             return None
 
-        lines = open(input_file, encoding='utf-8').readlines()
-        text = ''.join(lines)
-        text_list = re.split('---------------+', text)
-
-        all_out = open(input_file.replace('.txt', '.json'), mode='w', encoding='utf-8')
-        redundant = ''
+        from tqdm import tqdm
+        tokenizer = DigestTokenizer()
         file_name = os.path.basename(input_file)
-        for content in tqdm(text_list, position=1, desc=file_name, leave=False, colour='green', ncols=80):
-            result = PATTERN.match(content)
-            result = result or PATTERN_revised.match(content)
-            if result:
-                paper = result.groupdict()
-                paper = {k: v.strip() for k, v in paper.items()}
-                title = paper['title'].replace('\n', '').replace('  ', ' ')
-                authors = ' '.join([a.strip() for a in paper['authors'].split('\n')])
-                abstract = ''.join([a.strip()+'\n' if a.strip().endswith('.') else a.strip()+' ' for a in paper['abstract'].strip().split('\n')]).strip()
-                history = ''
-                if 'replaced with revised version' in paper['date']:
-                    try:
-                        response = requests.get(url=paper['url'], timeout=5)
-                        abstract = parse_abstract(response.content)
-                        history = parse_history(response.content)
-                    except Exception as e:
-                        print("获取历史版本信息错误", title)
-                        print("错误异常信息", e)
-                arxiv_id = re.findall('https://arxiv.org/abs/(\d+\.\d+)', paper['url'])[0]
-                submitdate = paper['date']
-                if history:
-                    submitdate = submitdate + '\n    ' + history.replace('\n', '\n    ')
-                item = dict(
-                    datadate=date,
-                    arxiv_id=arxiv_id,
-                    url=paper['url'],
-                    title=title,
-                    submitdate=submitdate,
-                    authors=authors,
-                    abstract=abstract
-                )
-                all_out.write(json.dumps(item)+'\n')
-        print("\n-------------------------------- Redundant --------------------------------")
-        print(redundant.strip())
-        print("---------------------------------------------------------------------------\n")
-        all_out.close()
-        self.extra_paper_from_json(input_file.replace('.txt', '.json'), output_file, date)
+        json_file = input_file.replace('.txt', '.json')
+        journal = self.open_journal(input_file)
+        # 写 json 的同时过滤，记录以 Paper 在各阶段之间传递，不再从 json 读回；列式存储需要当天的全部记录
+        keep = self.store is not None and not self.store.readonly and date
+        records, routed = [], [[] for _ in self.profiles]
+        count = 0
+        progress = tqdm(position=1, desc=file_name, leave=False, colour='green', ncols=80, disable=METRICS.quiet)
+        try:
+            # 按块流式处理: 解析一块、抓取其中的替换版本、写出一块，json 写完后才替换原文件
+            with open(input_file, encoding='utf-8') as infile, AtomicFile(json_file) as all_out:
+                stream = tokenizer.tokenize(infile)
+                while True:
+                    start = time.perf_counter()
+                    papers = list(itertools.islice(stream, self.chunk_size))
+                    for paper in papers:
+                        paper['arxiv_id'] = re.findall(r'https://arxiv.org/abs/(\d+\.\d+)', paper['url'])[0]
+                        paper['version'] = get_version_tag(paper['date'])
+                    METRICS.add_time('parse.tokenize', time.perf_counter() - start)
+                    if not papers:
+                        break
+                    count += len(papers)
+
+                    # 替换版本中全局索引里版本没有前进的或日志中已抓取的直接复用，其余并发抓取 abs 页面
+                    revised, tasks = self.revised_tasks(papers, journal)
+                    with METRICS.stage('parse.fetch_abs'):
+                        fetched = self.fetcher.fetch_all(tasks, parse_abs_page)
+                    if journal is not None:
+                        journal.enriched(tasks, fetched)
+                    revised.update(fetched)
+
+                    start = time.perf_counter()
+                    items, versions = [], []
+                    for paper in papers:
+                        item, version = self.clean_record(paper, revised.get(paper['arxiv_id']), date)
+                        items.append(item)
+                        if version is not None:
+                            versions.append(version)
+                    all_out.write(''.join(item.to_json()+'\n' for item in items))
+                    METRICS.add_time('parse.write_json', time.perf_counter() - start)
+                    if self.index is not None:
+                        with METRICS.stage('index.write'):
+                            self.index.update_versions(versions)
+                    if keep:
+                        records += items
+                    for i, chunk in enumerate(self.route_records(items)):
+                        routed[i] += chunk
+                    progress.update(len(items))
+            if journal is not None:
+                journal.sync()
+            METRICS.incr('parse.bytes', os.path.getsize(input_file))
+            METRICS.incr('parse.records', count)
+            METRICS.incr('parse.rejected', tokenizer.rejected)
+            self.report_rejected(tokenizer)
+            if keep:
+                with METRICS.stage('store.write'):
+                    self.store.write_day(date, records, json_file)
+                records = []
+            self.render_routed(routed, output_file, date, journal)
+        except BaseException:
+            if journal is not None:
+                journal.close()
+            raise
+        finally:
+            progress.close()
+        if journal is not None:
+            journal.close(done=True)
+
+    def report_rejected(self, tokenizer: DigestTokenizer):
+        redundant = '\n\n'.join(tokenizer.rejected_records)
+        METRICS.info(f"\n--------------------------- Redundant ({tokenizer.rejected}/{tokenizer.total}) ---------------------------")
+        METRICS.info(redundant.strip())
+        METRICS.info("---------------------------------------------------------------------------\n")
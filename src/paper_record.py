@@ -0,0 +1,86 @@
+'''论文记录: 带 __slots__ 的 Paper，在解析、过滤、翻译与渲染之间传递，不再经过 json 文本中转
+
+- 没有实例 __dict__，每条记录只占固定的槽位
+- 日期、作者与类别组合驻留(intern)，同一天或多天中重复出现的字符串只保存一份
+- json 字段与顺序和之前的 dict 记录一致，写出的 json 逐字节相同
+- 提供只读的 mapping 接口(item['title']、item.get('abstract'))，列式存储、分类器与重复检测可以同时接受 Paper 与 json 读出的 dict
+'''
+import sys
+import json
+
+# 写入 json 与列式存储的字段，顺序与 json 中一致
+FIELDS = ('datadate', 'arxiv_id', 'url', 'title', 'submitdate', 'authors', 'abstract')
+
+_categories = {}
+
+
+def intern_categories(categories):
+    '''相同的类别组合共用一个 tuple'''
+    key = tuple(categories)
+    return _categories.setdefault(key, key)
+
+
+class Paper:
+    __slots__ = FIELDS + ('categories', 'title_zh', 'abstract_zh')
+
+    def __init__(self,
+                 datadate: str,
+                 arxiv_id: str,
+                 url: str,
+                 title: str,
+                 submitdate: str,
+                 authors: str,
+                 abstract: str,
+                 categories: tuple=(),
+                 title_zh: str='',
+                 abstract_zh: str='') -> None:
+        self.datadate = sys.intern(datadate) if datadate else datadate
+        self.arxiv_id = arxiv_id
+        self.url = url
+        self.title = title
+        self.submitdate = submitdate
+        self.authors = sys.intern(authors) if authors else authors
+        self.abstract = abstract
+        self.categories = intern_categories(categories)
+        self.title_zh = title_zh
+        self.abstract_zh = abstract_zh
+
+    @classmethod
+    def from_dict(cls, item: dict):
+        return cls(*[item.get(name) for name in FIELDS], categories=item.get('categories', ()))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in FIELDS}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def copy(self, categories: tuple=None):
+        '''其他站点使用的副本，字符串与原记录共用'''
+        paper = Paper.__new__(Paper)
+        for name in self.__slots__:
+            setattr(paper, name, getattr(self, name))
+        if categories is not None:
+            paper.categories = intern_categories(categories)
+        return paper
+
+    def keys(self):
+        return self.__slots__
+
+    def __getitem__(self, name: str):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def get(self, name: str, default=None):
+        return getattr(self, name, default)
+
+    def __repr__(self):
+        return f'Paper({self.arxiv_id!r}, {self.title!r})'
+
+
+def as_papers(records):
+    '''json 或列式存储读出的 dict 逐条转换为 Paper，已经是 Paper 的原样返回'''
+    for item in records:
+        yield item if isinstance(item, Paper) else Paper.from_dict(item)
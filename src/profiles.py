@@ -0,0 +1,74 @@
+'''多个主题站点共用一次解析: 每个 profile 有自己的过滤词、类别词与输出目录
+
+PaperParser 的第一个 profile 是由 filter_words/category_words 构成的默认站点，输出到调用方给出的文件；
+其余 profile 的页面写到各自 output_dir 下相同的相对位置(<年月>/<日期>.rst)。
+解析、抓取 abs 页面与翻译只做一次，过滤时一遍扫描把记录分发给所有命中的 profile，标题按 arxiv id 合并后一起翻译。
+
+配置文件(json):
+    {
+        "vision": {
+            "filter_words": ["vision transformer", "\"ViT\""],
+            "category_words": {"Detection": ["detection"], "Segmentation": ["segmentation"]}
+        },
+        "robotics": {"filter_words": ["robot"], "category_words": {"Manipulation": ["manipulation", "grasp"]}}
+    }
+
+用法:
+    PROFILES=profiles.json python src/main.py     # 页面写到 docs/source/vision、docs/source/robotics
+'''
+import os
+import json
+
+from keyword_matcher import KeywordMatcher
+
+
+class Profile:
+    def __init__(self,
+                 name: str,
+                 filter_words: list,
+                 category_words: dict,
+                 output_dir: str=None,
+                 feed_dir: str=None,
+                 html_dir: str=None) -> None:
+        self.name = name
+        self.filter_words = filter_words
+        self.category_words = category_words
+        # None 表示默认站点，直接使用传入的输出文件
+        self.output_dir = output_dir
+        self.feed_dir = feed_dir
+        self.html_dir = html_dir
+        self.matcher = KeywordMatcher(filter_words, category_words)
+
+    def output_file(self, output_file: str):
+        '''默认站点的输出文件对应到本站点目录下的同名文件'''
+        if self.output_dir is None:
+            return output_file
+        year_dir = os.path.basename(os.path.dirname(output_file))
+        return os.path.join(self.output_dir, year_dir, os.path.basename(output_file))
+
+    def doc_path(self, date: str):
+        '''某一天页面的 Sphinx 文档路径，profile 站点位于 docs 根目录下的 <output_dir 目录名>/ 中'''
+        page = f'20{date[:4]}/{date}'
+        if self.output_dir is None:
+            return f'/{page}'
+        return f'/{os.path.basename(self.output_dir)}/{page}'
+
+    def config(self):
+        return dict(name=self.name, filter_words=self.filter_words, category_words=self.category_words)
+
+
+def load_profiles(config_file: str, docs_dir: str, feed_dir: str=None, html_dir: str=None):
+    '''读取 json 配置，每个站点输出到 docs_dir/<name>，JSON Feed 与 HTML 片段写到 feed_dir/<name>、html_dir/<name>'''
+    if not config_file:
+        return []
+    with open(config_file, encoding='utf-8') as f:
+        config = json.load(f)
+    profiles = []
+    for name, item in config.items():
+        if not item.get('filter_words'):
+            raise Exception(f"Profile {name} has no filter_words")
+        profiles.append(Profile(name, item['filter_words'], item.get('category_words', {}),
+                                output_dir=os.path.join(docs_dir, name),
+                                feed_dir=os.path.join(feed_dir, name) if feed_dir else None,
+                                html_dir=os.path.join(html_dir, name) if html_dir else None))
+    return profiles
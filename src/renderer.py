@@ -0,0 +1,314 @@
+'''单遍多格式渲染: 论文记录(Paper)只遍历一次，按类别顺序流式写入 RST、JSON Feed 与 HTML 片段
+
+内存中只保留每个类别的论文下标；同时属于多个类别的论文格式化结果缓存到最后一次出现为止。
+各格式都先写临时文件，全部写完后再 rename，中途出错时保留原有页面。
+已有页面不在末尾追加小节，而是整页重写后原子替换: 重新渲染一天时(配置变化、补齐译文)各小节的内容与计数都会变化，
+追加无法保证页面与 json 一致，中断时还会留下半个小节；分页输出按哈希只重写变化的子页面
+'''
+import os
+import re
+import json
+import html
+import shutil
+import hashlib
+
+from checkpoint import AtomicFile
+
+BUFFER_SIZE = 1 << 16
+
+
+class RstSink:
+    '''与原有页面格式一致: 每个类别一个带上下划线的小节，Index 小节列出 Other 中论文的单行链接'''
+    def __init__(self, path: str, template: str) -> None:
+        self.path = path
+        self.template = template
+        self._file = AtomicFile(path, buffering=BUFFER_SIZE)
+        self._cache = {}
+
+    def begin(self, title: str, total: int):
+        self._file.write(f"{title}\n========\n\n")
+
+    def section(self, name: str, count: int):
+        sub_title = f'{name} ({count})'
+        overline = '-'*len(sub_title)
+        self._file.write(f'{overline}\n{sub_title}\n{overline}\n\n')
+
+    def _format(self, section: str, index: int, paper, remaining: int):
+        if section == 'Index':
+            return f"`[{paper.arxiv_id}] {paper.title} <{paper.url}>`__ {paper.title_zh}".strip()
+        if index in self._cache:
+            return self._cache.pop(index) if remaining == 0 else self._cache[index]
+        text = self.template.format_map(paper)
+        if remaining > 0:
+            self._cache[index] = text
+        return text
+
+    def item(self, section: str, index: int, paper, remaining: int):
+        self._file.write(self._format(section, index, paper, remaining))
+        self._file.write('\n\n')
+
+    def close(self):
+        self._file.commit()
+
+    def abort(self):
+        self._file.abort()
+
+
+class PagedRstSink(RstSink):
+    '''分页输出: 当天页面只保留各类别的链接，每个类别拆成若干子页面，每页最多 page_size 篇
+
+    子页面写在与当天页面同名的目录下，目录中的 manifest.json 记录每个页面的哈希，
+    内容没有变化的页面不再重写，sphinx 增量构建时只会重新读取发生变化的页面
+    变化的页面先写临时文件，close 时依次 rename 子页面、当天页面与 manifest，abort 时删除临时文件
+    '''
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, path: str, template: str, page_size: int) -> None:
+        self.path = path
+        self.template = template
+        self.page_size = page_size
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.page_dir = os.path.splitext(path)[0]
+        self._cache = {}
+        self._old = self._load_manifest()
+        self._pages = {}
+        self._sections = {}
+        self._counts = {}
+        self._changed = []
+        # [(临时文件, 目标文件)]
+        self._staged = []
+        self._buffer = None
+
+    def _load_manifest(self):
+        manifest_file = os.path.join(self.page_dir, self.MANIFEST)
+        if not os.path.exists(manifest_file):
+            return {}
+        with open(manifest_file, encoding='utf-8') as f:
+            return json.load(f).get('pages', {})
+
+    def _write_page(self, name: str, content: str):
+        digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        self._pages[name] = digest
+        path = self.path if name == '' else os.path.join(self.page_dir, name + '.rst')
+        if self._old.get(name) == digest and os.path.exists(path):
+            return None
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        self._staged.append((tmp_path, path))
+        with open(tmp_path, 'w', encoding='utf-8', buffering=BUFFER_SIZE) as f:
+            f.write(content)
+        self._changed.append(name)
+
+    def _flush(self):
+        if self._buffer is not None:
+            self._write_page(self._page_name, ''.join(self._buffer))
+            self._buffer = None
+
+    def _new_page(self):
+        self._flush()
+        pages = self._sections[self._section]
+        number = len(pages) + 1
+        self._page_name = f'{self._slug}-{number}' if number > 1 else self._slug
+        pages.append(self._page_name)
+        page_title = f'{self.title} {self._section} ({number}/{self._page_count})'
+        self._buffer = [f'{page_title}\n{"="*len(page_title)}\n\n',
+                        f':doc:`{self.title} <../{self.name}>`\n\n']
+        self._page_items = 0
+
+    def begin(self, title: str, total: int):
+        self.title = title
+        os.makedirs(self.page_dir, exist_ok=True)
+
+    def section(self, name: str, count: int):
+        self._flush()
+        self._section = name
+        # Index 只是 Other 的单行链接，分页时由 Other 的子页面代替
+        if name == 'Index':
+            return None
+        self._slug = re.sub(r'[^0-9a-z]+', '-', name.lower()).strip('-')
+        self._page_count = (count + self.page_size - 1) // self.page_size
+        self._sections[name] = []
+        self._counts[name] = count
+        self._page_items = self.page_size
+
+    def item(self, section: str, index: int, paper, remaining: int):
+        if section == 'Index':
+            return None
+        if self._page_items >= self.page_size:
+            self._new_page()
+        self._buffer.append(self._format(section, index, paper, remaining))
+        self._buffer.append('\n\n')
+        self._page_items += 1
+
+    def _summary(self):
+        lines = [f"{self.title}\n========\n\n", '.. toctree::\n   :hidden:\n\n']
+        lines += [f'   {self.name}/{page}\n' for pages in self._sections.values() for page in pages]
+        lines.append('\n')
+        for name, pages in self._sections.items():
+            sub_title = f'{name} ({self._counts[name]})'
+            overline = '-'*len(sub_title)
+            lines.append(f'{overline}\n{sub_title}\n{overline}\n\n')
+            for i, page in enumerate(pages):
+                start = i*self.page_size + 1
+                end = min((i+1)*self.page_size, self._counts[name])
+                lines.append(f'- :doc:`{start}-{end} <{self.name}/{page}>`\n')
+            lines.append('\n')
+        return ''.join(lines)
+
+    def close(self):
+        self._flush()
+        self._write_page('', self._summary())
+        # 当天页面最后写入，之前的子页面都已就位
+        for tmp_path, path in self._staged:
+            os.replace(tmp_path, path)
+        self._staged = []
+        # 删除上次生成、这次已经不存在的子页面
+        for name in self._old:
+            if name and name not in self._pages and os.path.exists(os.path.join(self.page_dir, name + '.rst')):
+                os.remove(os.path.join(self.page_dir, name + '.rst'))
+        manifest = dict(title=self.title, page_size=self.page_size, sections=self._sections,
+                        pages=self._pages, changed=self._changed)
+        tmp_path = os.path.join(self.page_dir, self.MANIFEST + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, os.path.join(self.page_dir, self.MANIFEST))
+
+    def abort(self):
+        # 原有的子页面、当天页面与 manifest 保持不变
+        self._buffer = None
+        for tmp_path, _ in self._staged:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._staged = []
+
+    @property
+    def changed(self):
+        return self._changed
+
+
+class JsonFeedSink:
+    '''JSON Feed 1.1，每篇论文只输出一次，类别写在 tags 中'''
+    def __init__(self, path: str, feed_url: str='') -> None:
+        self.path = path
+        self.feed_url = feed_url
+        self._file = AtomicFile(path, buffering=BUFFER_SIZE)
+        self._written = set()
+
+    def begin(self, title: str, total: int):
+        header = dict(version='https://jsonfeed.org/version/1.1', title=f'Arxiv Daily Paper {title}')
+        if self.feed_url:
+            header['feed_url'] = self.feed_url
+        # items 数组逐条写入
+        self._file.write(json.dumps(header, ensure_ascii=False)[:-1] + ', "items": [')
+
+    def section(self, name: str, count: int):
+        pass
+
+    def item(self, section: str, index: int, paper, remaining: int):
+        if section == 'Index' or index in self._written:
+            return None
+        entry = dict(
+            id=paper.arxiv_id,
+            url=paper.url,
+            title=paper.title,
+            summary=paper.title_zh,
+            content_text=paper.abstract,
+            authors=[dict(name=paper.authors)],
+            tags=list(paper.categories) or ['Other'],
+            _arxiv=dict(submitdate=paper.submitdate)
+        )
+        if paper.abstract_zh:
+            entry['_arxiv']['abstract_zh'] = paper.abstract_zh
+        self._file.write(('\n' if not self._written else ',\n') + json.dumps(entry, ensure_ascii=False))
+        self._written.add(index)
+
+    def close(self):
+        self._file.write('\n]}\n')
+        self._file.commit()
+
+    def abort(self):
+        self._file.abort()
+
+
+class HtmlSink:
+    '''紧凑的 HTML 片段，每个类别一个 section，只包含标题链接与译文'''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = AtomicFile(path, buffering=BUFFER_SIZE)
+        self._open = False
+
+    def begin(self, title: str, total: int):
+        self._file.write(f'<div class="arxiv-daily" data-date="{html.escape(title)}">\n')
+
+    def _close_section(self):
+        if self._open:
+            self._file.write('</ul></section>\n')
+            self._open = False
+
+    def section(self, name: str, count: int):
+        self._close_section()
+        if name == 'Index':
+            return None
+        self._file.write(f'<section><h3>{html.escape(name)} ({count})</h3><ul>\n')
+        self._open = True
+
+    def item(self, section: str, index: int, paper, remaining: int):
+        if section == 'Index':
+            return None
+        title_zh = f" {html.escape(paper.title_zh)}" if paper.title_zh else ''
+        self._file.write(f'<li><a href="{html.escape(paper.url)}">[{html.escape(paper.arxiv_id)}] '
+                         f'{html.escape(paper.title)}</a>{title_zh}</li>\n')
+
+    def close(self):
+        self._close_section()
+        self._file.write('</div>\n')
+        self._file.commit()
+
+    def abort(self):
+        self._file.abort()
+
+
+def render(papers: list, title: str, category_keys: list, sinks: list):
+    '''papers 为已设置 categories 与 title_zh 的 Paper；类别按 category_keys 顺序输出，之后是 Other 与 Index'''
+    sections = {key: [] for key in category_keys}
+    other = []
+    for i, paper in enumerate(papers):
+        for key in paper.categories:
+            sections[key].append(i)
+        if not paper.categories:
+            other.append(i)
+    sections['Other'] = other
+    sections['Index'] = other
+
+    # 每篇论文在类别小节中剩余的出现次数，用于释放多类别论文的格式化缓存
+    remaining = [len(paper.categories) or 1 for paper in papers]
+    try:
+        for sink in sinks:
+            sink.begin(title, len(papers))
+        for key, indexes in sections.items():
+            if len(indexes) == 0:
+                continue
+            for sink in sinks:
+                sink.section(key, len(indexes))
+            for i in indexes:
+                if key != 'Index':
+                    remaining[i] -= 1
+                for sink in sinks:
+                    sink.item(key, i, papers[i], remaining[i])
+    except BaseException:
+        for sink in sinks:
+            sink.abort()
+        raise
+    for sink in sinks:
+        sink.close()
+
+
+def remove_pages(path: str):
+    '''关闭分页后删除之前生成的子页面目录'''
+    page_dir = os.path.splitext(path)[0]
+    if os.path.exists(os.path.join(page_dir, PagedRstSink.MANIFEST)):
+        shutil.rmtree(page_dir)
+
+
+def output_path(out_dir: str, name: str, suffix: str):
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.join(out_dir, f'{name}{suffix}')
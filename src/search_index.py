@@ -0,0 +1,205 @@
+'''基于 SQLite FTS5 的论文全文检索索引，按天增量更新，BM25 排序，并可导出分片的静态索引供网页端检索
+
+用法:
+    python src/search_index.py "retrieval augmented generation" -k 10
+    python src/search_index.py --rebuild datasets --export docs/source/_static/search
+'''
+import os
+import re
+import json
+import sqlite3
+import argparse
+import threading
+
+# 标题、摘要、作者的 BM25 权重
+FIELD_WEIGHTS = dict(title=5.0, abstract=1.0, authors=0.5)
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+
+def tokenize(text: str):
+    '''与 FTS5 unicode61 分词器保持一致: 转小写后按非字母数字切分'''
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def shard_name(term: str):
+    # 按词的前两个字符分片，文件名使用 utf-8 的十六进制编码，网页端用同样的方式计算
+    return term[:2].encode('utf-8').hex()
+
+
+class SearchIndex:
+    def __init__(self, db_file: str, timeout: int=30) -> None:
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS paper_fts USING fts5('
+            'title, abstract, authors, arxiv_id UNINDEXED, url UNINDEXED, date UNINDEXED, '
+            'category UNINDEXED, title_len UNINDEXED, tokenize="unicode61")'
+        )
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS paper_vocab USING fts5vocab(paper_fts, 'instance')")
+
+    def add_day(self, json_file: str, date: str, category_fn=None):
+        '''重新索引某一天的 json，返回 (受影响的词, 被删除的旧记录所在的文档分片)，用于增量导出静态索引'''
+        rows = []
+        terms = set()
+        for line in open(json_file, encoding='utf-8'):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            categories = category_fn(item) if category_fn is not None else []
+            title_tokens = tokenize(item['title'])
+            terms.update(title_tokens)
+            rows.append((item['title'], item['abstract'], item['authors'], item['arxiv_id'], item['url'],
+                         date, ','.join(categories) or 'Other', len(title_tokens)))
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 新记录的 rowid 接在最大值之后，旧记录所在的分片需要一并重写
+                buckets = set()
+                for rowid, title in self._conn.execute('SELECT rowid, title FROM paper_fts WHERE date=?', (date,)):
+                    terms.update(tokenize(title))
+                    buckets.add(rowid // 1000)
+                self._conn.execute('DELETE FROM paper_fts WHERE date=?', (date,))
+                self._conn.executemany(
+                    'INSERT INTO paper_fts (title, abstract, authors, arxiv_id, url, date, category, title_len) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                self._conn.execute('COMMIT')
+            except Exception as e:
+                self._conn.execute('ROLLBACK')
+                raise e
+        return terms, buckets
+
+    def dates(self):
+        with self._lock:
+            return set(d for (d,) in self._conn.execute('SELECT DISTINCT date FROM paper_fts'))
+
+    def query(self, text: str, k: int=10):
+        '''BM25 检索，同一篇论文出现在多天时只保留得分最高的一条'''
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        match = ' OR '.join(f'"{token}"' for token in dict.fromkeys(tokens))
+        weights = ', '.join(str(w) for w in FIELD_WEIGHTS.values())
+        sql = (f'SELECT arxiv_id, title, date, category, url, bm25(paper_fts, {weights}) AS score '
+               f'FROM paper_fts WHERE paper_fts MATCH ? ORDER BY score LIMIT ? OFFSET ?')
+        results = {}
+        page = k*4
+        with self._lock:
+            # 同一篇论文可能出现在很多天，按页继续读取直到凑满 k 篇不同的论文或没有更多结果
+            offset = 0
+            while len(results) < k:
+                rows = self._conn.execute(sql, (match, page, offset)).fetchall()
+                for arxiv_id, title, date, category, url, score in rows:
+                    if arxiv_id not in results:
+                        results[arxiv_id] = dict(arxiv_id=arxiv_id, title=title, date=date, category=category, url=url, score=-score)
+                    if len(results) >= k:
+                        break
+                if len(rows) < page:
+                    break
+                offset += page
+        return list(results.values())
+
+    def export(self, out_dir: str, terms: set=None, dates: set=None, buckets: set=None):
+        '''导出网页端使用的静态索引(只包含标题)；terms/dates 为 None 时全量导出，否则只重写受影响的分片
+        buckets 为 add_day 返回的旧记录所在的文档分片，其中已经没有记录的分片写为空
+
+        meta.json:               文档数与平均标题长度
+        docs/<rowid//1000>.json: {rowid: [arxiv_id, title, date, category, url, title_len]}
+        terms/<shard>.json:      {term: [[rowid, tf], ...]}
+        '''
+        os.makedirs(os.path.join(out_dir, 'docs'), exist_ok=True)
+        os.makedirs(os.path.join(out_dir, 'terms'), exist_ok=True)
+        with self._lock:
+            count, avgdl = self._conn.execute('SELECT COUNT(*), AVG(title_len) FROM paper_fts').fetchone()
+            self._write(os.path.join(out_dir, 'meta.json'), dict(count=count, avgdl=avgdl or 0))
+
+            sql = 'SELECT rowid, arxiv_id, title, date, category, url, title_len FROM paper_fts'
+            if dates is None:
+                rows = self._conn.execute(sql)
+            else:
+                buckets = set(buckets or ())
+                for date in dates:
+                    buckets.update(rowid // 1000 for (rowid,) in self._conn.execute('SELECT rowid FROM paper_fts WHERE date=?', (date,)))
+                rows = []
+                for bucket in buckets:
+                    rows.extend(self._conn.execute(sql + ' WHERE rowid >= ? AND rowid < ?', (bucket*1000, (bucket+1)*1000)))
+            docs = {bucket: {} for bucket in buckets} if dates is not None else {}
+            for row in rows:
+                docs.setdefault(row[0] // 1000, {})[row[0]] = list(row[1:])
+            for bucket, items in docs.items():
+                self._write(os.path.join(out_dir, 'docs', f'{bucket}.json'), items)
+
+            # fts5vocab 支持按 term 范围查询，增量导出时只读取受影响的前缀
+            if terms is None:
+                cursor = self._conn.execute("SELECT term, doc FROM paper_vocab WHERE col='title'")
+                prefixes = None
+            else:
+                prefixes = set(term[:2] for term in terms)
+                cursor = []
+                for prefix in prefixes:
+                    if len(prefix) == 1:
+                        # 单字符的词自成一个分片，范围查询会与两字符前缀重叠
+                        cursor.extend(self._conn.execute(
+                            "SELECT term, doc FROM paper_vocab WHERE term = ? AND col='title'", (prefix,)))
+                    else:
+                        cursor.extend(self._conn.execute(
+                            "SELECT term, doc FROM paper_vocab WHERE term >= ? AND term < ? AND col='title'",
+                            (prefix, prefix + '\U0010ffff')))
+            postings = {}
+            for term, doc in cursor:
+                term_postings = postings.setdefault(shard_name(term), {}).setdefault(term, {})
+                term_postings[doc] = term_postings.get(doc, 0) + 1
+            names = postings.keys() if prefixes is None else set(shard_name(prefix) for prefix in prefixes)
+            for name in names:
+                items = {term: sorted(tf.items()) for term, tf in postings.get(name, {}).items()}
+                self._write(os.path.join(out_dir, 'terms', f'{name}.json'), items)
+
+    @staticmethod
+    def _write(path: str, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def rebuild(search_index: SearchIndex, data_dir: str, category_fn=None):
+    '''索引 data_dir 下所有尚未索引的 json'''
+    indexed = search_index.dates()
+    for root, dirs, names in os.walk(data_dir):
+        # 按目录名顺序遍历，rowid 与导出的文档分片不随文件系统的目录顺序变化
+        dirs.sort()
+        for name in sorted(names):
+            dates = re.findall(r'\d{6}', name)
+            if name.endswith('.json') and dates and dates[0] not in indexed:
+                search_index.add_day(os.path.join(root, name), dates[0], category_fn)
+
+
+if __name__ == '__main__':
+    import time
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('query', nargs='?', default=None)
+    arg_parser.add_argument('-k', type=int, default=10)
+    arg_parser.add_argument('--db', default=os.path.join(os.path.expanduser('~'), '.cache', 'arxiv', 'search.sqlite'))
+    arg_parser.add_argument('--rebuild', default=None, help='索引该目录下尚未索引的 json')
+    arg_parser.add_argument('--export', default=None, help='全量导出静态索引到该目录')
+    args = arg_parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    search_index = SearchIndex(args.db)
+    if args.rebuild:
+        rebuild(search_index, args.rebuild)
+    if args.export:
+        search_index.export(args.export)
+    if args.query:
+        start = time.perf_counter()
+        results = search_index.query(args.query, k=args.k)
+        cost = (time.perf_counter() - start) * 1000
+        for item in results:
+            print(f"{item['score']:6.2f}  [{item['arxiv_id']}] {item['title']}  ({item['date']}, {item['category']})")
+        print(f"{len(results)} results in {cost:.1f} ms")
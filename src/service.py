@@ -0,0 +1,138 @@
+'''常驻服务: 按计划轮询新的摘要并处理，检索索引、匹配器、翻译缓存、HTTP 会话与子进程在两轮之间保持加载
+
+启用 IMAP 时在两轮之间用 IDLE 等待新邮件，新邮件一到就开始下一轮，否则每 interval 秒轮询一次。
+可选的状态接口:
+    GET  /health   json: 状态、当前轮剩余天数(queue_depth)、上一轮耗时与错误、下一轮时间
+    POST /run      立即开始下一轮
+SIGTERM/SIGINT 在当前一轮结束后退出，SIGHUP 立即开始下一轮。
+
+用法:
+    python src/main.py --daemon --interval 600 --status_port 8080
+    EMAIL_BACKEND=imap python src/main.py --daemon --email --status_port 8080
+'''
+import json
+import time
+import signal
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from metrics import METRICS
+
+# IDLE 单次等待的上限，超时后重新发送 IDLE 并检查是否需要退出
+IDLE_SLICE = 30
+
+
+class Service:
+    def __init__(self, runner, interval: int=600, status_port: int=None, status_host: str='127.0.0.1') -> None:
+        self.runner = runner
+        self.interval = interval
+        self.started = time.time()
+        self.state = 'starting'
+        self.runs = 0
+        self.failures = 0
+        self.last_run = None
+        self.next_run = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.status_server = None
+        if status_port is not None:
+            self.status_server = StatusServer((status_host, status_port), StatusHandler)
+            self.status_server.service = self
+
+    def status(self):
+        healthy = self.last_run is None or self.last_run['error'] is None
+        return dict(status='ok' if healthy else 'error',
+                    state=self.state,
+                    queue_depth=self.runner.queued,
+                    uptime=round(time.time() - self.started, 1),
+                    runs=self.runs,
+                    failures=self.failures,
+                    last_run=self.last_run,
+                    next_run=self.next_run,
+                    latest_date=self.runner.latest_date())
+
+    def trigger(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def run_once(self):
+        '''运行一轮，异常只记录到状态中，服务继续运行'''
+        METRICS.reset()
+        self.state = 'running'
+        start = time.time()
+        days, error = 0, None
+        try:
+            days = self.runner.run_once()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            self.failures += 1
+            METRICS.error('service', error)
+        self.runs += 1
+        self.last_run = dict(started=round(start, 3), latency=round(time.time() - start, 3), days=days, error=error)
+        METRICS.info(f"第 {self.runs} 轮处理 {days} 天, 耗时 {self.last_run['latency']:.1f}s")
+
+    def wait(self):
+        '''等待到下一轮: 可以 IDLE 时等待新邮件，否则等待 interval 秒，两种情况都可被 trigger/stop 提前唤醒'''
+        self.state = 'waiting'
+        deadline = time.time() + self.interval
+        self.next_run = round(deadline, 3)
+        while not self._wake.is_set() and time.time() < deadline:
+            arrived = self.runner.wait_for_mail(min(IDLE_SLICE, max(int(deadline - time.time()), 1)))
+            if arrived is None:
+                self._wake.wait(max(deadline - time.time(), 0))
+            elif arrived:
+                break
+        self._wake.clear()
+        self.next_run = None
+
+    def serve_forever(self):
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        signal.signal(signal.SIGINT, lambda *_: self.stop())
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda *_: self.trigger())
+        if self.status_server is not None:
+            threading.Thread(target=self.status_server.serve_forever, daemon=True).start()
+            METRICS.info(f"状态接口: http://{self.status_server.server_address[0]}:{self.status_server.server_port}/health")
+        try:
+            while not self._stop.is_set():
+                self.run_once()
+                if self._stop.is_set():
+                    break
+                self.wait()
+        finally:
+            self.state = 'stopped'
+            if self.status_server is not None:
+                self.status_server.shutdown()
+                self.status_server.server_close()
+
+
+class StatusServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class StatusHandler(BaseHTTPRequestHandler):
+    def _send_json(self, code: int, body: dict):
+        content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/health', '/status'):
+            return self.send_error(404)
+        status = self.server.service.status()
+        self._send_json(200 if status['status'] == 'ok' else 503, status)
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/run':
+            return self.send_error(404)
+        self.server.service.trigger()
+        self._send_json(202, dict(state=self.server.service.state))
+
+    def log_message(self, format, *args):
+        pass
@@ -1,9 +1,14 @@
 import os
 import time
-import json
 import uuid
 import hashlib
-import requests
+import threading
+
+from translate_cache import open_cache
+from metrics import METRICS
+
+API_URL = 'https://openapi.youdao.com/api'
+BATCH_API_URL = 'https://openapi.youdao.com/v2/api'
 
 
 def addAuthParams(appKey, appSecret, params):
@@ -46,56 +51,97 @@ def get_md5(*args, **kwargs):
     return md5.hexdigest()
 
 
+class TokenBucket:
+    '''令牌桶限流，rate 为每秒补充的令牌数，capacity 为允许的突发请求数'''
+    def __init__(self, rate: float, capacity: int=1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return None
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return None
+                time.sleep((1 - self._tokens) / self.rate)
+
+
 class YoudaoTranslator:
-    def __init__(self, api_key: str, api_secret: str, delta_t: int=5, cache_dir: str=None) -> None:
+    def __init__(self,
+                 api_key: str,
+                 api_secret: str,
+                 delta_t: int=5,
+                 cache_dir: str=None,
+                 retries: int=3,
+                 batch_size: int=50,
+                 batch_chars: int=5000,
+                 cache_backend: str='sqlite',
+                 **cache_kwargs) -> None:
         cache_dir = cache_dir or os.getcwd()
-        self._cache_file = os.path.join(cache_dir, 'translator.jsonl')
-        self._latest_trans_time = time.time()
-        self._cache = {}
-        if os.path.exists(self._cache_file):
-            for line in open(self._cache_file, encoding='utf-8'):
-                if len(line.strip()) == 0:
-                    continue
-                item = json.loads(line)
-                self._cache[item['id']] = item
+        os.makedirs(cache_dir, exist_ok=True)
+        # cache_kwargs 透传给缓存后端，例如 max_items/max_bytes
+        self._cache = open_cache(cache_dir, backend=cache_backend, **cache_kwargs)
         self.delta_t = delta_t
+        self.retries = retries
+        # 批量翻译接口单次请求的条数与字符数上限
+        self.batch_size = batch_size
+        self.batch_chars = batch_chars
+        self._limiter = TokenBucket(rate=1/delta_t if delta_t > 0 else 0)
         self._api_key = api_key
         self._api_secret = api_secret
+        # keep-alive 会话在第一次请求时创建，全部命中缓存时不需要导入 requests
+        self._session = None
+        self._session_lock = threading.Lock()
 
-    def _cache_translate(self, uuid, item):
-        item['id'] = uuid
-        self._cache[uuid] = item
-        with open(self._cache_file, mode='a', encoding='utf-8') as fwriter:
-            fwriter.write(json.dumps(item, ensure_ascii=False)+'\n')
+    def _get_session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+            return self._session
 
-    def translate(self, text: str, src: str='en', dst: str='zh', domain: str='computers', **kwargs):
+    def _request(self, url: str, playload: dict):
+        '''限流后发送请求，失败时按指数退避重试'''
+        if not self._api_key or not self._api_secret:
+            raise Exception("Missing youdao api key or secret.")
+        header = {'Content-Type': 'application/x-www-form-urlencoded'}
+        for attempt in range(self.retries + 1):
+            self._limiter.acquire()
+            try:
+                params = dict(playload)
+                addAuthParams(self._api_key, self._api_secret, params)
+                start = time.perf_counter()
+                result = self._get_session().post(url, params, header, timeout=10).json()
+                METRICS.observe('youdao', time.perf_counter() - start)
+                METRICS.incr('http.youdao.requests')
+                if result.get('errorCode', '0') != '0':
+                    raise Exception(f"response: {result}")
+                return result
+            except Exception as e:
+                # 只有重试用尽时才计为错误
+                if attempt >= self.retries:
+                    METRICS.error('youdao_request', e)
+                    raise e
+                METRICS.incr('http.youdao.retries')
+                time.sleep(max(self.delta_t, 1) * 2**attempt)
+
+    @staticmethod
+    def _lang(src: str, dst: str):
         # zh 默认代表简体中文
         src = 'zh-CHS' if src == 'zh' else src
         dst = 'zh-CHS' if dst == 'zh' else dst
-        playload = {"q": text, "from": src, "to": dst, "domain": domain, **kwargs}
-    
-        uuid = get_md5(playload)
-        if uuid in self._cache:
-            # print("INFO:     Translate use cache")
-            return self._cache[uuid]['translation']
-
-        time_diff = time.time() - self._latest_trans_time
-        if time_diff < self.delta_t:
-            time.sleep(self.delta_t-time_diff)
-            self._latest_trans_time = time.time()
-        addAuthParams(self._api_key, self._api_secret, playload)
+        return src, dst
 
-        header = {'Content-Type': 'application/x-www-form-urlencoded'}
-        response = requests.post('https://openapi.youdao.com/api', playload, header)
-        try:
-            translation = response.json()['translation'][0]
-        except Exception as e:
-            print(f"ERROR:    response: {response.json()}")
-            if self.delta_t > 0:
-                time.sleep(5*self.delta_t)
-                translation = response.json()['translation'][0]
-            else:
-                raise Exception(e)
+    @staticmethod
+    def _new_item(text, translation, src, dst, domain, **kwargs):
         item = dict(
             text=text,
             translation=translation,
@@ -103,5 +149,76 @@ class YoudaoTranslator:
             domain=domain
         )
         item.update(kwargs)
-        self._cache_translate(uuid=uuid, item=item)
+        return item
+
+    def translate(self, text: str, src: str='en', dst: str='zh', domain: str='computers', **kwargs):
+        src, dst = self._lang(src, dst)
+        playload = {"q": text, "from": src, "to": dst, "domain": domain, **kwargs}
+    
+        uuid = get_md5(playload)
+        cached = self._cache.get(uuid)
+        if cached is not None:
+            METRICS.incr('translate.cache.hit')
+            return cached['translation']
+        METRICS.incr('translate.cache.miss')
+        METRICS.incr('translate.chars', len(text))
+
+        response = self._request(API_URL, playload)
+        translation = response['translation'][0]
+        self._cache.put(uuid, self._new_item(text, translation, src, dst, domain, **kwargs))
         return translation
+
+    def _split_batches(self, texts: list):
+        batches, batch, chars = [], [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.batch_chars):
+                batches.append(batch)
+                batch, chars = [], 0
+            batch.append(text)
+            chars += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def lookup(self, texts: list, src: str='en', dst: str='zh', domain: str='computers', **kwargs):
+        '''只查询缓存，返回 {原文: 译文}，不发送请求'''
+        src, dst = self._lang(src, dst)
+        uuids = {text: get_md5({"q": text, "from": src, "to": dst, "domain": domain, **kwargs}) for text in texts}
+        cached = self._cache.get_many(list(uuids.values()))
+        return {text: cached[uuid]['translation'] for text, uuid in uuids.items() if uuid in cached}
+
+    def translate_batch(self, texts: list, src: str='en', dst: str='zh', domain: str='computers', **kwargs):
+        '''批量翻译: 输入去重，先命中缓存，其余按接口限制分批以多个 q 发送，返回与输入对齐的译文列表，翻译失败的为空字符串'''
+        src, dst = self._lang(src, dst)
+        uuids = {}
+        for text in texts:
+            if text not in uuids:
+                uuids[text] = get_md5({"q": text, "from": src, "to": dst, "domain": domain, **kwargs})
+        cached = self._cache.get_many(list(uuids.values()))
+        pending = [text for text, uuid in uuids.items() if uuid not in cached]
+        METRICS.incr('translate.cache.hit', len(uuids) - len(pending))
+        METRICS.incr('translate.cache.miss', len(pending))
+        METRICS.incr('translate.chars', sum(len(text) for text in pending))
+
+        # 某一批失败(重试用尽、缺少 api key)时只有这批返回空译文，缓存命中与其他批次的译文照常返回
+        for batch in self._split_batches(pending):
+            playload = {"q": batch, "from": src, "to": dst, "domain": domain, **kwargs}
+            try:
+                response = self._request(BATCH_API_URL, playload)
+            except Exception as e:
+                METRICS.error('translate', e)
+                METRICS.incr('translate.failed', len(batch))
+                continue
+            results = {r['query']: r['translation'] for r in response.get('translateResults', [])}
+            items = {uuids[text]: self._new_item(text, results[text], src, dst, domain, **kwargs)
+                     for text in batch if text in results}
+            # 每批译文在一个事务中写入
+            self._cache.put_many(items)
+            cached.update(items)
+
+        return [cached[uuids[text]]['translation'] if uuids[text] in cached else '' for text in texts]
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+        self._cache.close()
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from metrics import METRICS
+
+
+class JsonlCache:
+    '''原有的 jsonl 缓存: 启动时全量载入内存，每条新翻译追加写入文件'''
+    def __init__(self, cache_file: str) -> None:
+        self._cache_file = cache_file
+        self._cache = {}
+        if os.path.exists(cache_file):
+            for line in open(cache_file, encoding='utf-8'):
+                if len(line.strip()) == 0:
+                    continue
+                item = json.loads(line)
+                self._cache[item['id']] = item
+
+    def get(self, key: str):
+        return self._cache.get(key)
+
+    def get_many(self, keys: list):
+        return {key: self._cache[key] for key in keys if key in self._cache}
+
+    def put(self, key: str, item: dict):
+        self.put_many({key: item})
+
+    def put_many(self, items: dict):
+        with open(self._cache_file, mode='a', encoding='utf-8') as fwriter:
+            for key, item in items.items():
+                item['id'] = key
+                self._cache[key] = item
+                fwriter.write(json.dumps(item, ensure_ascii=False)+'\n')
+
+    def close(self):
+        pass
+
+
+class SqliteCache:
+    '''SQLite(WAL) 缓存: 按需查询不整体载入，批量写入同一事务，多进程安全，可选 LRU/大小淘汰
+
+    max_items: 最多保留的条数，超过后按最近访问时间淘汰
+    max_bytes: 最多保留的译文字节数，超过后按最近访问时间淘汰
+    '''
+    def __init__(self, db_file: str, max_items: int=None, max_bytes: int=None, timeout: int=30) -> None:
+        self.db_file = db_file
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS translation ('
+            'id TEXT PRIMARY KEY, item TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS translation_accessed ON translation (accessed)')
+
+    @property
+    def evictable(self):
+        return self.max_items is not None or self.max_bytes is not None
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list):
+        keys = list(dict.fromkeys(keys))
+        result = {}
+        with self._lock:
+            # SQLite 单条语句的参数个数有限制，分段查询
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                marks = ','.join('?'*len(chunk))
+                for key, item in self._conn.execute(f'SELECT id, item FROM translation WHERE id IN ({marks})', chunk):
+                    result[key] = json.loads(item)
+            if result and self.evictable:
+                now = time.time()
+                self._conn.executemany('UPDATE translation SET accessed=? WHERE id=?', [(now, key) for key in result])
+        return result
+
+    def put(self, key: str, item: dict):
+        self.put_many({key: item})
+
+    def put_many(self, items: dict):
+        if len(items) == 0:
+            return None
+        now = time.time()
+        rows = []
+        for key, item in items.items():
+            item['id'] = key
+            value = json.dumps(item, ensure_ascii=False)
+            rows.append((key, value, len(value.encode('utf-8')), now))
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany('INSERT OR REPLACE INTO translation (id, item, size, accessed) VALUES (?, ?, ?, ?)', rows)
+                self._evict()
+                self._conn.execute('COMMIT')
+            except Exception as e:
+                self._conn.execute('ROLLBACK')
+                raise e
+
+    def _evict(self):
+        if self.max_items is not None:
+            self._conn.execute(
+                'DELETE FROM translation WHERE id IN ('
+                'SELECT id FROM translation ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.max_items,))
+        if self.max_bytes is not None:
+            total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM translation').fetchone()[0]
+            if total <= self.max_bytes:
+                return None
+            evict = []
+            for key, size in self._conn.execute('SELECT id, size FROM translation ORDER BY accessed ASC'):
+                if total <= self.max_bytes:
+                    break
+                evict.append((key,))
+                total -= size
+            self._conn.executemany('DELETE FROM translation WHERE id=?', evict)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM translation').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_jsonl(jsonl_file: str, cache, batch_size: int=1000):
+    '''将旧的 translator.jsonl 导入新的缓存后端，重复行以最后一条为准'''
+    if not os.path.exists(jsonl_file):
+        return 0
+    items = {}
+    count = 0
+    for line in open(jsonl_file, encoding='utf-8'):
+        if len(line.strip()) == 0:
+            continue
+        item = json.loads(line)
+        items[item['id']] = item
+        if len(items) >= batch_size:
+            cache.put_many(items)
+            count += len(items)
+            items = {}
+    cache.put_many(items)
+    count += len(items)
+    return count
+
+
+def open_cache(cache_dir: str, backend: str='sqlite', **kwargs):
+    '''创建缓存后端，首次使用 sqlite 时自动导入旧的 jsonl 文件'''
+    jsonl_file = os.path.join(cache_dir, 'translator.jsonl')
+    if backend == 'jsonl':
+        return JsonlCache(jsonl_file)
+    if backend != 'sqlite':
+        raise Exception(f"Unknown translator cache backend: {backend}")
+    cache = SqliteCache(os.path.join(cache_dir, 'translator.sqlite'), **kwargs)
+    # 导入是幂等的，多个进程同时首次启动时重复导入也不会产生重复数据
+    if len(cache) == 0 and os.path.exists(jsonl_file):
+        count = migrate_jsonl(jsonl_file, cache)
+        METRICS.info(f"从 {jsonl_file} 导入 {count} 条翻译缓存")
+    return cache
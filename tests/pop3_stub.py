@@ -0,0 +1,62 @@
+'''测试用的本地 POP3 替身服务器: 邮件保存在内存中，记录收到的命令，支持 USER/PASS/STAT/UIDL/TOP/RETR/QUIT'''
+import threading
+import socketserver
+
+
+class Pop3Handler(socketserver.StreamRequestHandler):
+    def send(self, line: bytes):
+        self.wfile.write(line + b'\r\n')
+
+    def send_lines(self, lines: list):
+        for line in lines:
+            # 行首的点需要转义
+            self.send(b'.' + line if line.startswith(b'.') else line)
+        self.send(b'.')
+
+    def handle(self):
+        messages = self.server.messages
+        self.send(b'+OK stub ready')
+        for raw in self.rfile:
+            command = raw.decode('utf-8').strip().split()
+            if not command:
+                continue
+            name, args = command[0].upper(), command[1:]
+            self.server.commands.append(' '.join([name] + args))
+            if name in ('USER', 'PASS'):
+                self.send(b'+OK')
+            elif name == 'STAT':
+                self.send(f'+OK {len(messages)} {sum(len(m) for _, m in messages)}'.encode())
+            elif name == 'UIDL':
+                self.send(b'+OK')
+                self.send_lines([f'{i} {uid}'.encode() for i, (uid, _) in enumerate(messages, 1)])
+            elif name in ('TOP', 'RETR'):
+                lines = messages[int(args[0]) - 1][1].split(b'\n')
+                if name == 'TOP':
+                    lines = lines[:lines.index(b'')]
+                self.send(b'+OK')
+                self.send_lines(lines)
+            elif name == 'QUIT':
+                self.send(b'+OK bye')
+                return None
+            else:
+                self.send(b'-ERR unknown command')
+
+
+class Pop3Stub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, messages: list) -> None:
+        '''messages: [(uid, 以 \\n 分行的邮件内容)]，编号从 1 开始，越靠后越新'''
+        self.messages = messages
+        self.commands = []
+        super().__init__(('127.0.0.1', 0), Pop3Handler)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, name: str, which: int=None):
+        return sum(1 for command in self.commands
+                   if command.split()[0] == name and (which is None or command.split()[1] == str(which)))
@@ -0,0 +1,43 @@
+'''测试用的抓取器与翻译器替身: 不访问网络，记录收到的请求，可以在第 n 次请求时模拟中断'''
+import os
+import threading
+
+from abs_fetcher import AbsFetcher
+from translate import YoudaoTranslator
+
+DIGEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'digests')
+
+
+class StubFetcher(AbsFetcher):
+    '''替换版本返回合成的摘要与历史版本，fail_after 次抓取之后抛出 KeyboardInterrupt'''
+    def __init__(self, fail_after: int=None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.fail_after = fail_after
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+    def fetch(self, arxiv_id: str, url: str, version: str, parse_fn):
+        with self._calls_lock:
+            if self.fail_after is not None and len(self.calls) >= self.fail_after:
+                raise KeyboardInterrupt
+            self.calls.append(arxiv_id)
+        return dict(abstract=f'Revised abstract of {arxiv_id} on large language model.',
+                    history=f'[v1] Mon, 1 Jan 2024 00:00:00 UTC\n[v2] {version}')
+
+
+class StubTranslator(YoudaoTranslator):
+    '''译文为 "译文 <原文>"，fail_after 次请求之后抛出 KeyboardInterrupt(与 Ctrl-C 一样不会被当作翻译失败)'''
+    def __init__(self, cache_dir: str, fail_after: int=None) -> None:
+        super().__init__(api_key='stub', api_secret='stub', delta_t=0, cache_dir=cache_dir)
+        self.fail_after = fail_after
+        self.requests = 0
+        self.queries = []
+
+    def _request(self, url: str, playload: dict):
+        if self.fail_after is not None and self.requests >= self.fail_after:
+            raise KeyboardInterrupt
+        self.requests += 1
+        queries = playload['q'] if isinstance(playload['q'], list) else [playload['q']]
+        self.queries += queries
+        return dict(translation=[f'译文 {q}' for q in queries],
+                    translateResults=[dict(query=q, translation=f'译文 {q}') for q in queries])
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from abs_fetcher import AbsFetcher
+from arxiv_api import ArxivApiFetcher, RecordedFeedServer, parse_feed
+from paper_index import PaperIndex
+from paper_parser import PaperParser, parse_abs_page
+
+FEED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feeds')
+IDS = ['2407.00101', '2407.00102', '2407.00103']
+VERSION = '20240704152549'
+
+
+@pytest.fixture
+def server():
+    # 2407.00103 只出现在 abs 页面，API 中暂缺
+    server = RecordedFeedServer(FEED_DIR, hidden={'2407.00103'}).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_tasks(server, ids):
+    return [(arxiv_id, f'{server.url}/abs/{arxiv_id}', VERSION) for arxiv_id in ids]
+
+
+def api_fetcher(server, cache_dir, **kwargs):
+    return ArxivApiFetcher(api_url=f'{server.url}/api/query', interval=0, cache_dir=cache_dir, backoff=0, **kwargs)
+
+
+def test_parse_feed_skips_error_entries():
+    with open(os.path.join(FEED_DIR, 'errors.xml'), 'rb') as f:
+        assert parse_feed(f.read()) == {}
+    with open(os.path.join(FEED_DIR, '2407.xml'), 'rb') as f:
+        entries = parse_feed(f.read())
+    assert entries['2407.00101']['versions'] == 3
+    assert entries['2407.00101']['abstract'] == 'We survey retrieval methods for large language models. We group them by what is retrieved & when.'
+    assert entries['2407.00101']['history'] == '[v1] Mon, 1 Jul 2024 09:12:03 UTC\n[v3] Thu, 4 Jul 2024 15:25:49 UTC'
+
+
+def test_batch_hits_and_fallback(server, tmp_path):
+    fetcher = api_fetcher(server, str(tmp_path))
+    results = fetcher.fetch_all(make_tasks(server, IDS), parse_abs_page)
+    # 两篇由一次 API 请求得到，API 中缺失的一篇逐篇抓取 abs 页面
+    assert [p for p in server.paths if p.startswith('/api/')] == [server.paths[0]]
+    assert [p for p in server.paths if p.startswith('/abs/')] == ['/abs/2407.00103']
+    assert results['2407.00101']['source'] == 'api'
+    assert results['2407.00102']['source'] == 'api'
+    assert 'source' not in results['2407.00103']
+    assert '[v2] Thu, 4 Jul 2024 12:00:00 UTC' in results['2407.00103']['history']
+
+    # 第二次全部命中磁盘缓存
+    server.paths.clear()
+    assert fetcher.fetch_all(make_tasks(server, IDS), parse_abs_page) == results
+    assert server.paths == []
+    fetcher.close()
+
+
+def test_failed_batch_falls_back(server, tmp_path):
+    server.fail_requests = 1
+    fetcher = api_fetcher(server, str(tmp_path), retries=0)
+    results = fetcher.fetch_all(make_tasks(server, IDS), parse_abs_page)
+    assert sorted(p for p in server.paths if p.startswith('/abs/')) == [f'/abs/{i}' for i in IDS]
+    assert not any(isinstance(item, Exception) for item in results.values())
+    assert not any('source' in item for item in results.values())
+    fetcher.close()
+
+
+def test_api_results_do_not_satisfy_scraper(server, tmp_path):
+    cache_dir = str(tmp_path / 'abs')
+    tasks = make_tasks(server, IDS[:1])
+    api = api_fetcher(server, cache_dir)
+    assert api.fetch_all(tasks, parse_abs_page)['2407.00101']['source'] == 'api'
+    api.close()
+
+    # 关闭 API 后不复用 API 的缓存，重新抓取 abs 页面
+    server.paths.clear()
+    scraper = AbsFetcher(cache_dir=cache_dir, backoff=0)
+    item = scraper.fetch_all(tasks, parse_abs_page)['2407.00101']
+    assert server.paths == ['/abs/2407.00101']
+    assert 'source' not in item
+    scraper.close()
+
+    # 打开 API 时优先使用 abs 页面的缓存
+    server.paths.clear()
+    api = api_fetcher(server, cache_dir)
+    assert api.fetch_all(tasks, parse_abs_page)['2407.00101'] == item
+    assert server.paths == []
+    api.close()
+
+
+def test_index_api_versions_are_refetched(server, tmp_path):
+    index = PaperIndex(str(tmp_path / 'index.db'))
+    index.update_versions([dict(arxiv_id='2407.00101', version=VERSION, history='[v1] api', abstract='api', date='240705', source='api')])
+    paper = dict(arxiv_id='2407.00101', url=f'{server.url}/abs/2407.00101', version=VERSION,
+                 date='replaced with revised version Thu, 4 Jul 2024 15:25:49 GMT')
+
+    api = api_fetcher(server, None)
+    revised, tasks = PaperParser(fetcher=api, index=index).revised_tasks([paper])
+    assert revised['2407.00101']['source'] == 'api' and tasks == []
+    scraper = AbsFetcher(backoff=0)
+    revised, tasks = PaperParser(fetcher=scraper, index=index).revised_tasks([paper])
+    assert revised == {} and [t[0] for t in tasks] == ['2407.00101']
+
+    # 同一版本的 abs 页面结果替换 API 的结果
+    index.update_versions([dict(arxiv_id='2407.00101', version=VERSION, history='[v1] abs\n[v2] abs\n[v3] abs',
+                                abstract='abs', date='240706')])
+    entry = index.get('2407.00101')
+    assert (entry['source'], entry['history'], entry['dates']) == ('abs', '[v1] abs\n[v2] abs\n[v3] abs', ['240705', '240706'])
+    api.close()
+    scraper.close()
+    index.close()
@@ -0,0 +1,31 @@
+import os
+import shutil
+
+from paper_parser import PaperParser
+from stubs import DIGEST_DIR, StubFetcher, StubTranslator
+
+DATE = '240701'
+CATEGORY_WORDS = {'Survey': ['survey'], 'Benchmark': ['benchmark'], 'Agent': ['Agent']}
+
+
+def run(work_dir, async_pipeline: bool):
+    os.makedirs(work_dir)
+    txt_file = os.path.join(work_dir, f'paper_{DATE}.txt')
+    shutil.copy(os.path.join(DIGEST_DIR, f'paper_{DATE}.txt'), txt_file)
+    translator = StubTranslator(os.path.join(work_dir, 'cache'))
+    # 小的分块让记录分多块经过流水线
+    parser = PaperParser(translator=translator, category_words=CATEGORY_WORDS, fetcher=StubFetcher(),
+                         chunk_size=2, async_pipeline=async_pipeline, pipeline_options=dict(chunk_size=2))
+    parser.extra_paper(txt_file, os.path.join(work_dir, f'{DATE}.rst'), date=DATE)
+    translator.close()
+    with open(txt_file.replace('.txt', '.json'), 'rb') as f, open(os.path.join(work_dir, f'{DATE}.rst'), 'rb') as g:
+        return f.read(), g.read()
+
+
+def test_async_output_matches_sync(tmp_path):
+    sync_json, sync_rst = run(str(tmp_path / 'sync'), False)
+    async_json, async_rst = run(str(tmp_path / 'async'), True)
+    assert sync_json.count(b'\n') == 7
+    assert b'Revised abstract of 2401.07187' in sync_rst
+    assert async_json == sync_json
+    assert async_rst == sync_rst
@@ -0,0 +1,63 @@
+import os
+import shutil
+
+import pytest
+
+from paper_parser import PaperParser
+from stubs import DIGEST_DIR, StubFetcher, StubTranslator
+
+DATE = '240701'
+REVISED = ['2401.07187', '2312.01234', '2402.05555']
+
+
+@pytest.fixture
+def day(tmp_path):
+    txt_file = str(tmp_path / f'paper_{DATE}.txt')
+    shutil.copy(os.path.join(DIGEST_DIR, f'paper_{DATE}.txt'), txt_file)
+    return txt_file
+
+
+def run(tmp_path, txt_file, fetcher, translator):
+    # 每块 2 篇，抓取与翻译都分多次完成
+    parser = PaperParser(translator=translator, fetcher=fetcher, checkpoint_dir=str(tmp_path / 'checkpoint'), chunk_size=2)
+    try:
+        parser.extra_paper(txt_file, str(tmp_path / f'{DATE}.rst'), date=DATE)
+    finally:
+        translator.close()
+
+
+def journal_file(tmp_path):
+    return tmp_path / 'checkpoint' / f'paper_{DATE}.journal'
+
+
+def test_resume_after_translation_interrupted(tmp_path, day):
+    # 抓取全部完成，翻译第二块时中断
+    first = StubTranslator(str(tmp_path / 'cache1'), fail_after=1)
+    with pytest.raises(KeyboardInterrupt):
+        run(tmp_path, day, StubFetcher(), first)
+    assert journal_file(tmp_path).exists()
+    assert not (tmp_path / f'{DATE}.rst').exists()
+    assert len(first.queries) == 2
+
+    # 翻译缓存换成空目录，只有日志能让已完成的工作不再重做
+    fetcher = StubFetcher()
+    second = StubTranslator(str(tmp_path / 'cache2'))
+    run(tmp_path, day, fetcher, second)
+    assert fetcher.calls == []
+    assert second.queries and not set(second.queries) & set(first.queries)
+    assert not journal_file(tmp_path).exists()
+    assert (tmp_path / f'{DATE}.rst').exists()
+
+
+def test_resume_after_fetch_interrupted(tmp_path, day):
+    # 前两篇替换版本在同一块中抓取完成并写入日志，第三篇抓取时中断
+    first = StubFetcher(fail_after=2)
+    with pytest.raises(KeyboardInterrupt):
+        run(tmp_path, day, first, StubTranslator(str(tmp_path / 'cache1')))
+    assert sorted(first.calls) == sorted(REVISED[:2])
+    assert journal_file(tmp_path).exists()
+
+    fetcher = StubFetcher()
+    run(tmp_path, day, fetcher, StubTranslator(str(tmp_path / 'cache2')))
+    assert fetcher.calls == REVISED[2:]
+    assert not journal_file(tmp_path).exists()
@@ -0,0 +1,38 @@
+import io
+import os
+import re
+
+from digest_tokenizer import DigestTokenizer
+from paper_parser import PATTERN, PATTERN_revised
+from stubs import DIGEST_DIR
+
+DIGEST = os.path.join(DIGEST_DIR, 'paper_240701.txt')
+
+
+def regex_parse(text: str):
+    '''原有的解析方式: 按分隔线切分后逐段匹配 PATTERN/PATTERN_revised'''
+    papers = []
+    for content in re.split('---------------+', text):
+        result = PATTERN.match(content) or PATTERN_revised.match(content)
+        if result:
+            papers.append({k: v.strip() for k, v in result.groupdict().items()})
+    return papers
+
+
+def test_tokenizer_matches_regex():
+    with open(DIGEST, encoding='utf-8') as f:
+        text = f.read()
+    tokenizer = DigestTokenizer()
+    papers = list(tokenizer.tokenize(io.StringIO(text)))
+    assert papers == regex_parse(text)
+
+    urls = [paper['url'] for paper in papers]
+    # 交叉列出的新提交与替换版本都保留
+    assert 'https://arxiv.org/abs/2407.00020' in urls
+    assert 'https://arxiv.org/abs/2312.01234' in urls
+    assert sum(paper['date'].startswith('replaced with revised version') for paper in papers) == 3
+    # 缺少 Authors 行与缺少链接的记录被拒绝
+    assert 'https://arxiv.org/abs/2407.00104' not in urls
+    assert 'https://arxiv.org/abs/2406.99999' not in urls
+    rejected = '\n'.join(tokenizer.rejected_records)
+    assert '2407.00104' in rejected and '2406.99999' in rejected
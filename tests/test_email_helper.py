@@ -0,0 +1,92 @@
+import os
+import email.policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+
+import pytest
+
+from email_helper import EmailReader
+from pop3_stub import Pop3Stub
+
+# 超过一次解码的缓冲区(64KB)，并包含行首是点的行
+DIGEST = ''.join(f'.{i} Title: paper {i} on large language model\n' for i in range(3000))
+
+
+def make_message(subject: str, body: str='', attachment: tuple=None):
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg['From'] = 'arxiv@example.com'
+    msg['To'] = 'reader@example.com'
+    msg.set_content(body)
+    if attachment is not None:
+        name, text, cte = attachment
+        msg.add_attachment(text, filename=name, cte=cte)
+    return msg.as_bytes(policy=email.policy.SMTP).replace(b'\r\n', b'\n')
+
+
+def expected_attachments(raw: bytes):
+    msg = BytesParser().parsebytes(raw)
+    return {part.get_filename(): part.get_payload(decode=True) for part in msg.walk() if part.get_filename()}
+
+
+@pytest.fixture
+def mailbox():
+    messages = [
+        ('u1', make_message('paper_240630 digest', 'old', ('paper_240630.txt', DIGEST, 'base64'))),
+        ('u2', make_message('hello', 'not a digest')),
+        ('u3', make_message('paper_240702 digest', 'new', ('paper_240702.txt', DIGEST, 'base64'))),
+        ('u4', make_message('forwarded paper_ digest', 'received paper_240703 today',
+                            ('paper_240703.txt', DIGEST, 'quoted-printable'))),
+    ]
+    server = Pop3Stub(messages)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def read_mail(server, tmp_path, workers: int=1):
+    reader = EmailReader('user', 'code', ledger_file=str(tmp_path / 'uidl.txt'), pop_port=server.port, pop_host='127.0.0.1')
+    try:
+        return list(reader.parse_email_server(min_date='240701', part_dir=str(tmp_path), workers=workers))
+    finally:
+        reader.close()
+
+
+def test_scan_headers_and_stream_attachments(mailbox, tmp_path):
+    items = read_mail(mailbox, tmp_path)
+
+    # 从新到旧，遇到不晚于 min_date 的邮件后停止
+    assert [item['time'] for item in items] == ['240703', '240702']
+    # 非论文邮件与截止日期之前的邮件只读取了邮件头
+    assert mailbox.count('TOP', 2) == 1 and mailbox.count('RETR', 2) == 0
+    assert mailbox.count('TOP', 1) == 1 and mailbox.count('RETR', 1) == 0
+    # 主题中没有日期的邮件在扫描时下载一次，从正文解析日期
+    assert mailbox.count('RETR', 4) == 1 and mailbox.count('RETR', 3) == 1
+    for (uid, raw), item in zip(mailbox.messages[:1:-1], items):
+        expected = expected_attachments(raw)
+        assert [os.path.basename(path) for path in item['parts']] == list(expected)
+        for path in item['parts']:
+            with open(path, 'rb') as f:
+                assert f.read() == expected[os.path.basename(path)]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_ledger_skips_seen_messages(mailbox, tmp_path):
+    read_mail(mailbox, tmp_path)
+    mailbox.commands.clear()
+
+    assert read_mail(mailbox, tmp_path) == []
+    # 已经处理过的邮件不再读取邮件头或下载
+    for which in (2, 3, 4):
+        assert mailbox.count('TOP', which) == 0 and mailbox.count('RETR', which) == 0
+    with open(tmp_path / 'uidl.txt', encoding='utf-8') as f:
+        assert dict(line.rstrip('\n').split('\t') for line in f) == {'u2': 'skipped', 'u3': 'ingested', 'u4': 'ingested'}
+
+
+def test_parallel_sessions(mailbox, tmp_path):
+    items = read_mail(mailbox, tmp_path, workers=2)
+
+    assert [item['time'] for item in items] == ['240703', '240702']
+    assert mailbox.count('RETR', 3) == 1 and mailbox.count('RETR', 4) == 1
+    with open(tmp_path / 'paper_240702.txt', 'rb') as f:
+        assert f.read() == DIGEST.encode('utf-8')
@@ -18,7 +18,7 @@ fi
 
 cd ..
 
-git add docs datasets latest.date update.sh
+git add docs datasets latest.date build.manifest.json update.sh
 
 git_status=$(git status -s | grep "^[AM]")
 